@@ -13,7 +13,7 @@ from ntpath import join
 
 import os,glob
 
-possibleArguments = ['test', 'tutorials', 'wheel', 'html', 'upload', 'testVersion', 'version','update']
+possibleArguments = ['test', 'tutorials', 'wheel', 'html', 'upload', 'testVersion', 'version','update','calibration']
 
 parser = argparse.ArgumentParser(description="Make tool replacing linux Makefile.")
 parser.add_argument("task", nargs='?', default='help', type=str, help="Type of task to be performed. Possible tasks are: {}. Run without argument to see help menu.".format(', '.join(possibleArguments)))
@@ -40,6 +40,7 @@ def makeHTML():
     os.system("sphinx-build docs build")
 
 def makeWheel():
+    makeCalibration() # Ship the memory-mapped calibration store with the package
     os.system("python -m build --sdist")
 
 def getLatestBuild():
@@ -75,6 +76,10 @@ def upload():
 def update(version):
     os.system('python Update.py '+version)
 
+def makeCalibration():
+    print('Converting calibrationDict.dat into calibration store')
+    os.system('python -c "import DMCpy, pickle; from DMCpy import Calibration; Calibration.CalibrationStore.fromCalibrationDict(pickle.load(open(DMCpy.calibrationFile,\'rb\')))"')
+
 def makeTutorials():
     cleanTutorialFolders()
     generateTutorials()
@@ -117,6 +122,9 @@ elif args.task.lower() == 'testversion':
 elif args.task.lower() == 'html':
     makeHTML()
 
+elif args.task.lower() == 'calibration':
+    makeCalibration()
+
 elif args.task.lower() == 'version':
     if args.version is None:
         version = getCurrentVersion()
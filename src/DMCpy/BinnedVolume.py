@@ -0,0 +1,344 @@
+# SPDX-License-Identifier: MPL-2.0
+import copy
+import warnings
+import numpy as np
+
+
+class BinnedVolume(object):
+    """Histogrammed data on a regular grid keeping the additive sums of intensity, monitor, normalization and bin counts.
+
+    As all sums are additive, cuts, slices, projections, coarser rebinning and arithmetic between volumes
+    are performed directly on the grid without going back to the raw data.
+    """
+    def __init__(self,intensity,monitor,counts,edges,normalization=None,variance=None,rlu=False,sample=None):
+        """
+        Args:
+
+            - intensity (array): Summed intensity in each bin
+
+            - monitor (array): Summed monitor in each bin
+
+            - counts (array): Number of pixels contributing to each bin
+
+            - edges (list): List of 1D bin edges, one for each dimension
+
+        Kwargs:
+
+            - normalization (array): Summed normalization in each bin (default None)
+
+            - variance (array): Summed variance of intensity in each bin (default None - intensity, i.e. Poisson statistics)
+
+            - rlu (bool): If True, positions are in the rotated frame of the sample projection vectors (default False)
+
+            - sample (Sample): Sample used to convert HKL into the coordinate system of the volume (default None)
+
+        """
+        self.intensity = np.asarray(intensity)
+        self.monitor = np.asarray(monitor)
+        self.counts = np.asarray(counts)
+        self.edges = [np.asarray(e,dtype=float) for e in edges]
+        self.normalization = None if normalization is None else np.asarray(normalization)
+        self.variance = np.array(self.intensity,dtype=float) if variance is None else np.asarray(variance)
+        self.rlu = rlu
+        self.sample = sample
+
+        shape = tuple(len(e)-1 for e in self.edges)
+        for name in ['intensity','monitor','counts','variance','normalization']:
+            value = getattr(self,name)
+            if not value is None and value.shape != shape:
+                raise AttributeError('Shape of {} {} does not match bin edges {}'.format(name,value.shape,shape))
+
+    @property
+    def ndim(self):
+        return len(self.edges)
+
+    @property
+    def shape(self):
+        return self.intensity.shape
+
+    @property
+    def centres(self):
+        """Bin centres along each dimension"""
+        return [0.5*(e[:-1]+e[1:]) for e in self.edges]
+
+    @property
+    def bins(self):
+        """Bin edges in the same format as returned by DataSet.binData3D"""
+        return np.meshgrid(*self.edges,indexing='ij')
+
+    @property
+    def data(self):
+        """Normalized intensity, NaN in empty bins"""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            data = np.divide(self.intensity,self.monitor)
+        data[self.counts==0] = np.nan
+        return data
+
+    @property
+    def errors(self):
+        """Error of normalized intensity, NaN in empty bins"""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            errors = np.divide(np.sqrt(self.variance),self.monitor)
+        errors[self.counts==0] = np.nan
+        return errors
+
+    def _sums(self):
+        """Names of all additive sums present"""
+        names = ['intensity','monitor','counts','variance']
+        if not self.normalization is None:
+            names.append('normalization')
+        return names
+
+    def _new(self,edges,**sums):
+        return BinnedVolume(edges=edges,rlu=self.rlu,sample=self.sample,
+                            normalization=sums.get('normalization'),**{k:v for k,v in sums.items() if k != 'normalization'})
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def _checkAxis(self,axis):
+        if axis < 0:
+            axis += self.ndim
+        if axis < 0 or axis >= self.ndim:
+            raise AttributeError('Axis {} out of range for volume with {} dimensions'.format(axis,self.ndim))
+        return axis
+
+    def project(self,axis,start=None,stop=None):
+        """Sum all bins along axis with centres between start and stop.
+
+        Args:
+
+            - axis (int): Axis along which the volume is summed
+
+        Kwargs:
+
+            - start (float): Lower limit of bin centres included (default None - from first bin)
+
+            - stop (float): Upper limit of bin centres included (default None - to last bin)
+
+        Returns:
+
+            - BinnedVolume with one dimension less
+
+        """
+        axis = self._checkAxis(axis)
+        centres = self.centres[axis]
+        inside = np.ones(len(centres),dtype=bool)
+        if not start is None:
+            inside = np.logical_and(inside,centres>=start)
+        if not stop is None:
+            inside = np.logical_and(inside,centres<=stop)
+        if not np.any(inside):
+            raise AttributeError('No bins along axis {} between {} and {}'.format(axis,start,stop))
+
+        sums = {name:np.take(getattr(self,name),np.flatnonzero(inside),axis=axis).sum(axis=axis) for name in self._sums()}
+        edges = [e for I,e in enumerate(self.edges) if I != axis]
+        return self._new(edges,**sums)
+
+    def slice(self,axis,value):
+        """Return the single layer of bins containing value along axis.
+
+        Args:
+
+            - axis (int): Axis perpendicular to the slice
+
+            - value (float): Position along axis
+
+        Returns:
+
+            - BinnedVolume with one dimension less
+
+        """
+        axis = self._checkAxis(axis)
+        edges = self.edges[axis]
+        if value < edges[0] or value > edges[-1]:
+            raise AttributeError('Value {} outside of bins along axis {} ({} to {})'.format(value,axis,edges[0],edges[-1]))
+        index = np.clip(np.searchsorted(edges,value,side='right')-1,0,len(edges)-2)
+        sums = {name:np.take(getattr(self,name),index,axis=axis) for name in self._sums()}
+        return self._new([e for I,e in enumerate(self.edges) if I != axis],**sums)
+
+    def rebin(self,factors,pad=False):
+        """Rebin to a coarser grid by summing blocks of bins.
+
+        Args:
+
+            - factors (int or list): Number of bins combined along each dimension
+
+        Kwargs:
+
+            - pad (bool): If True, incomplete blocks at the upper edge are filled with empty bins, otherwise they are discarded (default False)
+
+        Returns:
+
+            - BinnedVolume on the coarser grid
+
+        """
+        factors = np.broadcast_to(np.asarray(factors,dtype=int),(self.ndim,))
+        if np.any(factors<1):
+            raise AttributeError('Rebinning factors must be positive integers. Got {}'.format(factors))
+        shape = np.array(self.shape)
+        if pad:
+            newShape = -(-shape//factors)
+        else:
+            newShape = shape//factors
+        if np.any(newShape==0):
+            raise AttributeError('Rebinning factors {} are larger than volume shape {}'.format(factors,self.shape))
+
+        blockShape = np.array([[n,f] for n,f in zip(newShape,factors)]).flatten()
+        sumAxes = tuple(range(1,2*self.ndim,2))
+
+        if pad:
+            padding = [(0,n*f-s) for n,f,s in zip(newShape,factors,shape)]
+            sums = {name:np.pad(getattr(self,name),padding).reshape(blockShape).sum(axis=sumAxes) for name in self._sums()}
+            edges = []
+            for e,(_,extra),f in zip(self.edges,padding,factors): # Empty bins continue the last bin width
+                e = np.concatenate([e,e[-1]+(e[-1]-e[-2])*np.arange(1,extra+1)])
+                edges.append(e[::f])
+        else:
+            trim = tuple(slice(0,n*f) for n,f in zip(newShape,factors))
+            sums = {name:getattr(self,name)[trim].reshape(blockShape).sum(axis=sumAxes) for name in self._sums()}
+            edges = [e[:n*f+1:f] for e,n,f in zip(self.edges,newShape,factors)]
+        return self._new(edges,**sums)
+
+    def pyramid(self,axes=None,minimumBins=8):
+        """Multi-resolution pyramid of the volume. Each level combines blocks of 2 bins of the previous level along axes.
+
+        As all sums are additive, every level is exactly the volume binned with 2**level times coarser bins.
+
+        Kwargs:
+
+            - axes (list): Axes along which bins are combined (default None - all axes)
+
+            - minimumBins (int): Levels are added until no axis has more than minimumBins bins (default 8)
+
+        Returns:
+
+            - levels (list): List of BinnedVolume starting with the volume itself at level 0
+
+        """
+        if axes is None:
+            axes = range(self.ndim)
+        axes = [self._checkAxis(axis) for axis in axes]
+        factors = np.ones(self.ndim,dtype=int)
+        factors[axes] = 2
+
+        levels = [self]
+        while np.max(np.array(levels[-1].shape)[axes])>minimumBins:
+            levels.append(levels[-1].rebin(factors,pad=True))
+        return levels
+
+    def _toVolumeFrame(self,point,rlu):
+        point = np.asarray(point,dtype=float)
+        if not rlu:
+            return point
+        if self.sample is None or self.ndim != 3:
+            raise AttributeError('Conversion from HKL requires a 3D volume with a sample.')
+        Q = np.dot(self.sample.UB,point)
+        if self.rlu:
+            Q = np.dot(self.sample.ROT,Q)
+        return Q
+
+    def _fromVolumeFrame(self,points,rlu):
+        if not rlu:
+            return points
+        if self.rlu:
+            points = np.einsum('ji,j...->i...',self.sample.ROT,points)
+        return np.einsum('ij,j...->i...',self.sample.UBInv,points)
+
+    def cut1D(self,P1,P2,stepSize=0.01,width=0.05,rlu=False):
+        """Approximate 1D cut from P1 to P2 using the bin centres within a cylinder of the given width.
+
+        Args:
+
+            - P1 (list): Start position of cut in the coordinates of the volume or in HKL
+
+            - P2 (list): End position of cut in the coordinates of the volume or in HKL
+
+        Kwargs:
+
+            - stepSize (float): Size of bins along cut direction (default 0.01)
+
+            - width (float): Integration width orthogonal to cut (default 0.05)
+
+            - rlu (bool): If True, P1 and P2 are in HKL and the returned positions as well (default False)
+
+        Returns:
+
+            - Pos,Int,Errors
+
+        """
+        QStart = self._toVolumeFrame(P1,rlu)
+        QStop = self._toVolumeFrame(P2,rlu)
+        if len(QStart) != self.ndim or len(QStop) != self.ndim:
+            raise AttributeError('Cut points must have {} coordinates.'.format(self.ndim))
+
+        directionVector = QStop-QStart
+        length = np.linalg.norm(directionVector)
+        if np.isclose(length,0.0):
+            raise AttributeError('The vector connecting the cut points has length 0. Received P1={}, P2={}'.format(','.join([str(x) for x in P1]),','.join([str(x) for x in P2])))
+        directionVector*=1.0/length
+
+        relativePosition = np.array(np.meshgrid(*self.centres,indexing='ij')).reshape(self.ndim,-1)-QStart.reshape(-1,1)
+        along = np.dot(directionVector,relativePosition)
+        orthogonal = np.linalg.norm(relativePosition-along*directionVector.reshape(-1,1),axis=0)
+
+        bins = np.arange(-stepSize*0.5,length+stepSize*0.51,stepSize)
+        inside = np.logical_and(orthogonal<width*0.5,np.logical_and(along>=bins[0],along<=bins[-1]))
+
+        sums = {name:np.histogram(along[inside],bins=bins,weights=getattr(self,name).flatten()[inside])[0] for name in ['intensity','monitor','counts','variance']}
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            I = np.divide(sums['intensity'],sums['monitor'])
+            errors = np.divide(np.sqrt(sums['variance']),sums['monitor'])
+        I[sums['counts']==0] = np.nan
+        errors[sums['counts']==0] = np.nan
+
+        binCentres = 0.5*(bins[:-1]+bins[1:])
+        positionVector = directionVector.reshape(-1,1)*binCentres+QStart.reshape(-1,1)
+        positionVector = self._fromVolumeFrame(positionVector,rlu)
+        return positionVector,I,errors
+
+    def _checkCompatible(self,other):
+        if not isinstance(other,BinnedVolume):
+            raise AttributeError('Expected BinnedVolume, got {}'.format(type(other)))
+        if self.ndim != other.ndim or not np.all([len(e1)==len(e2) and np.allclose(e1,e2) for e1,e2 in zip(self.edges,other.edges)]):
+            raise AttributeError('Volumes are not binned on the same grid.')
+
+    def __add__(self,other):
+        """Combine two volumes on the same grid, e.g. data from two data sets"""
+        self._checkCompatible(other)
+        sums = {name:getattr(self,name)+getattr(other,name) for name in ['intensity','monitor','counts','variance']}
+        if not self.normalization is None and not other.normalization is None:
+            sums['normalization'] = self.normalization+other.normalization
+        return self._new(self.edges,**sums)
+
+    def __sub__(self,other):
+        """Subtract normalized intensity of other, e.g. a background, keeping monitor and counts of self"""
+        self._checkCompatible(other)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            scale = np.divide(self.monitor,other.monitor)
+        scale[np.logical_not(np.isfinite(scale))] = 0.0
+        sums = {'intensity':self.intensity-other.intensity*scale,
+                'monitor':self.monitor.copy(),
+                'counts':self.counts.copy(),
+                'variance':self.variance+other.variance*scale**2}
+        if not self.normalization is None:
+            sums['normalization'] = self.normalization.copy()
+        return self._new(self.edges,**sums)
+
+    def __mul__(self,factor):
+        """Scale intensity by a scalar"""
+        if isinstance(factor,BinnedVolume):
+            raise AttributeError('Multiplication is only supported with scalars.')
+        sums = {name:getattr(self,name).copy() for name in self._sums()}
+        sums['intensity'] = self.intensity*factor
+        sums['variance'] = self.variance*factor**2
+        return self._new(self.edges,**sums)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self,factor):
+        return self.__mul__(1.0/factor)
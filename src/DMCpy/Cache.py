@@ -0,0 +1,261 @@
+# SPDX-License-Identifier: MPL-2.0
+import collections
+import copy
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import numpy as np
+
+# Settings of the on-disk result cache. The cache is opt-in and disabled by default.
+settings = {'enabled':False,
+            'directory':os.environ.get('DMCPY_CACHE',os.path.join(os.path.expanduser('~'),'.cache','DMCpy')),
+            'maxSize':2*1024**3,
+            'memory':False}
+
+# Results kept in memory when enabled with memory=True, least recently used first
+_memory = collections.OrderedDict()
+_memoryLock = threading.Lock()
+_missing = object() # Returned on a miss, as None is a valid result
+
+# Attributes of DataFile and Sample entering the cache key. The detector geometry and the q vectors of the
+# pixels in the detector frame (q_temp) are included as they can be changed after loading.
+dataFileAttributes = ['fileType','hasBackground','backgroundType','normalizationFile','normalization','monitor','mask','_counts','_background',
+                      'A3','twoTheta','twoThetaPosition','Ki','wavelength','twoThetaOffset','sampleOffsetZ','dtype',
+                      'radius','verticalPosition','pixelPosition','alpha','q_temp']
+sampleAttributes = ['unitCell','UB','ROT','projectionVectors']
+
+
+def enable(directory=None,maxSize=None,memory=False):
+    """Enable caching of reduction results on disk.
+
+    Kwargs:
+
+        - directory (str): Folder in which results are stored (default ~/.cache/DMCpy or $DMCPY_CACHE)
+
+        - maxSize (int): Maximal total size of the cache in bytes. Least recently used results are evicted (default 2 GB)
+
+        - memory (bool): If True, results are kept in memory for the running session instead of on disk, e.g. to reuse results between threads of a GUI (default False)
+
+    """
+    if not directory is None:
+        settings['directory'] = directory
+    if not maxSize is None:
+        settings['maxSize'] = int(maxSize)
+    settings['memory'] = memory
+    if not memory:
+        os.makedirs(settings['directory'],exist_ok=True)
+    settings['enabled'] = True
+
+
+def disable():
+    """Disable caching of reduction results. Stored results are kept on disk."""
+    settings['enabled'] = False
+
+
+def clear(memoryOnly=False):
+    """Remove all stored results from the cache directory and memory.
+
+    Kwargs:
+
+        - memoryOnly (bool): If True, only results kept in memory are removed and files on disk are kept (default False)
+
+    """
+    if not memoryOnly:
+        for path,_,_ in _cacheFiles():
+            os.remove(path)
+    with _memoryLock:
+        _memory.clear()
+
+
+def _cacheFiles():
+    """Return list of (path,size,last access) of all stored results"""
+    files = []
+    directory = settings['directory']
+    if not os.path.isdir(directory):
+        return files
+    for root,_,fileNames in os.walk(directory):
+        for fileName in fileNames:
+            if not fileName.endswith('.pkl'):
+                continue
+            path = os.path.join(root,fileName)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError: # pragma: no cover
+                continue
+            files.append((path,stat.st_size,stat.st_mtime))
+    return files
+
+
+def evict(maxSize=None):
+    """Delete least recently used results until the total size of the cache is below maxSize.
+
+    Kwargs:
+
+        - maxSize (int): Size in bytes to be reached (default settings['maxSize'])
+
+    """
+    if maxSize is None:
+        maxSize = settings['maxSize']
+    files = sorted(_cacheFiles(),key=lambda x:x[2])
+    totalSize = np.sum([size for _,size,_ in files])
+    for path,size,_ in files:
+        if totalSize <= maxSize:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError: # pragma: no cover
+            pass
+        totalSize-=size
+
+
+def _sizeOf(value):
+    """Approximate size in bytes of the arrays held by value"""
+    if isinstance(value,np.ndarray):
+        return value.nbytes
+    elif isinstance(value,(list,tuple)):
+        return np.sum([_sizeOf(v) for v in value],dtype=int)
+    elif isinstance(value,dict):
+        return np.sum([_sizeOf(v) for v in value.values()],dtype=int)
+    elif hasattr(value,'__dict__'):
+        return _sizeOf(value.__dict__)
+    return 0
+
+
+def _fromMemory(key):
+    """Return copy of result stored in memory under key or _missing"""
+    with _memoryLock:
+        if not key in _memory:
+            return _missing
+        _memory.move_to_end(key) # Mark as recently used
+        result,_ = _memory[key]
+    return copy.deepcopy(result)
+
+
+def _toMemory(key,result):
+    """Store a copy of result in memory and evict least recently used results above settings['maxSize']"""
+    result = copy.deepcopy(result)
+    size = _sizeOf(result)
+    with _memoryLock:
+        _memory[key] = (result,size)
+        totalSize = np.sum([s for _,s in _memory.values()],dtype=int)
+        while totalSize > settings['maxSize'] and len(_memory)>1:
+            _,(_,s) = _memory.popitem(last=False)
+            totalSize-=s
+
+
+def _update(h,value):
+    """Add value to hash h in a type-aware manner"""
+    if isinstance(value,np.ndarray):
+        h.update('array{}{}'.format(value.dtype.str,value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value,(list,tuple)):
+        h.update('{}{}'.format(type(value).__name__,len(value)).encode())
+        for v in value:
+            _update(h,v)
+    elif isinstance(value,dict):
+        h.update('dict{}'.format(len(value)).encode())
+        for k in sorted(value,key=str):
+            _update(h,k)
+            _update(h,value[k])
+    elif hasattr(value,'dataFiles'): # DataSet
+        h.update(b'DataSet')
+        for df in value:
+            _update(h,df)
+    elif hasattr(value,'countShape'): # DataFile
+        dataFileState(h,value)
+    elif hasattr(value,'unitCell'): # Sample
+        sampleState(h,value)
+    elif hasattr(value,'pixelMask'): # compactMask
+        h.update(b'compactMask')
+        for v in [value.shape,value.pixelMask,value.frameMask,value.exceptionIndex,value.exceptionValue]:
+            _update(h,v)
+    else:
+        h.update('{}{}'.format(type(value).__name__,repr(value)).encode())
+
+
+def dataFileState(h,df):
+    """Add identity of the underlying file and all state of df used in the reductions to hash h"""
+    path = os.path.abspath(os.path.join(df.folder,df.fileName))
+    try:
+        stat = os.stat(path)
+        identity = (path,stat.st_mtime_ns,stat.st_size)
+    except FileNotFoundError:
+        identity = (path,None,None)
+    _update(h,identity)
+    for attribute in dataFileAttributes:
+        _update(h,getattr(df,attribute,None))
+    if hasattr(df,'sample'):
+        sampleState(h,df.sample)
+
+
+def sampleState(h,sample):
+    """Add orientation and cell of sample to hash h"""
+    h.update(b'Sample')
+    for attribute in sampleAttributes:
+        _update(h,getattr(sample,attribute,None))
+
+
+def calculateKey(name,bound,ignore=()):
+    """Calculate cache key of a call from its name and bound arguments"""
+    h = hashlib.sha1()
+    h.update(name.encode())
+    for key,value in bound.arguments.items():
+        if key in ignore:
+            continue
+        _update(h,key)
+        _update(h,value)
+    return h.hexdigest()
+
+
+def cached(ignore=()):
+    """Decorator storing the return value of a reduction method in the on-disk cache when enabled.
+
+    Kwargs:
+
+        - ignore (list): Arguments not influencing the result, e.g. chunk sizes (default empty)
+
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def newFunc(*args,**kwargs):
+            if not settings['enabled']:
+                return func(*args,**kwargs)
+
+            bound = signature.bind(*args,**kwargs)
+            bound.apply_defaults()
+            key = calculateKey(func.__qualname__,bound,ignore=ignore)
+
+            if settings['memory']:
+                result = _fromMemory(key)
+                if result is _missing:
+                    result = func(*args,**kwargs)
+                    _toMemory(key,result)
+                return result
+
+            path = os.path.join(settings['directory'],key[:2],key+'.pkl')
+
+            if os.path.exists(path):
+                try:
+                    with open(path,'rb') as f:
+                        result = pickle.load(f)
+                    os.utime(path) # Mark as recently used
+                    return result
+                except (EOFError,pickle.UnpicklingError): # Corrupted entry, recalculate
+                    pass
+
+            result = func(*args,**kwargs)
+
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+            tempPath = path+'.{}.tmp'.format(os.getpid())
+            with open(tempPath,'wb') as f:
+                pickle.dump(result,f,protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tempPath,path)
+            evict()
+            return result
+        return newFunc
+    return decorator
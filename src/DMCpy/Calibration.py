@@ -0,0 +1,199 @@
+# SPDX-License-Identifier: MPL-2.0
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+
+# Standard location of the calibration store within the installation
+storeFolder = os.path.join(os.path.dirname(__file__),'calibration')
+# Location of the store converted on first use when the installation only holds calibrationDict.dat. Kept apart
+# from the result cache (Cache.settings['directory']) such that clearing the cache does not remove it.
+userStoreFolder = os.environ.get('DMCPY_CALIBRATION',os.path.join(os.path.expanduser('~'),'.local','share','DMCpy','calibration'))
+indexFileName = 'index.json'
+sourceFileName = 'source.json'
+
+
+# Calibrations of a single year. Limits and names are read from the index of the year, while
+# the calibration arrays are only memory-mapped when accessed. Usage:
+# Limits of file numbers: yearCalib['limits']
+# Names of calibrations: yearCalib['names']
+# Calibration array: yearCalib[name]
+class calibrationYear(object):
+    def __init__(self,store,year):
+        self.store = store
+        self.year = year
+        with open(os.path.join(store.yearFolder(year),indexFileName)) as f:
+            index = json.load(f)
+        self.limits = np.asarray(index['limits'])
+        self.names = list(index['names'])
+
+    def __getitem__(self,key):
+        if key == 'limits':
+            return self.limits
+        elif key == 'names':
+            return self.names
+        elif key in self.names:
+            return self.store.load(self.year,key)
+        raise KeyError('Calibration "{}" not found for year {}'.format(key,self.year))
+
+    def __contains__(self,key):
+        return key in ['limits','names'] or key in self.names
+
+    def keys(self):
+        return ['limits','names']+self.names
+
+
+class CalibrationStore(object):
+    """Detector calibrations stored as one .npy file per calibration in a folder per year.
+
+    Each year folder holds an index.json with the file number limits and names of its calibrations. Years are
+    only read when used and calibration arrays are memory-mapped read-only, such that all data files using the
+    same calibration share a single array. The store behaves as the dictionary year->{'limits','names',name:array}
+    previously pickled in calibrationDict.dat.
+    """
+    def __init__(self,directory=None):
+        """
+        Kwargs:
+
+            - directory (str): Folder of the store (default Calibration.storeFolder)
+
+        """
+        self.directory = storeFolder if directory is None else directory
+        self._years = {}
+        self._arrays = {}
+
+    def yearFolder(self,year):
+        return os.path.join(self.directory,str(year))
+
+    def keys(self):
+        """Years covered by the store"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted([int(name) for name in os.listdir(self.directory)
+                       if name.isdigit() and os.path.exists(os.path.join(self.directory,name,indexFileName))])
+
+    def __contains__(self,year):
+        return int(year) in self._years or os.path.exists(os.path.join(self.yearFolder(year),indexFileName))
+
+    def __getitem__(self,year):
+        year = int(year)
+        if not year in self._years:
+            if not year in self:
+                raise KeyError('No calibrations for year {} in {}'.format(year,self.directory))
+            self._years[year] = calibrationYear(self,year)
+        return self._years[year]
+
+    def load(self,year,name):
+        """Return the read-only memory-mapped calibration array of name in year"""
+        key = (int(year),name)
+        if not key in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.yearFolder(year),name+'.npy'),mmap_mode='r')
+        return self._arrays[key]
+
+    def add(self,year,name,calibration,limit):
+        """Add a calibration to the store, valid for files of year with file numbers from limit.
+
+        Args:
+
+            - year (int): Year of data files using the calibration
+
+            - name (str): Name of the calibration, e.g. file name of the vanadium measurement
+
+            - calibration (array): Detector efficiency of shape (128,1152)
+
+            - limit (int): First file number using the calibration
+
+        """
+        year = int(year)
+        folder = self.yearFolder(year)
+        os.makedirs(folder,exist_ok=True)
+        indexFile = os.path.join(folder,indexFileName)
+        if os.path.exists(indexFile):
+            with open(indexFile) as f:
+                index = json.load(f)
+        else:
+            index = {'limits':[],'names':[]}
+
+        entries = {n:l for l,n in zip(index['limits'],index['names'])}
+        entries[name] = int(limit)
+        names = sorted(entries,key=lambda n:entries[n])
+        index = {'limits':[entries[n] for n in names],'names':names}
+
+        np.save(os.path.join(folder,name+'.npy'),np.asarray(calibration,dtype=float))
+        tempFile = indexFile+'.{}.tmp'.format(os.getpid())
+        with open(tempFile,'w') as f:
+            json.dump(index,f,indent=2)
+        os.replace(tempFile,indexFile)
+
+        self._years.pop(year,None)
+        self._arrays.pop((year,name),None)
+
+    @classmethod
+    def fromCalibrationDict(cls,calibrationDict,directory=None):
+        """Create store from the dictionary year->{'limits','names',name:array} as in calibrationDict.dat
+
+        Args:
+
+            - calibrationDict (dict): Calibrations to be stored
+
+        Kwargs:
+
+            - directory (str): Folder of the store (default Calibration.storeFolder)
+
+        """
+        store = cls(directory=directory)
+        for year,yearCalib in calibrationDict.items():
+            for limit,name in zip(yearCalib['limits'],yearCalib['names']):
+                store.add(year,name,yearCalib[name],limit)
+        return store
+
+
+def convertedStore(calibrationFile,directory=None):
+    """Return store converted from the pickled calibrationFile, converting it only if not done before.
+
+    The conversion is written to a temporary folder next to directory and moved into place when complete, such that
+    processes loading concurrently never see a partial store. The store is converted again if calibrationFile changes.
+
+    Args:
+
+        - calibrationFile (str): Path to calibrationDict.dat
+
+    Kwargs:
+
+        - directory (str): Folder of the converted store (default Calibration.userStoreFolder, i.e. ~/.local/share/DMCpy/calibration or $DMCPY_CALIBRATION)
+
+    Returns:
+
+        - store (CalibrationStore): Store holding the calibrations of calibrationFile
+
+    """
+    if directory is None:
+        directory = userStoreFolder
+    stat = os.stat(calibrationFile)
+    source = {'file':os.path.abspath(calibrationFile),'size':stat.st_size,'mtime':stat.st_mtime_ns}
+
+    sourceFile = os.path.join(directory,sourceFileName)
+    if os.path.exists(sourceFile):
+        with open(sourceFile) as f:
+            if json.load(f) == source:
+                return CalibrationStore(directory=directory)
+        shutil.rmtree(directory,ignore_errors=True) # Outdated conversion
+
+    print('Converting {} into calibration store in {}'.format(calibrationFile,directory))
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent,exist_ok=True)
+    tempFolder = tempfile.mkdtemp(prefix='.calibration',dir=parent)
+    try:
+        with open(calibrationFile,'rb') as f:
+            CalibrationStore.fromCalibrationDict(pickle.load(f),directory=tempFolder)
+        with open(os.path.join(tempFolder,sourceFileName),'w') as f:
+            json.dump(source,f)
+        try:
+            os.rename(tempFolder,directory)
+        except OSError: # Converted by another process in the meantime
+            pass
+    finally:
+        shutil.rmtree(tempFolder,ignore_errors=True)
+    return CalibrationStore(directory=directory)
@@ -1,12 +1,15 @@
 # SPDX-License-Identifier: MPL-2.0
 #import sys
-from DMCpy import DataFile, _tools, DataSet
+from DMCpy import DataFile, _tools, DataSet, Cache
 #import json
 #import os
+import queue
+import threading
+import traceback
 import numpy as np
 import matplotlib.pyplot as plt
 import tkinter as tk
-from tkinter import filedialog
+from tkinter import filedialog, ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 
@@ -18,6 +21,23 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 #    pass
 
 
+class JobCancelled(Exception):
+    """Raised in the worker thread when the running job is cancelled"""
+
+
+# Styling of the 1D cuts
+cut1DStyle = {
+        'marker' : 'o',
+        'color' : 'green',
+        'markersize' : 8,
+        'mew' : 1.5,
+        'linewidth' : 1.5,
+        'capsize' : 3,
+        'linestyle' : (0, (1, 1)),
+        'mfc' : 'white',
+        }
+
+
 class MyGUI:
     def __init__(self, master):       
          # Initialize GUI and create input variables
@@ -176,6 +196,90 @@ class MyGUI:
         
         # Variables for the Adv. Functions
 
+        # Long reductions run in a worker thread reporting to the GUI through a queue, which is polled by the Tk event loop
+        self.job_queue = queue.Queue()
+        self.worker = None
+        self.job_name = None
+        self.cancel_event = threading.Event()
+        self.status_var = tk.StringVar(value='Ready')
+
+        tk.Label(master, textvariable=self.status_var, anchor='w').grid(row=14, column=0, columnspan=5, sticky='we')
+        self.progressbar = ttk.Progressbar(master, mode='determinate', maximum=1.0)
+        self.progressbar.grid(row=14, column=5, columnspan=2, sticky='we')
+        tk.Button(master, text="Cancel", command=self.cancel_job).grid(row=14, column=7)
+
+        # Results are kept in memory, such that e.g. plotting after exporting the same cut does not bin the data again
+        Cache.enable(memory=True)
+        self.master.after(100, self.poll_jobs)
+
+    def busy(self):
+        # True while a job runs in the worker thread. Checked before changing the shared data set, e.g. its orientation.
+        if self.worker is not None and self.worker.is_alive():
+            print('Busy with {}. Wait for it to finish or cancel it.'.format(self.job_name))
+            return True
+        return False
+
+    def run_in_background(self, name, job, on_done=None):
+        # Run job(progress) in the worker thread and call on_done(result) in the GUI thread when finished.
+        # progress(done, total) updates the progress bar and stops the job if cancelled.
+        if self.busy():
+            return
+        self.job_name = name
+        self.cancel_event.clear()
+        self.status_var.set('{}...'.format(name))
+        self.progressbar['value'] = 0
+        self.worker = threading.Thread(target=self.run_job, args=(name, job, on_done), daemon=True)
+        self.worker.start()
+
+    def run_job(self, name, job, on_done):
+        # Executed in the worker thread, only communicating through the queue
+        def progress(done, total):
+            if self.cancel_event.is_set():
+                raise JobCancelled()
+            self.job_queue.put(('progress', name, (done, total), None))
+
+        try:
+            with _tools.reportProgress(progress):
+                result = job(progress)
+        except JobCancelled:
+            self.job_queue.put(('cancelled', name, None, None))
+        except Exception as e:
+            traceback.print_exc()
+            self.job_queue.put(('error', name, e, None))
+        else:
+            self.job_queue.put(('done', name, result, on_done))
+
+    def poll_jobs(self):
+        # Rescheduled first, as on_done may block in plt.show
+        self.master.after(100, self.poll_jobs)
+        try:
+            while True:
+                kind, name, value, on_done = self.job_queue.get_nowait()
+                if kind == 'progress':
+                    done, total = value
+                    self.progressbar['value'] = done/total if total else 0
+                    self.status_var.set('{}: {} of {}'.format(name, done, total))
+                elif kind == 'done':
+                    self.progressbar['value'] = 1.0
+                    self.status_var.set('{} finished'.format(name))
+                    if on_done is not None:
+                        on_done(value)
+                elif kind == 'cancelled':
+                    self.progressbar['value'] = 0
+                    self.status_var.set('{} cancelled'.format(name))
+                    print('{} cancelled\n'.format(name))
+                else:
+                    self.progressbar['value'] = 0
+                    self.status_var.set('{} failed: {}'.format(name, value))
+        except queue.Empty:
+            pass
+
+    def cancel_job(self):
+        # The job stops before treating its next chunk of data
+        if self.worker is not None and self.worker.is_alive():
+            self.cancel_event.set()
+            self.status_var.set('Cancelling {}...'.format(self.job_name))
+
     def Export_3D_data(self):
         # Create a new window for settings
         self.settings_window = tk.Toplevel(self.master)
@@ -203,22 +307,30 @@ class MyGUI:
                    command=self.apply_settings).grid(row=3, column=2)
 
     def Data3D_Export(self):
+        if self.busy():
+            return
 
         print('Exporting the 3D Data')
 
         self.intialize_transformation()
 
-        print('Binning the data... Plase be patient! (:\n')
-    
-        intensities,bins,errors = self.ds.binData3D(dqx=self.Binsize3Dx.get(),
-                                                    dqy=self.Binsize3Dy.get(),
-                                                    dqz=self.Binsize3Dz.get(),
-                                                    rlu=self.hkl.get())
+        print('Binning the data in the background\n')
+
+        ds = self.ds
+        kwargs = {'dqx' : self.Binsize3Dx.get(),
+                  'dqy' : self.Binsize3Dy.get(),
+                  'dqz' : self.Binsize3Dz.get(),
+                  'rlu' : self.hkl.get()}
+        fileName = self.scanNumbers_var.get()
+
+        def job(progress):
+            intensities,bins,errors = ds.binData3D(**kwargs)
         
-        np.save(self.scanNumbers_var.get()+'_Cut3D_Intensities.npy', intensities)
-        np.save(self.scanNumbers_var.get()+'_Cut3D_BinEdges.npy', bins)
-        np.save(self.scanNumbers_var.get()+'_Cut3D_Errors.npy', errors)
-        print('Cut3D Saved\n!')
+            np.save(fileName+'_Cut3D_Intensities.npy', intensities)
+            np.save(fileName+'_Cut3D_BinEdges.npy', bins)
+            np.save(fileName+'_Cut3D_Errors.npy', errors)
+
+        self.run_in_background('Export 3D data', job, on_done=lambda result: print('Cut3D Saved\n!'))
         
 
 
@@ -271,12 +383,8 @@ class MyGUI:
         tk.Button(self.settings_window, text="Close",
                    command=self.apply_settings).grid(row=8, column=2, columnspan=1)
         
-    def Cut1D_Export(self):
-        print('Exporting the 1D Plane')
-        print('Binning the data... Plase be patient! (:\n')
-
-        self.intialize_transformation()
-
+    def cut1D_settings(self):
+        # Start and end point and keyword arguments of the 1D cut
         p1 = [float(x) for x in self.Cut1D_Start.get().split(',')]
         p2 = [float(x) for x in self.Cut1D_End.get().split(',')]
 
@@ -286,51 +394,46 @@ class MyGUI:
                 'stepSize' : self.Cut1D_Step.get(),
                 'rlu' : self.hkl.get(),
                 'optimize' : False,
-                'marker' : 'o',
-                'color' : 'green',
-                'markersize' : 8,
-                'mew' : 1.5,
-                'linewidth' : 1.5,
-                'capsize' : 3,
-                'linestyle' : (0, (1, 1)),
-                'mfc' : 'white',
                 }
+        return p1,p2,kwargs
+
+    def Cut1D_Export(self):
+        if self.busy():
+            return
+        print('Exporting the 1D Plane')
+        print('Binning the data in the background\n')
+
+        self.intialize_transformation()
 
-        positionVector,I,err,ax = self.ds.plotCut1D(p1, p2, **kwargs)
-        np.save(self.scanNumbers_var.get()+'_Cut1D_Position.npy', positionVector)
-        np.save(self.scanNumbers_var.get()+'_Cut1D_Intensities.npy', I)
-        np.save(self.scanNumbers_var.get()+'_Cut1D_Errors.npy', err)
-        print("Saved!")
+        p1,p2,kwargs = self.cut1D_settings()
+        ds = self.ds
+        fileName = self.scanNumbers_var.get()
+
+        def job(progress):
+            positionVector,I,err = ds.cut1D(p1, p2, **kwargs)
+            np.save(fileName+'_Cut1D_Position.npy', positionVector)
+            np.save(fileName+'_Cut1D_Intensities.npy', I)
+            np.save(fileName+'_Cut1D_Errors.npy', err)
+
+        self.run_in_background('Export 1D cut', job, on_done=lambda result: print("Saved!"))
 
 
     def Cut1D_Plot(self):
+        if self.busy():
+            return
         print('Exporting the 1D Plane')
-        print('Binning the data... Plase be patient! (:\n')
+        print('Binning the data in the background\n')
 
         self.intialize_transformation()
 
-        p1 = [float(x) for x in self.Cut1D_Start.get().split(',')]
-        p2 = [float(x) for x in self.Cut1D_End.get().split(',')]
+        p1,p2,kwargs = self.cut1D_settings()
+        ds = self.ds
 
-        kwargs = {
-                'width' : self.Cut1D_Wperp.get(),
-                'widthZ' : self.Cut1D_W_Z.get(),
-                'stepSize' : self.Cut1D_Step.get(),
-                'rlu' : self.hkl.get(),
-                'optimize' : False,
-                'marker' : 'o',
-                'color' : 'green',
-                'markersize' : 8,
-                'mew' : 1.5,
-                'linewidth' : 1.5,
-                'capsize' : 3,
-                'linestyle' : (0, (1, 1)),
-                'mfc' : 'white',
-                }
+        def plot(result): # The cut is reused from the background job
+            positionVector,I,err,ax = ds.plotCut1D(p1, p2, **kwargs, **cut1DStyle)
+            plt.show()
 
-        positionVector,I,err,ax = self.ds.plotCut1D(p1, p2, **kwargs)
-        fig = ax.get_figure()
-        plt.show()
+        self.run_in_background('1D cut', lambda progress: ds.cut1D(p1, p2, **kwargs), on_done=plot)
 
     def open_settings_window_IV(self):
         # Create a new window for settings
@@ -392,6 +495,8 @@ class MyGUI:
             print('Updating the 3D Viewer with new projection vectors')
             p1 = np.array(list(self.Viewer_3D_axis_1.get() ), dtype=int)
             p2 = np.array(list(self.Viewer_3D_axis_2.get() ), dtype=int)
+            if self.busy():
+                return
             self.ds.setProjectionVectors(p1,p2,p3=None)
             self.apply_settings()
 
@@ -443,22 +548,34 @@ class MyGUI:
             self.unitcelled = True
             print('Unit Cell:', unitCell)
 
-        dataFiles = [DataFile.loadDataFile(
-            dFP, unitCell=unitCell) for dFP in filePath]
-        self.ds = DataSet.DataSet(dataFiles)
-
-        if self.Background_var.get() != '':
-            print('Performing background subtraction... Be Patient! (: ')
-            filePath_sub =  _tools.fileListGenerator(self.Background_var.get(),
+        background = self.Background_var.get()
+        if background != '':
+            filePath_sub =  _tools.fileListGenerator(background,
                                             dataFolder,
                                             year=year)
-            dataFiles_sub = [DataFile.loadDataFile(
-            dFP, unitCell=unitCell) for dFP in filePath_sub]
-            ds_sub = DataSet.DataSet(dataFiles_sub)
-            self.ds.directSubtractDS(ds_sub,saveToFile=True,
-                                     saveToNewFile='subtracted_data.hdf')
+        else:
+            filePath_sub = []
+
+        def job(progress):
+            files = list(filePath)+list(filePath_sub)
+            dataFiles = []
+            for i,dFP in enumerate(files):
+                progress(i, len(files))
+                dataFiles.append(DataFile.loadDataFile(dFP, unitCell=unitCell))
+            ds = DataSet.DataSet(dataFiles[:len(filePath)])
+
+            if background != '':
+                print('Performing background subtraction... Be Patient! (: ')
+                ds_sub = DataSet.DataSet(dataFiles[len(filePath):])
+                ds.directSubtractDS(ds_sub,saveToFile=True,
+                                    saveToNewFile='subtracted_data.hdf')
+            return ds
+
+        def loaded(ds):
+            self.ds = ds
+            print('\nInitalised {} DataFiles\n'.format(len(self.ds)))
 
-        print('\nInitalised {} DataFiles\n'.format(len(self.ds)))
+        self.run_in_background('Loading data', job, on_done=loaded)
 
     def browse_data_folder(self):
         folder_path = filedialog.askdirectory()
@@ -528,12 +645,14 @@ class MyGUI:
                    command=self.Cut2D_Plot).grid(row=10, column=0, columnspan=1)
         tk.Button(self.settings_window, text="Close",
                    command=self.apply_settings).grid(row=10, column=2, columnspan=1)
-        
-        self.intialize_transformation()
 
     def Cut2D_Export(self):
+        if self.busy():
+            return
         print('Plotting a 2D Plane')
-        print('Binning the data... Plase be patient! (:\n')
+        print('Binning the data in the background\n')
+
+        self.intialize_transformation()
 
         self.Cut2D_cmin = tk.DoubleVar(value=0)
         self.Cut2D_cmax = tk.DoubleVar(value=0.0001)
@@ -555,18 +674,26 @@ class MyGUI:
         'colorbar' : True,
         }
 
-        ax,returndata,bins = self.ds.plotQPlane(points=points,
-                                                width=self.Cut2D_width.get(),
-                                                **kwargs)
-        np.save(self.scanNumbers_var.get()+'_Cut2D_Data.npy', returndata)
-        np.save(self.scanNumbers_var.get()+'_Cut2D_BinEdges.npy', bins)
-        print('Cut2D Saved\n!')
-        plt.close()
+        ds = self.ds
+        width = self.Cut2D_width.get()
+        fileName = self.scanNumbers_var.get()
+
+        def job(progress):
+            returndata,bins,_,_ = ds.cutQPlane(points=points, width=width, dQx=kwargs['dQx'], dQy=kwargs['dQy'],
+                                               rlu=kwargs['rlu'], steps=kwargs['steps'])
+            np.save(fileName+'_Cut2D_Data.npy', returndata)
+            np.save(fileName+'_Cut2D_BinEdges.npy', bins)
+
+        self.run_in_background('Export 2D cut', job, on_done=lambda result: print('Cut2D Saved\n!'))
 
     def Cut2D_Plot(self):
+        if self.busy():
+            return
 
         print('Plotting a 2D Plane')
-        print('Binning the data... Plase be patient! (:\n')
+        print('Binning the data in the background\n')
+
+        self.intialize_transformation()
 
         self.Cut2D_cmin = tk.DoubleVar(value=0)
         self.Cut2D_cmax = tk.DoubleVar(value=0.0001)
@@ -588,11 +715,19 @@ class MyGUI:
         'colorbar' : True,
         }
 
-        ax,returndata,bins = self.ds.plotQPlane(points=points,
-                                                width=self.Cut2D_width.get(),
-                                                **kwargs)
-        ax.set_clim(self.Cut2D_cmin.get(), self.Cut2D_cmax.get())
-        plt.show()
+        ds = self.ds
+        width = self.Cut2D_width.get()
+        cmin,cmax = self.Cut2D_cmin.get(), self.Cut2D_cmax.get()
+
+        def plot(result): # The cut is reused from the background job
+            ax,returndata,bins = ds.plotQPlane(points=points,
+                                               width=width,
+                                               **kwargs)
+            ax.set_clim(cmin, cmax)
+            plt.show()
+
+        self.run_in_background('2D cut', lambda progress: ds.cutQPlane(points=points, width=width, dQx=kwargs['dQx'], dQy=kwargs['dQy'],
+                                                                       rlu=kwargs['rlu'], steps=kwargs['steps']), on_done=plot)
 
     def plot_interactive_viewer(self):
         for i in range(len(self.ds)):
@@ -605,7 +740,9 @@ class MyGUI:
             plt.show()
 
     def plot_3D_viewer(self):
-        print('\nBinning the data... Please be patient (: \n ')
+        if self.busy():
+            return
+        print('\nBinning the data in the background\n ')
         use_hkl = self.hkl.get()
         if use_hkl == 1:
             print('HKL Transform requested.. \n')
@@ -615,17 +752,21 @@ class MyGUI:
         print(float(self.xbinsize.get()))
         print(float(self.ybinsize.get()))
         print(float(self.zbinsize.get()))
-        Viewer = self.ds.Viewer3D(float(self.xbinsize.get()),
-                                  float(self.ybinsize.get()),
-                                  float(self.zbinsize.get()),
-                                  rlu=use_hkl,
-                                  steps=150)
-        
+        ds = self.ds
+        binSizes = [float(self.xbinsize.get()), float(self.ybinsize.get()), float(self.zbinsize.get())]
+        aspect = self.Viewer_3D_axes.get()
+        cmin,cmax = self.Viewer_3D_colur_min.get(), self.Viewer_3D_colur_max.get()
+
+        def plot(result): # The binned volume is reused from the background job
+            Viewer = ds.Viewer3D(*binSizes,
+                                 rlu=use_hkl,
+                                 steps=150)
         
-        Viewer.ax.axis(self.Viewer_3D_axes.get())
-        Viewer.set_clim(self.Viewer_3D_colur_min.get(),
-                        self.Viewer_3D_colur_max.get())
-        plt.show()
+            Viewer.ax.axis(aspect)
+            Viewer.set_clim(cmin, cmax)
+            plt.show()
+
+        self.run_in_background('3D binning', lambda progress: ds.binVolume(*binSizes, rlu=use_hkl, steps=150), on_done=plot)
 
     def intialize_transformation(self):
         self.q1 = [float(self.Q1x.get()), 
@@ -2,39 +2,49 @@
 import argparse
 import glob
 import os
-import numpy as np
+import runpy
+import sys
 
-OpossibleCommands = ['Nope','None','I don\'t know']
-
-list_of_commands = glob.glob(os.path.join('DMCpy','CommandLineScripts','*.py')) # * means all if need specific format then *.csv
+list_of_commands = glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),'*.py')) # * means all if need specific format then *.csv
 
 def oxfordlist(ls):
     if len(ls) == 1:
         return ls[0]
     if len(ls) == 2:
         return ' and '.join(ls)
-    return ', '.join(ls[-1])+'and '+ls[-1] 
+    return ', '.join(ls[:-1])+' and '+ls[-1]
 
 ## python files to skip
 skip = ['DMCpy.py','__init__.py']
 
-list_of_valid_commands = [command for command in list_of_commands if not os.path.split(command)[-1] in skip]
+list_of_valid_commands = sorted([command for command in list_of_commands if not os.path.split(command)[-1] in skip])
 list_of_valid_command_names = [os.path.splitext(os.path.split(command)[-1])[0] for command in list_of_valid_commands]
 
-parser = argparse.ArgumentParser(description="Collection of DMCpy tools for the command line")
-parser.add_argument("task", nargs='?', default='help', type=str, help="Type of task to be performed. Possible tasks are: {}. Run without argument to see help menu.".format(oxfordlist(list_of_valid_command_names)))
-parser.add_argument('additional', nargs=argparse.REMAINDER)
 
-args = parser.parse_args()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collection of DMCpy tools for the command line")
+    parser.add_argument("task", nargs='?', default='help', type=str, help="Type of task to be performed. Possible tasks are: {}. Run without argument to see help menu.".format(oxfordlist(list_of_valid_command_names)))
+    parser.add_argument('additional', nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+
+    if not args.task in list_of_valid_command_names:
+        print('Command not understood from DMCpy')
+        parser.print_help()
+        return 1
 
-try:
-    idx = list_of_valid_command_names.index(args.task)
+    # The task is run in this process as if called directly with the additional arguments
+    moduleName = 'DMCpy.CommandLineScripts.'+args.task
+    oldArgv = sys.argv
+    sys.argv = [list_of_valid_commands[list_of_valid_command_names.index(args.task)]]+args.additional
+    try:
+        runpy.run_module(moduleName,run_name='__main__',alter_sys=True)
+    except SystemExit as e:
+        return e.code
+    finally:
+        sys.argv = oldArgv
+    return 0
 
-    arguments = dict(vars(args))
-    del arguments['task']
 
-    print('wanting to call {} with arguments {}'.format(list_of_valid_commands[idx],arguments))
-    os.system('python {} {}'.format(list_of_valid_commands[idx],args.additional))
-except:
-    print('Command not understood from DMCpy')
-    print(args)
+if __name__ == "__main__":
+    sys.exit(main())
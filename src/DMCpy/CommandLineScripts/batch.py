@@ -0,0 +1,286 @@
+# SPDX-License-Identifier: MPL-2.0
+"""Headless batch reduction of DMC data described in a YAML or JSON job file.
+
+Example of a job file::
+
+    output: reduced            # Folder of the outputs, one sub folder per job (default current folder)
+    processes: 2               # Number of jobs run in parallel (default 1)
+    cache: /scratch/DMCpyCache # Optional folder of the on-disk result cache
+    jobs:
+      - name: sample_2K
+        load: {files: '12105-12110', folder: data/SC, year: 2022, unitCell: [7.218,7.218,18.183,90,90,120]}
+        background: {files: '12100-12104'}
+        UB: {q1: [-4.126,-2.240,-0.285], q2: [2.166,0.114,0.165], HKL1: [0,2,-4], HKL2: [0,0,2]}
+        steps:
+          - binData3D: {dqx: 0.02, dqy: 0.02, dqz: 0.05, rlu: true}
+          - cut1D: {P1: [0,0,0], P2: [1,0,0], width: 0.1, widthZ: 0.1, stepSize: 0.01}
+          - cutQPlane: {points: [[0,0,0],[1,0,0],[0,1,0]], width: 0.1, dQx: 0.01, dQy: 0.01, rlu: true}
+          - powder: {format: xye, dTheta: 0.125}
+
+Run with ``DMCpyBatch jobs.yaml``. For each job the outputs are written to <output>/<name> together with
+summary.json holding status, timing and output files of every step. The summary of all jobs is written to
+<output>/summary.json.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import numpy as np
+from DMCpy import DataFile, DataSet, _tools, Cache
+
+
+def readJobFile(fileName):
+    """Read job description from YAML (.yaml, .yml) or JSON file.
+
+    Args:
+
+        - fileName (str): Path to job file
+
+    Returns:
+
+        - description (dict): Settings with the list of jobs under 'jobs'
+
+    """
+    with open(fileName) as f:
+        if os.path.splitext(fileName)[1].lower() in ['.yaml','.yml']:
+            try:
+                import yaml
+            except ImportError: # pragma: no cover
+                raise AttributeError('Reading YAML job files requires PyYAML. Install it or provide the jobs as JSON.')
+            description = yaml.safe_load(f)
+        else:
+            description = json.load(f)
+
+    if isinstance(description,list): # Only list of jobs provided
+        description = {'jobs':description}
+    if not isinstance(description,dict) or not isinstance(description.get('jobs'),list):
+        raise AttributeError('Job file {} does not contain a list of jobs.'.format(fileName))
+
+    for I,job in enumerate(description['jobs']):
+        if not isinstance(job,dict) or not 'load' in job:
+            raise AttributeError('Job {} in {} has no "load" entry.'.format(I,fileName))
+        job.setdefault('name','job{}'.format(I))
+        for step in job.get('steps',[]):
+            if not isinstance(step,dict) or len(step) != 1 or not list(step)[0] in stepFunctions:
+                raise AttributeError('Step {} of job "{}" not understood. Steps are given as {{type: {{parameters}}}} with type in {}.'.format(step,job['name'],', '.join(stepFunctions)))
+    return description
+
+
+def loadDataSet(settings,defaults=None):
+    """Load data set from load settings {files, folder, year, unitCell, forcePowder}, where files is either a
+    string of file numbers, e.g. '12105-12110', or a list of file paths"""
+    settings = dict(defaults or {},**settings)
+    files = settings['files']
+    if isinstance(files,(str,int)):
+        files = _tools.fileListGenerator(str(files),settings.get('folder','.'),year=settings.get('year',2021))
+    unitCell = settings.get('unitCell')
+    dataFiles = [DataFile.loadDataFile(f,unitCell=unitCell,forcePowder=settings.get('forcePowder',False)) for f in files]
+    return DataSet.DataSet(dataFiles)
+
+
+def stepBinData3D(ds,parameters,baseName):
+    volume = ds.binVolume(**parameters)
+    fileName = baseName+'.npz'
+    np.savez(fileName,data=volume.data,errors=volume.errors,intensity=volume.intensity,monitor=volume.monitor,
+             counts=volume.counts,xEdges=volume.edges[0],yEdges=volume.edges[1],zEdges=volume.edges[2])
+    return [fileName]
+
+
+def stepCut1D(ds,parameters,baseName):
+    position,intensity,errors = ds.cut1D(**parameters)
+    fileName = baseName+'.csv'
+    names = ['H','K','L'] if parameters.get('rlu',True) else ['Qx','Qy','Qz']
+    np.savetxt(fileName,np.array([*position,intensity,errors]).T,delimiter=',',header=','.join(names+['Intensity','Error']),comments='')
+    return [fileName]
+
+
+def stepCutQPlane(ds,parameters,baseName):
+    parameters = dict(parameters)
+    parameters['points'] = np.asarray(parameters['points'],dtype=float)
+    returndata,bins,rotationMatrix,translation = ds.cutQPlane(**parameters)
+    intensity,monitor,normalization,normCount = returndata
+    fileName = baseName+'.npz'
+    np.savez(fileName,intensity=intensity,monitor=monitor,normalization=normalization,normCount=normCount,
+             xEdges=bins[0][:,0],yEdges=bins[1][0],rotationMatrix=rotationMatrix,translation=translation)
+    return [fileName]
+
+
+def stepPowder(ds,parameters,baseName):
+    parameters = dict(parameters)
+    formats = parameters.pop('format','xye')
+    if isinstance(formats,str):
+        formats = [formats]
+    outFolder = os.path.dirname(baseName)
+    fileNames = []
+    for exportFormat in formats:
+        if exportFormat.lower() == 'xye':
+            fileNames.append(ds.export_xye_format(outFolder=outFolder,**parameters))
+        elif exportFormat.lower() == 'psi':
+            fileNames.append(ds.export_PSI_format(outFolder=outFolder,**parameters))
+        else:
+            raise AttributeError('Powder export format "{}" not understood. Use xye or PSI.'.format(exportFormat))
+    return fileNames
+
+
+# Reduction steps of a job, called as function(ds,parameters,baseName) returning the list of written files
+stepFunctions = {'binData3D':stepBinData3D,
+                 'cut1D':stepCut1D,
+                 'cutQPlane':stepCutQPlane,
+                 'powder':stepPowder}
+
+
+def defineUB(ds,settings):
+    """Orient the sample from a saved sample file, two reflections, and/or projection vectors"""
+    if 'sampleFile' in settings:
+        ds.loadSample(settings['sampleFile'])
+    if 'q1' in settings:
+        ds.alignToRefs(q1=settings['q1'],q2=settings['q2'],HKL1=settings['HKL1'],HKL2=settings['HKL2'])
+    if 'projectionVectors' in settings:
+        ds.setProjectionVectors(*settings['projectionVectors'])
+
+
+def runJob(job,output='.',quiet=False,cache=None):
+    """Run all steps of a single job and write its outputs and summary.json to output/<job name>.
+
+    Args:
+
+        - job (dict): Job description with name, load and optionally background, UB and steps
+
+    Kwargs:
+
+        - output (str): Folder in which the folder of the job is created (default current folder)
+
+        - quiet (bool): If True, output of the reductions is suppressed (default False)
+
+        - cache (str): Folder of the on-disk result cache (default None - no caching)
+
+    Returns:
+
+        - summary (dict): Name, status, total time and list of steps with status, time and written files
+
+    """
+    # Cache settings are restored afterwards, as jobs run in the calling process when not in parallel
+    oldSettings = dict(Cache.settings)
+    try:
+        if not cache is None:
+            Cache.enable(directory=cache)
+        return _runJob(job,output=output,quiet=quiet)
+    finally:
+        Cache.settings.update(oldSettings)
+
+
+def _runJob(job,output,quiet):
+    name = job['name']
+    folder = os.path.join(output,name)
+    os.makedirs(folder,exist_ok=True)
+    summary = {'name':name,'folder':folder,'status':'done','steps':[]}
+
+    setup = [(kind,job[kind]) for kind in ['load','background','UB'] if kind in job]
+    actions = setup+[list(step.items())[0] for step in job.get('steps',[])]
+
+    start = time.perf_counter()
+    ds = None
+    for I,(kind,parameters) in enumerate(actions):
+        stepStart = time.perf_counter()
+        result = {'step':kind,'parameters':parameters,'status':'done','outputs':[]}
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+                if kind == 'load':
+                    ds = loadDataSet(parameters)
+                elif kind == 'background':
+                    dsBackground = loadDataSet(parameters,defaults=job['load'])
+                    ds.directSubtractDS(dsBackground,saveToFile=parameters.get('saveToFile',False),saveToNewFile=parameters.get('saveToNewFile',False))
+                elif kind == 'UB':
+                    defineUB(ds,parameters)
+                else:
+                    baseName = os.path.join(folder,'{}_{}_{}'.format(name,I-len(setup),kind))
+                    result['outputs'] = stepFunctions[kind](ds,dict(parameters or {}),baseName)
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = '{}: {}'.format(type(e).__name__,e)
+            summary['status'] = 'failed'
+        result['seconds'] = time.perf_counter()-stepStart
+        summary['steps'].append(result)
+        print('[{}] {} {} in {:.2f} s{}'.format(name,kind,result['status'],result['seconds'],
+                                               ': '+result['error'] if 'error' in result else ''),file=sys.stderr if quiet else sys.stdout)
+        if result['status'] == 'failed': # Following steps depend on this one
+            break
+
+    summary['seconds'] = time.perf_counter()-start
+    with open(os.path.join(folder,'summary.json'),'w') as f:
+        json.dump(summary,f,indent=2,default=_toJSON)
+    return summary
+
+
+def _toJSON(value):
+    if isinstance(value,np.ndarray):
+        return value.tolist()
+    if isinstance(value,np.generic):
+        return value.item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def runJobs(description,output=None,processes=None,quiet=False):
+    """Run all jobs of a job description, in parallel processes if requested.
+
+    Args:
+
+        - description (dict): Job description as returned by readJobFile
+
+    Kwargs:
+
+        - output (str): Folder of the outputs (default description['output'] or current folder)
+
+        - processes (int): Number of jobs run in parallel (default description['processes'] or 1)
+
+        - quiet (bool): If True, output of the reductions is suppressed (default False)
+
+    Returns:
+
+        - summary (dict): Summaries of all jobs, also written to output/summary.json
+
+    """
+    if output is None:
+        output = description.get('output','.')
+    if processes is None:
+        processes = description.get('processes',1)
+    cache = description.get('cache')
+    jobs = description['jobs']
+    os.makedirs(output,exist_ok=True)
+
+    start = time.perf_counter()
+    if processes > 1 and len(jobs) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(runJob,job,output=output,quiet=quiet,cache=cache) for job in jobs]
+            jobSummaries = [future.result() for future in futures]
+    else:
+        jobSummaries = [runJob(job,output=output,quiet=quiet,cache=cache) for job in jobs]
+
+    summary = {'status':'done' if np.all([s['status'] == 'done' for s in jobSummaries]) else 'failed',
+               'seconds':time.perf_counter()-start,
+               'jobs':jobSummaries}
+    with open(os.path.join(output,'summary.json'),'w') as f:
+        json.dump(summary,f,indent=2,default=_toJSON)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch reduction of DMC data described in a YAML or JSON job file")
+    parser.add_argument('jobFile', type=str, help='YAML or JSON file describing the jobs')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Folder of the outputs (default from job file or current folder)')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='Number of jobs run in parallel (default from job file or 1)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print the timing of each step')
+
+    args = parser.parse_args(argv)
+    description = readJobFile(args.jobFile)
+    summary = runJobs(description,output=args.output,processes=args.processes,quiet=args.quiet)
+    print('Finished {} jobs in {:.2f} s with status {}'.format(len(summary['jobs']),summary['seconds'],summary['status']))
+    return 0 if summary['status'] == 'done' else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,18 +4,17 @@ import datetime
 from h5py._hl import attrs
 import numpy as np
 import pickle as pickle
-import matplotlib.pyplot as plt
-import pandas as pd
 import DMCpy
 import os.path
-from DMCpy import InteractiveViewer
 from DMCpy.TasUBlibDEG import converterToA3A4Z
 
 import warnings
 
+import collections
 import copy
+import contextlib
 from DMCpy._tools import KwargChecker, MPLKwargs, roundPower
-from DMCpy import Sample
+from DMCpy import Sample, _tools
 from DMCpy.FileStructure import HDFCounts, HDFCountsBG, HDFTranslation, HDFTranslationAlternatives, HDFTranslationDefault, HDFTranslationFunctions
 from DMCpy.FileStructure import HDFInstrumentTranslation, HDFInstrumentTranslationFunctions, extraAttributes, possibleAttributes 
 from DMCpy.FileStructure import HDFTypes, HDFUnits, shallowRead
@@ -74,7 +73,7 @@ def findCalibration(fileName):
     # Split name in 'dmcyyyynxxxxxx.hdf'
     year,fileNo = [int(x) for x in fileName[3:].replace('.hdf','').split('n')]
 
-    calibrationDict = DMCpy.calibrationDict
+    calibrationDict = DMCpy.calibrationDict # Calibration store, read lazily per year
 
     # Calibration files do not cover the wanted year
     if not year in calibrationDict.keys():
@@ -114,6 +113,324 @@ class lazyQ(object):
 
 
 
+# Counts of a chunk of scan steps kept in the stored integer dtype. Background subtraction
+# and normalization are only applied to the pixels requested. Usage:
+# All pixels: chunk.counts() or chunk.intensity()
+# Only selected pixels, given as flat indices within the chunk: chunk.intensity(index)
+# Normalization of selected pixels: chunk.normalizationWeights()[index]
+# Only a region of the detector is read if sl is a tuple of slices, e.g. (steps,z,twoTheta)
+# An already opened HDF file can be provided to avoid reopening it for every chunk
+class lazyCounts(object):
+    def __init__(self,df,sl,hdfFile=None):
+        self.df = df
+        self.background = None
+        self.pixelSlice = tuple(sl[1:]) if isinstance(sl,tuple) else ()
+        if df._counts is None:
+            with (contextlib.nullcontext(hdfFile) if not hdfFile is None else hdf.File(os.path.join(df.folder,df.fileName),mode='r')) as f:
+                counts = f.get(HDFCounts)
+                if counts.ndim < 3: # Single frame stored without scan step axis
+                    self.rawCounts = np.asarray(counts).reshape(1,*counts.shape)[sl]
+                    if df.hasBackground:
+                        self.background = df.background[sl]
+                    return
+                self.rawCounts = np.asarray(counts[sl])
+                if df.hasBackground:
+                    if not df._background is None:
+                        self.background = df._background[sl]
+                    elif df.backgroundType == 'powder': # Same background for all scan steps
+                        self.background = np.asarray(f.get(HDFCountsBG)[self.pixelSlice])
+                    else:
+                        self.background = np.asarray(f.get(HDFCountsBG)[sl])
+        else: # Background already subtracted from counts held in memory
+            self.rawCounts = df._counts[sl]
+
+    def counts(self,index=None):
+        if index is None:
+            if self.background is None:
+                return self.rawCounts
+            return self.rawCounts-self.background.reshape(-1,*self.rawCounts.shape[1:])
+        counts = self.rawCounts.reshape(-1)[index]
+        if self.background is None:
+            return counts
+        background = self.background.reshape(-1)
+        return counts-background[index % background.size]
+
+    def normalizationWeights(self):
+        # Normalization of the chunk, broadcast to the shape of the counts when indexed
+        return lazyWeights(self._normalization(),self.rawCounts.shape)
+
+    def _normalization(self):
+        if self.df.fileType.lower() == 'singlecrystal':
+            return self.df.normalization[self.pixelSlice]
+        return self.df.normalization[(slice(None),)+self.pixelSlice]
+
+    def intensity(self,index=None):
+        normalization = self._normalization()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if index is None:
+                if self.df.fileType.lower() == 'singlecrystal':
+                    normalization = normalization[np.newaxis]
+                return np.divide(self.counts(),normalization,dtype=self.df.dtype)
+            normalization = normalization.reshape(-1)
+            return np.divide(self.counts(index),normalization[index % normalization.size],dtype=self.df.dtype)
+
+
+# Intensity of single scan steps read on demand, e.g. for the InteractiveViewer. The most recently used
+# frames are kept and the frames following (or preceding, when stepping backwards) a requested frame are
+# read in the same access. Usage:
+# Single frame of shape (z,twoTheta): frames[index]
+# Sums over z and over twoTheta of all frames, calculated once in chunks: frames.summedPanels()
+class lazyFrames(object):
+    def __init__(self,df,cacheSize=16,prefetch=4):
+        self.df = df
+        self.prefetch = max(0,int(prefetch))
+        self.cacheSize = max(int(cacheSize),self.prefetch+1)
+        self.shape = tuple(df.countShape)
+        self.dtype = df.dtype
+        self.frames = collections.OrderedDict()
+        self.lastIndex = -1
+        self.panels = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self,index):
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Frame {} out of range for data file with {} scan steps.'.format(index,len(self)))
+
+        if not index in self.frames:
+            if index < self.lastIndex: # Stepping backwards
+                start,stop = max(0,index-self.prefetch),index+1
+            else:
+                start,stop = index,min(len(self),index+1+self.prefetch)
+            for i,frame in enumerate(lazyCounts(self.df,slice(start,stop)).intensity(),start=start):
+                self.frames[i] = frame
+                self.frames.move_to_end(i)
+        self.frames.move_to_end(index)
+        while len(self.frames) > self.cacheSize:
+            self.frames.popitem(last=False)
+
+        self.lastIndex = index
+        return self.frames[index]
+
+    def summedPanels(self,steps=None):
+        """Return intensity summed over z, shape (frames,twoTheta), summed over twoTheta, shape (frames,z), and [min,max] of all frames"""
+        if self.panels is None:
+            zSummed = np.zeros((len(self),self.shape[2]),dtype=self.dtype)
+            twoThetaSummed = np.zeros((len(self),self.shape[1]),dtype=self.dtype)
+            limits = []
+            dfSteps = _tools.planSteps(self.df) if steps is None else steps
+            for idx in _tools.arange(0,len(self),dfSteps):
+                intensity = lazyCounts(self.df,slice(idx[0],idx[1])).intensity()
+                zSummed[idx[0]:idx[1]] = intensity.sum(axis=1)
+                twoThetaSummed[idx[0]:idx[1]] = intensity.sum(axis=2)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    limits.append([np.nanmin(intensity),np.nanmax(intensity)])
+            limits = np.array(limits)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self.panels = zSummed,twoThetaSummed,[np.nanmin(limits[:,0]),np.nanmax(limits[:,1])]
+        return self.panels
+
+
+# Per-frame or per-pixel factors, e.g. monitor or normalization, kept in their compact shape
+# broadcastable to the shape of a chunk. Usage:
+# Values of selected pixels, given as flat indices within the chunk: weights[index]
+class lazyWeights(object):
+    def __init__(self,values,shape):
+        self.shape = tuple(shape)
+        values = np.asarray(values)
+        self.values = values.reshape((1,)*(len(self.shape)-values.ndim)+values.shape)
+        if not np.all([v in [1,s] for v,s in zip(self.values.shape,self.shape)]):
+            raise AttributeError('Weights of shape {} cannot be broadcast to shape {}'.format(values.shape,self.shape))
+
+    def __getitem__(self,index):
+        coordinates = np.unravel_index(index,self.shape)
+        coordinates = tuple(c if v != 1 else 0 for c,v in zip(coordinates,self.values.shape))
+        return np.broadcast_to(self.values[coordinates],np.shape(index))
+
+
+# Boolean mask of shape (frames,*pixels) stored as a per-pixel mask, a per-frame mask and sparse
+# exceptions overriding these for single points. Usage:
+# Flat indices of points not masked in a chunk: mask.notMasked(slice(start,stop))
+# Full boolean array of a chunk: mask[start:stop] or np.asarray(mask) for all frames
+class compactMask(object):
+    def __init__(self,shape,pixelMask=None,frameMask=None):
+        self.shape = tuple(shape)
+        self.pixelMask = np.zeros(self.shape[1:],dtype=bool) if pixelMask is None else np.array(pixelMask,dtype=bool).reshape(self.shape[1:])
+        self.frameMask = np.zeros(self.shape[0],dtype=bool) if frameMask is None else np.array(frameMask,dtype=bool).reshape(self.shape[0])
+        self.exceptionIndex = np.zeros(0,dtype=int)
+        self.exceptionValue = np.zeros(0,dtype=bool)
+
+    @classmethod
+    def fromArray(cls,array):
+        """Factorize a full boolean array into pixels masked in all frames, fully masked frames and exceptions"""
+        array = np.asarray(array,dtype=bool)
+        mask = cls(array.shape,pixelMask=np.all(array,axis=0),frameMask=np.all(array.reshape(array.shape[0],-1),axis=1))
+        difference = np.flatnonzero(array != mask.expand())
+        mask._setExceptions(difference,array.reshape(-1)[difference])
+        return mask
+
+    dtype = np.dtype(bool)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def pixels(self):
+        return int(np.prod(self.shape[1:]))
+
+    def _setExceptions(self,index,value):
+        index = np.asarray(index,dtype=int).reshape(-1)
+        value = np.broadcast_to(np.asarray(value,dtype=bool),index.shape)
+        keep = np.logical_not(np.isin(self.exceptionIndex,index))
+        index,unique = np.unique(index,return_index=True)
+        allIndex = np.concatenate([self.exceptionIndex[keep],index])
+        allValue = np.concatenate([self.exceptionValue[keep],value[unique]])
+        order = np.argsort(allIndex,kind='stable')
+        self.exceptionIndex = allIndex[order]
+        self.exceptionValue = allValue[order]
+
+    def _frames(self,sl):
+        return np.atleast_1d(np.arange(self.shape[0])[sl])
+
+    def _localExceptions(self,frames):
+        """Exceptions within frames given as flat indices local to these frames"""
+        if len(self.exceptionIndex) == 0:
+            return self.exceptionIndex,self.exceptionValue
+        lookup = np.full(self.shape[0],-1)
+        lookup[frames] = np.arange(len(frames))
+        local = lookup[self.exceptionIndex//self.pixels]
+        inside = local>=0
+        return local[inside]*self.pixels+self.exceptionIndex[inside] % self.pixels,self.exceptionValue[inside]
+
+    def expand(self,sl=slice(None)):
+        """Full boolean mask of frames sl"""
+        frames = self._frames(sl)
+        full = np.logical_or(self.pixelMask[np.newaxis],self.frameMask[frames].reshape(-1,*[1]*(self.ndim-1)))
+        index,value = self._localExceptions(frames)
+        full.reshape(-1)[index] = value
+        return full
+
+    def notMasked(self,sl=slice(None)):
+        """Sorted flat indices, local to frames sl, of all points not masked"""
+        frames = self._frames(sl)
+        goodPixels = np.flatnonzero(np.logical_not(self.pixelMask))
+        goodFrames = np.flatnonzero(np.logical_not(self.frameMask[frames]))
+        index = (goodFrames.reshape(-1,1)*self.pixels+goodPixels.reshape(1,-1)).reshape(-1)
+        exceptionIndex,exceptionValue = self._localExceptions(frames)
+        if len(exceptionIndex)>0:
+            index = index[np.logical_not(np.isin(index,exceptionIndex[exceptionValue]))]
+            index = np.union1d(index,exceptionIndex[np.logical_not(exceptionValue)])
+        return index
+
+    def valuesAt(self,index):
+        """Mask value at global flat indices"""
+        index = np.asarray(index,dtype=int)
+        values = np.logical_or(self.pixelMask.reshape(-1)[index % self.pixels],self.frameMask[index//self.pixels])
+        if len(self.exceptionIndex)>0:
+            position = np.clip(np.searchsorted(self.exceptionIndex,index),0,len(self.exceptionIndex)-1)
+            isException = self.exceptionIndex[position] == index
+            values[isException] = self.exceptionValue[position[isException]]
+        return values
+
+    def __array__(self,dtype=None,copy=None):
+        full = self.expand()
+        if not dtype is None:
+            full = full.astype(dtype)
+        return full
+
+    def __len__(self):
+        return self.shape[0]
+
+    def flatten(self):
+        return self.expand().reshape(-1)
+
+    def __getitem__(self,key):
+        if not isinstance(key,tuple):
+            key = (key,)
+        if isinstance(key[0],slice):
+            return self.expand(key[0])[(slice(None),)+key[1:]]
+        if isinstance(key[0],(int,np.integer)):
+            return self.expand(slice(key[0],key[0]+1 if key[0] != -1 else None))[(0,)+key[1:]]
+        return self.expand()[key]
+
+    def __setitem__(self,key,value):
+        if not isinstance(key,tuple):
+            key = (key,)
+        if np.ndim(value) == 0 and bool(value) and len(key) <= self.ndim and np.all([isinstance(k,(slice,int,np.integer)) for k in key]):
+            key = key+(slice(None),)*(self.ndim-len(key))
+            frames = np.unique(self._frames(key[0]))
+            pixelSelection = np.zeros(self.shape[1:],dtype=bool)
+            pixelSelection[key[1:]] = True
+            if len(frames) == self.shape[0]: # All frames
+                self.pixelMask[pixelSelection] = True
+                self._removeExceptions(np.isin(self.exceptionIndex % self.pixels,np.flatnonzero(pixelSelection)))
+            elif np.all(pixelSelection): # Complete frames
+                self.frameMask[frames] = True
+                self._removeExceptions(np.isin(self.exceptionIndex//self.pixels,frames))
+            else:
+                index = (frames.reshape(-1,1)*self.pixels+np.flatnonzero(pixelSelection).reshape(1,-1)).reshape(-1)
+                self._setExceptions(index,True)
+        else: # General assignment through the full array
+            full = self.expand()
+            full[key] = value
+            self._update(compactMask.fromArray(full))
+
+    def _removeExceptions(self,remove):
+        keep = np.logical_not(remove)
+        self.exceptionIndex = self.exceptionIndex[keep]
+        self.exceptionValue = self.exceptionValue[keep]
+
+    def _update(self,other):
+        self.pixelMask = other.pixelMask
+        self.frameMask = other.frameMask
+        self.exceptionIndex = other.exceptionIndex
+        self.exceptionValue = other.exceptionValue
+
+    def __or__(self,other):
+        if not isinstance(other,compactMask):
+            return compactMask.fromArray(np.logical_or(self.expand(),other))
+        if self.shape != other.shape:
+            raise AttributeError('Masks of shape {} and {} cannot be combined'.format(self.shape,other.shape))
+        result = compactMask(self.shape,pixelMask=np.logical_or(self.pixelMask,other.pixelMask),frameMask=np.logical_or(self.frameMask,other.frameMask))
+        index = np.union1d(self.exceptionIndex,other.exceptionIndex)
+        if len(index)>0:
+            result._setExceptions(index,np.logical_or(self.valuesAt(index),other.valuesAt(index)))
+        return result
+
+    __add__ = __or__
+    __radd__ = __or__
+    __ror__ = __or__
+
+    def __iadd__(self,other):
+        self._update(self.__or__(other))
+        return self
+
+    __ior__ = __iadd__
+
+    def __invert__(self):
+        return np.logical_not(self.expand())
+
+    def __eq__(self,other):
+        return self.expand() == np.asarray(other)
+
+    def __ne__(self,other):
+        return self.expand() != np.asarray(other)
+
+    __hash__ = None
+
+
 def getNX_class(x,y,attribute):
     try:
         variableType = y.attrs['NX_class']
@@ -127,7 +444,7 @@ def getInstrument(file):
     return file.get(location)
 
 
-@KwargChecker(include=['radius','twoTheta','verticalPosition','twoThetaPosition','forcePowder','sampleOffsetZ']+list(HDFTranslation.keys()))
+@KwargChecker(include=['radius','twoTheta','verticalPosition','twoThetaPosition','forcePowder','sampleOffsetZ','dtype']+list(HDFTranslation.keys()))
 def loadDataFile(fileLocation=None,fileType='Unknown',unitCell=None,forcePowder=False,**kwargs):
     """Load DMC data file, either powder or single crystal data.
     
@@ -183,22 +500,23 @@ def loadDataFile(fileLocation=None,fileType='Unknown',unitCell=None,forcePowder=
     else:
         temp_sampleOffsetZ = None
 
-    # Overwrite parameters provided in the kwargs
-    for key,item in kwargs.items():
-        setattr(df,key,item)
+    # Overwrite parameters provided in the kwargs. Q is only calculated once after all are set
+    with df.deferGeometry():
+        for key,item in kwargs.items():
+            setattr(df,key,item)
+            
+        if 'twoThetaPosition' in kwargs:
+            if not 'twoTheta' in kwargs:
+                df.twoTheta = np.linspace(0,-132,9*128)+df.twoThetaPosition
+            else:
+                df.twoTheta = kwargs['twoTheta']
+        elif 'twoTheta' in kwargs:
+            df.twoTheta = kwargs['twoTheta']
         
-    if 'twoThetaPosition' in kwargs:
-        if not 'twoTheta' in kwargs:
-            df.twoTheta = np.linspace(0,-132,9*128)+df.twoThetaPosition
+        if temp_sampleOffsetZ is None:
+            df.initializeQ()
         else:
-            df.twoTheta = kwargs['twoTheta']
-    elif 'twoTheta' in kwargs:
-        df.twoTheta = kwargs['twoTheta']
-    
-    if temp_sampleOffsetZ is None:
-        df.initializeQ()
-    else:
-        df.sampleOffsetZ = temp_sampleOffsetZ
+            df.sampleOffsetZ = temp_sampleOffsetZ
     df.loadNormalization()
 
     year,month,date = [int(x) for x in df.startTime.replace('T',' ').split(' ')[0].split('-')]
@@ -212,8 +530,33 @@ def loadDataFile(fileLocation=None,fileType='Unknown',unitCell=None,forcePowder=
     return df
 
 
+def geometryAttribute(name):
+    """Attribute calculated by DataFile.calculateQ. Reading it recalculates Q first if the geometry has changed within deferGeometry."""
+    def getter(self):
+        if self.__dict__.get('_geometryDirty',False):
+            self.calculateQ()
+        try:
+            return self.__dict__['_'+name]
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__,name))
+
+    def setter(self,value):
+        self.__dict__['_'+name] = value
+
+    return property(getter,setter)
+
 
 class DataFile(object):
+    # Geometry calculated from the instrument angles, see calculateQ
+    q = geometryAttribute('q')
+    Q = geometryAttribute('Q')
+    qLocal = geometryAttribute('qLocal')
+    q_temp = geometryAttribute('q_temp')
+    rotMat = geometryAttribute('rotMat')
+    ki = geometryAttribute('ki')
+    kf = geometryAttribute('kf')
+    neu = geometryAttribute('neu')
+
     @KwargChecker()
     def __init__(self, file=None,unitCell=None,forcePowder=False):
         self.fileType = 'DataFile'
@@ -226,6 +569,8 @@ class DataFile(object):
             if isinstance(file,DataFile): # Copy everything from provided file
                 # Copy all file settings
                 self.updateProperty(file.__dict__)
+                if '_sample' in self.__dict__: # Observe the copied sample
+                    self.sample = self._sample
 
             elif os.path.exists(file): # load file from disk
                 self.loadFile(file,unitCell=unitCell)
@@ -307,9 +652,8 @@ class DataFile(object):
             self.monitor = np.ones(self.countShape[0])
         
         self.alpha = np.rad2deg(np.arctan2(self.pixelPosition[2],self.radius))
-        # Above line makes an implicit call to the self.calculateQ method!
         
-        self.calculateQ()
+        self.geometryChanged()
         self.generateMask(maskingFunction=None)
 
 
@@ -361,8 +705,8 @@ class DataFile(object):
             self.sample.rotation_angle = np.array([0.0]*len(self.monitor))
         else:
             self.sample.rotation_angle = A3
-        if hasattr(self,'ki'):
-            self.calculateQ()
+        if '_ki' in self.__dict__:
+            self.geometryChanged()
     
 
     @property
@@ -385,7 +729,7 @@ class DataFile(object):
             self._detector_position = np.asarray(twoTheta)
         self.twoTheta = np.repeat((np.linspace(0,-132,1152) + self._detector_position + self._twoThetaOffset)[np.newaxis],self.countShape[1],axis=0)
         if hasattr(self,'_Ki') and hasattr(self,'twoTheta'):
-            self.calculateQ()
+            self.geometryChanged()
 
     
 
@@ -401,7 +745,6 @@ class DataFile(object):
     def Ki(self,Ki):
         self._Ki = Ki
         self.wavelength = np.full_like(self.wavelength,2*np.pi/Ki)
-        self.calculateQ()
 
     @property
     def twoThetaOffset(self):
@@ -415,7 +758,7 @@ class DataFile(object):
     def twoThetaOffset(self,dTheta):
         self._twoThetaOffset = dTheta
         self.twoTheta = np.repeat((np.linspace(0,-132,1152) + self._detector_position + self._twoThetaOffset)[np.newaxis],self.countShape[1],axis=0)
-        self.calculateQ()
+        self.geometryChanged()
 
     @property
     def wavelength(self):
@@ -431,7 +774,7 @@ class DataFile(object):
     def wavelength(self,wavelength):
         self._wavelength = wavelength
         self._Ki = 2*np.pi/wavelength
-        self.calculateQ()
+        self.geometryChanged()
     
     @property
     def sampleOffsetZ(self):
@@ -447,10 +790,64 @@ class DataFile(object):
     def sampleOffsetZ(self,sampleOffsetZ):
         self._sampleOffsetZ = sampleOffsetZ
         self.initializeQ()
-        self.calculateQ()
         
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @dtype.getter
+    def dtype(self):
+        if not hasattr(self,'_dtype'):
+            self._dtype = np.float64
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self,dtype):
+        # Floating point precision of Q, intensities and binning positions. Sums are always accumulated in float64
+        dtype = np.dtype(dtype)
+        if not dtype in [np.dtype(np.float32),np.dtype(np.float64)]:
+            raise AttributeError('Precision must be either float32 or float64. Got {}'.format(dtype))
+        self._dtype = dtype.type
+        self.geometryChanged()
+
+    @contextlib.contextmanager
+    def deferGeometry(self):
+        """Context in which changes to A3, twoThetaPosition, Ki, wavelength, twoThetaOffset, sampleOffsetZ or dtype
+        do not recalculate Q. Q is recalculated once, on first use of q, Q, qLocal, correctedTwoTheta or phi.
+
+        Example:
+
+        >>> with df.deferGeometry():
+        >>>     df.wavelength = 2.46
+        >>>     df.twoThetaOffset = 0.3
+        >>>     df.sampleOffsetZ = 0.01
+
+        """
+        self._geometryDeferred = self.__dict__.get('_geometryDeferred',0)+1
+        try:
+            yield self
+        finally:
+            self._geometryDeferred -= 1
+
+    def geometryChanged(self):
+        """Recalculate Q after a change of the geometry, or mark it for recalculation on first use within deferGeometry"""
+        if self.__dict__.get('_geometryDeferred',0) > 0:
+            self._geometryDirty = True
+            self._correctedTwoTheta = None
+            self._phi = None
+            self._qIndex = None
+            self._qExtent = {}
+        else:
+            self.calculateQ()
+
     def calculateQ(self):
         """Calculate Q and qx,qy,qz using the current A3 values"""
+        # Derived angles are recalculated on next access
+        self._geometryDirty = False
+        self._correctedTwoTheta = None
+        self._phi = None
+        self._qIndex = None
+        self._qExtent = {}
         if not (hasattr(self,'Ki') and hasattr(self,'twoTheta')
                 and hasattr(self,'alpha') and hasattr(self,'A3')):
             return 
@@ -465,14 +862,16 @@ class DataFile(object):
             # rotate kf to correct for A3
             zero = np.zeros_like(self.A3)
             ones = np.ones_like(self.A3)
-            self.rotMat = np.array([[np.cos(np.deg2rad(self.A3)),np.sin(np.deg2rad(self.A3)),zero],[-np.sin(np.deg2rad(self.A3)),np.cos(np.deg2rad(self.A3)),zero],[zero,zero,ones]])
-            self.q_temp = self.kf-self.ki
+            self.rotMat = np.array([[np.cos(np.deg2rad(self.A3)),np.sin(np.deg2rad(self.A3)),zero],[-np.sin(np.deg2rad(self.A3)),np.cos(np.deg2rad(self.A3)),zero],[zero,zero,ones]]).astype(self.dtype)
+            self.q_temp = (self.kf-self.ki).astype(self.dtype)
 
             self.q = lazyQ(self.rotMat, self.q_temp)
 
-            self.Q = np.repeat(np.linalg.norm(self.q[0],axis=0),self.countShape[0],axis=0)
+            # The length of q does not depend on A3
+            pixelQ = np.linalg.norm(self.q[0],axis=0)
+            self.Q = np.broadcast_to(pixelQ,(self.countShape[0],*pixelQ.shape[1:]))
         else:
-            self.qLocal = self.ki-self.kf
+            self.qLocal = (self.ki-self.kf).astype(self.dtype)
             self.Q = np.array([np.linalg.norm(self.qLocal,axis=0)])
 
         #self.correctedTwoTheta = 2.0*np.rad2deg(np.arcsin(self.wavelength*self.Q[0]/(4*np.pi)))[np.newaxis].repeat(self.Q.shape[0],axis=0)
@@ -497,15 +896,24 @@ class DataFile(object):
             raise RuntimeError('DataFile does not contain any counts. Look for self.counts but found nothing.')
 
         if maskingFunction is None:
-            if replace:
-                self.mask = np.zeros(self.countShape,dtype=bool)
-            else:
-                self.mask += np.zeros(self.countShape,dtype=bool)
+            mask = compactMask(self.countShape)
         else:
-            if replace:
-                self.mask = maskingFunction(self.phi,**pars).reshape(*self.countShape)
+            # phi is identical for all scan steps. The mask is thus found for the pixels only
+            phi = self.phi
+            if self.fileType.lower() == 'singlecrystal':
+                phi = phi[0]
+            mask = np.asarray(maskingFunction(phi,**pars))
+            if mask.size == np.prod(self.countShape[1:]):
+                mask = compactMask(self.countShape,pixelMask=mask)
             else:
-                self.mask += maskingFunction(self.phi,**pars).reshape(*self.countShape)
+                mask = compactMask.fromArray(mask.reshape(*self.countShape))
+
+        if replace or not hasattr(self,'mask'):
+            self.mask = mask
+        else:
+            if not isinstance(self.mask,compactMask):
+                self.mask = compactMask.fromArray(self.mask)
+            self.mask += mask
         
         
 
@@ -523,7 +931,7 @@ class DataFile(object):
             raise AttributeError('Provided argument is not of type dictionary. Received instance of type {}'.format(type(dictionary)))
 
 
-    @KwargChecker(function=plt.errorbar,include=MPLKwargs)
+    @KwargChecker(function='matplotlib.pyplot.errorbar',include=MPLKwargs)
     def plotDetector(self,ax=None,applyCalibration=True,**kwargs):
         """Plot intensity as function of twoTheta (and vertical position of pixel in 2D)
 
@@ -540,6 +948,7 @@ class DataFile(object):
         """
 
         if ax is None:
+            import matplotlib.pyplot as plt
             fig, ax = plt.subplots()
         else:
             fig = ax.get_figure()
@@ -562,7 +971,8 @@ class DataFile(object):
             if not 'fmt' in kwargs:
                 kwargs['fmt'] = '_'
 
-            ax._err = ax.errorbar(self.twoTheta[np.logical_not(self.mask)],intensity[np.logical_not(self.mask)],intensity_err[np.logical_not(self.mask)],**kwargs)
+            notMasked = np.logical_not(self.mask)
+            ax._err = ax.errorbar(self.twoTheta[notMasked],intensity[notMasked],intensity_err[notMasked],**kwargs)
             ax.set_xlabel(r'$2\theta$ [deg]')
             ax.set_ylabel(r'Counts/mon [arb]')
 
@@ -581,7 +991,7 @@ class DataFile(object):
             ax.format_coord = lambda format_xdata,format_ydata:format_coord(ax,format_xdata,format_ydata)
         else: # plot a 2D image with twoTheta vs z
             # Set all masked out points to Nan
-            intensity[self.mask] = np.nan
+            intensity[np.asarray(self.mask)] = np.nan
 
             if 'colorbar' in kwargs:
                 colorbar = kwargs['colorbar']
@@ -768,15 +1178,7 @@ class DataFile(object):
             return self._counts.reshape(self.countShape)
     
     def countsSliced(self,sl):
-        if self._counts is None:
-            if self.hasBackground:
-                bg = self.background[sl]
-            else:
-                bg = 0
-            with hdf.File(os.path.join(self.folder,self.fileName),mode='r') as f:
-                return np.array(f.get(HDFCounts)[sl])-bg
-        else:
-            return self._counts[sl]
+        return lazyCounts(self,sl).counts()
         
     @property
     def background(self):
@@ -811,39 +1213,112 @@ class DataFile(object):
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             if self.fileType.lower() == 'singlecrystal':
-                return np.divide(self.counts,self.normalization[np.newaxis])
+                return np.divide(self.counts,self.normalization[np.newaxis],dtype=self.dtype)
             else:
-                return np.divide(self.counts,self.normalization)
+                return np.divide(self.counts,self.normalization,dtype=self.dtype)
 
     
     def intensitySliced(self,sl):
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            if self.fileType.lower() == 'singlecrystal':
-                return np.divide(self.countsSliced(sl),self.normalization[np.newaxis])
-            else:
-                return np.divide(self.countsSliced(sl),self.normalization)
-            #return np.divide(self.countsSliced(sl),self.normalization[sl])
+        return lazyCounts(self,sl).intensity()
 
     
 
-    def InteractiveViewer(self,**kwargs):
+    def InteractiveViewer(self,cacheSize=16,prefetch=4,**kwargs):
+        """Interactive viewer of the detector for each scan step. Frames are read from the data file when shown.
+
+        Kwargs:
+
+            - cacheSize (int): Number of frames kept in memory (default 16)
+
+            - prefetch (int): Number of neighbouring frames read together with a requested frame (default 4)
+
+            - kwargs: All other kwargs are passed on to InteractiveViewer.InteractiveViewer
+
+        """
         if not self.fileType.lower() in ['singlecrystal','powder'] :
             raise AttributeError('Interactive Viewer can only be used for the new data files. Either for powder or for a single crystal A3 scan')
-        return InteractiveViewer.InteractiveViewer(self.intensity,self.twoTheta,self.pixelPosition,self.A3,scanParameter = 'A3',scanValueUnit='deg',colorbar=True,**kwargs)
+        from DMCpy import InteractiveViewer
+        frames = lazyFrames(self,cacheSize=cacheSize,prefetch=prefetch)
+        return InteractiveViewer.InteractiveViewer(frames,self.twoTheta,self.pixelPosition,self.A3,scanParameter = 'A3',scanValueUnit='deg',colorbar=True,**kwargs)
 
     @property
     def correctedTwoTheta(self):
-        return 2.0*np.rad2deg(np.arcsin(self.wavelength*self.Q[0]/(4*np.pi)))[np.newaxis].repeat(self.Q.shape[0],axis=0)
+        # Cached and returned as a read-only view broadcast over all scan steps. Reset by calculateQ
+        if getattr(self,'_correctedTwoTheta',None) is None:
+            pixelTwoTheta = 2.0*np.rad2deg(np.arcsin(self.wavelength*self.Q[0]/(4*np.pi)))
+            self._correctedTwoTheta = np.broadcast_to(pixelTwoTheta[np.newaxis],(self.Q.shape[0],*pixelTwoTheta.shape))
+        return self._correctedTwoTheta
 
     
 
     @property
     def phi(self):
-        if self.fileType.lower() == 'singlecrystal':
-            return np.rad2deg(np.arctan2(self.q[None][2],np.linalg.norm(self.q[None][:2],axis=0)))
-        else:
-            return np.rad2deg(np.arctan2(self.qLocal[2],np.linalg.norm(self.qLocal[:2],axis=0)))
+        # Cached and returned as a read-only view broadcast over all scan steps. Reset by calculateQ
+        if getattr(self,'_phi',None) is None:
+            if self.fileType.lower() == 'singlecrystal': # The rotation by A3 around the z axis does not change phi
+                pixelPhi = np.rad2deg(np.arctan2(self.q_temp[2],np.linalg.norm(self.q_temp[:2],axis=0)))
+                self._phi = np.broadcast_to(pixelPhi[np.newaxis],(self.q.rotationMatrix.shape[-1],*pixelPhi.shape))
+            else:
+                self._phi = np.rad2deg(np.arctan2(self.qLocal[2],np.linalg.norm(self.qLocal[:2],axis=0)))
+        return self._phi
+
+    @property
+    def qIndex(self):
+        # KD-tree of the q vectors of all pixels at A3 = 0, i.e. q_temp, for finding the pixels close to a given
+        # position in reciprocal space in any scan step. Built on first use and reset by calculateQ
+        if getattr(self,'_qIndex',None) is None:
+            if self.fileType.lower() != 'singlecrystal':
+                raise AttributeError('Q index is only available for single crystal A3 scans. Got file type {}'.format(self.fileType))
+            from scipy.spatial import cKDTree
+            self._qIndex = cKDTree(self.q_temp.reshape(3,-1).T)
+        return self._qIndex
+
+    @property
+    def sample(self):
+        return self._sample
+
+    @sample.getter
+    def sample(self):
+        return self._sample
+
+    @sample.setter
+    def sample(self,sample):
+        # The data file observes the orientation of its sample to invalidate positions depending on it
+        oldSample = self.__dict__.get('_sample')
+        if hasattr(oldSample,'removeObserver'):
+            oldSample.removeObserver(self.sampleChanged)
+        self._sample = sample
+        if hasattr(sample,'addObserver'):
+            sample.addObserver(self.sampleChanged)
+        self.sampleChanged(sample)
+
+    def sampleChanged(self,sample):
+        """Remove cached positions depending on the orientation of the sample. Called when UB, ROT or projection vectors of the sample change."""
+        self.__dict__.get('_qExtent',{}).pop(True,None)
+
+    def qExtent(self,rlu=False):
+        """Minimal and maximal q of all pixels in all scan steps. Cached until the geometry or the sample orientation changes.
+
+        Kwargs:
+
+            - rlu (bool): If True, q is rotated by the sample ROT into the frame of the projection vectors (default False)
+
+        Returns:
+
+            - extent (array): Minimum and maximum along each axis, shape (3,2)
+
+        """
+        extents = self.__dict__.setdefault('_qExtent',{})
+        version = self.sample.version if rlu else None
+        if not rlu in extents or extents[rlu][0] != version: # Version differs if the sample was changed without notification, e.g. in a copy
+            if self.fileType.lower() == 'singlecrystal':
+                pos = self.q[None].reshape(3,-1)
+            else:
+                pos = self.qLocal.reshape(3,-1)
+            if rlu:
+                pos = np.einsum('ij,jk',self.sample.ROT,pos)
+            extents[rlu] = (version,np.array([np.min(pos,axis=1),np.max(pos,axis=1)]).T)
+        return extents[rlu][1]
         
     def setProjectionVectors(self,p1,p2,p3=None):
         """Set or update the projection vectors used for the View3D
@@ -889,10 +1364,36 @@ class PowderDataFile(DataFile):
         super(PowderDataFile,self).__init__(fileType,*args,**kwargs)
         self.fileType = 'Powder'
 
-        if 'forcePowder' in kwargs:
-            if kwargs['forcePowder']:
-                self._counts = np.sum(self.counts,axis=(0,1))
-                self.countShape = (1,128,1152)
-                self.monitor = np.array([np.sum(self.monitor)])
-        self.counts.shape = (1,128,1152)
+        if kwargs.get('forcePowder',False):
+            # Summed once on loading, counts are afterwards held in memory
+            self._counts = self.sumScanSteps()
+            self.countShape = (1,128,1152)
+            self.monitor = np.array([np.sum(self.monitor)])
+
+    def sumScanSteps(self,memoryBudget=None):
+        """Sum the background subtracted counts of all scan steps stored in the file.
+
+        The counts are read in chunks of scan steps planned by _tools.planSteps, i.e. fitting within the memory budget and aligned to the chunks of the HDF file.
+
+        Kwargs:
+
+            - memoryBudget (int): Memory in bytes available for a chunk (default _tools.memoryBudget)
+
+        Returns:
+
+            - counts (array): Summed counts of shape (128,1152)
+
+        """
+        with hdf.File(os.path.join(self.folder,self.fileName),mode='r') as f:
+            shape = f.get(HDFCounts).shape
+
+        if len(shape) < 3: # Only a single scan step
+            return lazyCounts(self,slice(None)).counts().reshape(shape)
+
+        steps = _tools.planSteps(self,memoryBudget=memoryBudget,shape=shape)
+
+        total = 0
+        for start,stop in _tools.arange(0,shape[0],steps):
+            total = total+lazyCounts(self,slice(start,stop)).counts().sum(axis=0)
+        return total
 
@@ -2,14 +2,13 @@
 import h5py as hdf
 import numpy as np
 import pickle as pickle
-import matplotlib.pyplot as plt
-import pandas as pd
 import shutil
 import os, copy
 import json, os, time
-from DMCpy import DataFile, _tools, Viewer3D, RLUAxes, TasUBlibDEG
+import contextlib
+from DMCpy import DataFile, _tools, TasUBlibDEG, BinnedVolume, Cache
 from DMCpy.FileStructure import shallowRead, HDFCountsBG, HDFTranslation
-from DMCpy._tools import gauss, gauss_fit
+from DMCpy._tools import gauss
 import warnings
 import DMCpy
 
@@ -18,6 +17,7 @@ class DataSet(object):
         """DataSet object to hold a series of DataFile objects
         Kwargs:
             - dataFiles (list): List of data files to be used in reduction (default None)
+            - dtype (dtype): Precision of Q, intensities and binning positions, either np.float64 or np.float32 (default np.float64)
         Raises:
             - NotImplementedError
             - AttributeError
@@ -134,6 +134,19 @@ class DataSet(object):
         for df in self:
             df.sample = sample
 
+    @property
+    def dtype(self):
+        return [df.dtype for df in self]
+
+    @dtype.getter
+    def dtype(self):
+        return [df.dtype for df in self]
+
+    @dtype.setter
+    def dtype(self,dtype):
+        for df in self:
+            df.dtype = dtype
+
     def generateMask(self,maskingFunction = DataFile.maskFunction, replace=True, **pars):
         """Generate mask to applied to data in data file
         
@@ -146,6 +159,7 @@ class DataSet(object):
             d.generateMask(maskingFunction,replace=replace,**pars)
         self._getData()
 
+    @Cache.cached()
     @_tools.KwargChecker()
     def sumDetector(self,twoThetaBins=None,applyCalibration=True,correctedTwoTheta=True,dTheta=0.125):
         """Find intensity as function of either twoTheta or correctedTwoTheta
@@ -160,16 +174,14 @@ class DataSet(object):
             - Total Monitor
         """
 
+        # Flat indices of the points not masked. Monitor, normalization and angles are only expanded for these
+        notMasked = [df.mask.notMasked() for df in self]
+
         if correctedTwoTheta: 
-            twoTheta = np.concatenate([df.correctedTwoTheta[np.logical_not(df.mask)] for df in self],axis=0)
+            twoTheta = np.concatenate([DataFile.lazyWeights(df.correctedTwoTheta,df.countShape)[nM] for df,nM in zip(self,notMasked)],axis=0)
         else:
-            twThetaList = []
-            for df in self:
-                if len(df.twoTheta.shape) == 2: # shape is (df,z,twoTheta), needs to be passed as (df,n,z,twoTheta)
-                    twThetaList.append(df.twoTheta[np.newaxis].repeat(df.countShape[0],axis=0)[np.logical_not(df.mask)]) # n = scan steps
-                else:
-                    twThetaList.append(df.twoTheta[np.logical_not(df.mask)])
-            twoTheta = np.concatenate(twThetaList,axis=0)
+            # twoTheta has either the shape (z,twoTheta) or (n,z,twoTheta) with n scan steps
+            twoTheta = np.concatenate([DataFile.lazyWeights(df.twoTheta,df.countShape)[nM] for df,nM in zip(self,notMasked)],axis=0)
             
             
 
@@ -181,17 +193,14 @@ class DataSet(object):
             anglesMax = np.max(twoTheta)
             twoThetaBins = np.arange(anglesMin-0.5*dTheta,anglesMax+0.51*dTheta,dTheta)
 
-        if self.type.lower() == 'singlecrystal':
-            monitorRepeated = np.array([np.ones(df.countShape)*df.monitor.reshape(-1,1,1) for df in self])
-        else:
-            monitorRepeated = np.concatenate([np.repeat(np.repeat(df.monitor[:,np.newaxis,np.newaxis],df.countShape[-2],axis=1),df.countShape[-1],axis=2)[np.logical_not(df.mask)] for df in self])
+        monitorRepeated = np.concatenate([DataFile.lazyWeights(df.monitor.reshape(-1,1,1),df.countShape)[nM] for df,nM in zip(self,notMasked)])
             
-        counts = np.concatenate([df.counts[np.logical_not(df.mask)] for df in self])
+        counts = np.concatenate([df.counts.reshape(-1)[nM] for df,nM in zip(self,notMasked)])
         
         summedRawIntensity, _ = np.histogram(twoTheta,bins=twoThetaBins,weights=counts)
 
         if applyCalibration:
-            normalization = np.concatenate([np.repeat(df.normalization,df.countShape[0],axis=0)[np.logical_not(df.mask)] for df in self])
+            normalization = np.concatenate([DataFile.lazyWeights(df.normalization,df.countShape)[nM] for df,nM in zip(self,notMasked)])
             summedMonitor, _ = np.histogram(twoTheta,bins=twoThetaBins,weights=monitorRepeated*normalization)
         else:
             summedMonitor, _ = np.histogram(twoTheta,bins=twoThetaBins,weights=monitorRepeated)
@@ -231,7 +240,7 @@ class DataSet(object):
         return twoThetaBins[emptyStartBins:emptyEndBins], normalizedIntensity, normalizedIntensityError,summedMonitor[emptyStartBins:emptyEndBins]
     
 
-    @_tools.KwargChecker(function=plt.errorbar,include=_tools.MPLKwargs)
+    @_tools.KwargChecker(function='matplotlib.pyplot.errorbar',include=_tools.MPLKwargs)
     def plotTwoTheta(self,ax=None,twoThetaBins=None,applyCalibration=True,correctedTwoTheta=True,dTheta=0.125,**kwargs):
         """Plot intensity as function of correctedTwoTheta or twoTheta
         Kwargs:
@@ -257,6 +266,7 @@ class DataSet(object):
             kwargs['fmt'] = '-'
 
         if ax is None:
+            import matplotlib.pyplot as plt
             fig,ax = plt.subplots()
 
         ax._errorbar = ax.errorbar(TwoThetaPositions,normalizedIntensity,yerr=normalizedIntensityError,**kwargs)
@@ -280,7 +290,7 @@ class DataSet(object):
         return ax,twoThetaBins, normalizedIntensity, normalizedIntensityError,summedMonitor
 
     def Viewer3D(self,dqx,dqy,dqz,rlu=True,axis=2, raw=False,  log=False, grid = True, outputFunction=print, 
-                 cmap='viridis', steps=None, multiplicationFactor=1):
+                 cmap='viridis', steps=None, multiplicationFactor=1, fastRendering=False, multiResolution=False):
 
         """Generate a 3D view of all data files in the DatSet.
         
@@ -297,6 +307,8 @@ class DataSet(object):
             - outputFunction (function): Function called when clicking on the figure (default print)
             - cmap (str): Name of color map used for plot (default viridis)
             - multiplicationFactor (float): Multiply intensities with this factor (default 1)
+            - fastRendering (bool): Show planes with imshow and redraw them by blitting when scrolling, see Viewer3D (default False)
+            - multiResolution (bool): Show coarser binnings summed from the binned volume when zoomed out, see Viewer3D (default False)
         """
         if rlu:
             
@@ -334,13 +346,13 @@ class DataSet(object):
         else:
             axes = None
 
-        Data,bins,_ = self.binData3D(dqx,dqy,dqz,rlu=rlu,raw=raw,steps=steps)
+        volume = self.binVolume(dqx,dqy,dqz,rlu=rlu,raw=raw,steps=steps)*multiplicationFactor
 
-        Data*=multiplicationFactor
-
-        return Viewer3D.Viewer3D(Data,bins,axis=axis, ax=axes, grid=grid, log=log, outputFunction=outputFunction, cmap=cmap)
+        from DMCpy import Viewer3D
+        return Viewer3D.Viewer3D(volume,volume.bins,axis=axis, ax=axes, grid=grid, log=log, outputFunction=outputFunction, cmap=cmap, 
+                                 fastRendering=fastRendering, multiResolution=multiResolution)
     
-    def binData3D(self,dqx,dqy,dqz,rlu=True,raw=False,steps=10):
+    def binData3D(self,dqx,dqy,dqz,rlu=True,raw=False,steps=None):
         """
         Bin scattering data in equi-sized bins.
 
@@ -351,82 +363,152 @@ class DataSet(object):
         Kwargs:
             - rlu (bool): flag to choose if data is rotated into rlu or kept in the instrument coordinate system (default True)
             - raw (bool): if True, keep scattering numbers un-normalized (default false)
-            - steps (int): number of simultaneously treated scan steps (default 10)
+            - steps (int): number of simultaneously treated scan steps (default None - chosen from memory budget)
         Returns:
             - Intensities (float): Scattering intensity
             - bins (float): bin edges in 3D
             - Errors (float): Errors corresponding ot the intensities
         """
-        maximas = []
-        minimas = []
-        for df in self:
-            if rlu:
-                pos = np.einsum('ij,jk',df.sample.ROT,df.q[None].reshape(3,-1))
-            else:
-                pos = df.q[None].reshape(3,-1)
-            maximas.append(np.max(pos,axis=1))
-            minimas.append(np.min(pos,axis=1))
+        volume = self.binVolume(dqx,dqy,dqz,rlu=rlu,raw=raw,steps=steps)
+        return volume.data,volume.bins,volume.errors
 
-        maximas = np.max(maximas,axis=0)
-        minimas = np.min(minimas,axis=0)
-        extremePositions = np.array([minimas,maximas]).T
+    @Cache.cached(ignore=['steps'])
+    def binVolume(self,dqx,dqy,dqz,rlu=True,raw=False,steps=None):
+        """
+        Bin scattering data in equi-sized bins keeping the summed intensity, monitor, normalization and bin counts.
+
+        Args:
+            - dqx (float): bin size along x in 1/AA
+            - dqy (float): bin size along y in 1/AA
+            - dqz (float): bin size along z in 1/AA
+        Kwargs:
+            - rlu (bool): flag to choose if data is rotated into rlu or kept in the instrument coordinate system (default True)
+            - raw (bool): if True, keep scattering numbers un-normalized (default false)
+            - steps (int): number of simultaneously treated scan steps (default None - chosen from memory budget)
+        Returns:
+            - BinnedVolume: binned data from which cuts, slices and projections can be made without re-reading the data files
+        """
+        extents = np.array([df.qExtent(rlu=rlu) for df in self])
+        extremePositions = np.array([np.min(extents[:,:,0],axis=0),np.max(extents[:,:,1],axis=0)]).T
         bins = _tools.calculateBins(dqx,dqy,dqz,extremePositions)
 
         returndata = None
         for df in self:
-            
-            if steps is None:
-                steps = len(df)
-            
-            stepsTaken = 0
+            dfSteps = _tools.planSteps(df) if steps is None else steps
 
-                
-            for idx in _tools.arange(0,len(df),steps):
+            for idx in _tools.arange(0,len(df),dfSteps):
                 q = df.q[idx[0]:idx[1]]
-                if raw:
-                    dat = df.countsSliced(slice(idx[0],idx[1]))
-                else:
-                    dat = df.intensitySliced(slice(idx[0],idx[1]))
-                    
+                chunk = DataFile.lazyCounts(df,slice(idx[0],idx[1]))
+                mon = DataFile.lazyWeights(df.monitor[idx[0]:idx[1]].reshape(-1,1,1),chunk.rawCounts.shape)
+                norm = chunk.normalizationWeights()
 
-                mon = df.monitor[idx[0]:idx[1]]
-                mon=np.repeat(np.repeat(mon[:,np.newaxis],dat.shape[1],axis=1)[:,:,np.newaxis],dat.shape[2],axis=-1)
-                
                 print(df.fileName,'from',idx[0],'to',idx[-1])
-                stepsTaken+=steps
 
                 if rlu:
-                    pos = np.einsum('ij,j...',df.sample.ROT,q).transpose(0,3,1,2) # shape -> steps,3,128,1152
+                    pos = np.einsum('ij,j...->i...',df.sample.ROT.astype(df.dtype),q) # shape -> 3,steps,128,1152
+                else:
+                    pos = q
+
+                notMasked = df.mask.notMasked(slice(idx[0],idx[1]))
+                # Background and normalization are only applied to the pixels not masked
+                if raw:
+                    dat = chunk.counts(notMasked)
+                else:
+                    dat = chunk.intensity(notMasked)
+                localReturndata,_ = _tools.binData3D(dqx,dqy,dqz,pos=pos.reshape(3,-1)[:,notMasked],data=dat,
+                                                     norm=norm[notMasked],mon=mon[notMasked],bins=bins)
 
+                if returndata is None:
+                    returndata = localReturndata
                 else:
-                    pos = q.transpose(1,0,2,3)# shape -> steps,3,128,1152
+                    for data,newData in zip(returndata,localReturndata):
+                        data+=newData
 
-                if True:
-                    pos = pos.transpose(1,0,2,3)
-                    boolMask = np.logical_not(df.mask[idx[0]:idx[1]].flatten())
-                    localReturndata,_ = _tools.binData3D(dqx,dqy,dqz,pos=pos.reshape(3,-1)[:,boolMask],data=dat.flatten()[boolMask],mon=mon.flatten()[boolMask],bins = bins)
+        intensity,monitor,normalization,counts = returndata
+        edges = [bins[0][:,0,0],bins[1][0,:,0],bins[2][0,0,:]]
+        return BinnedVolume.BinnedVolume(intensity=intensity,monitor=monitor,counts=counts,normalization=normalization,edges=edges,
+                                         rlu=rlu,sample=copy.deepcopy(self[0].sample))
 
-                    if returndata is None:
-                        returndata = localReturndata
-                    else:
+    def integratePeaks(self,HKLs,radius=0.05,backgroundRadii=(1.5,2.0),UB=None,steps=None,processes=1):
+        """Integrate Bragg peaks in Q space within ellipsoids around their nominal positions, subtracting a background
+        found in an ellipsoidal shell around each peak.
 
-                        
-                        for data,newData in zip(returndata,localReturndata):
-                            data+=newData
-                    
-        with warnings.catch_warnings() as w:
-            warnings.simplefilter("ignore")
-            intensities = np.divide(returndata[0],returndata[1])
-            errors = np.divide(np.sqrt(returndata[0]),returndata[1])
-        NaNs = returndata[-1]==0
-        intensities[NaNs]=np.nan
-        errors[NaNs]=np.nan
-        return intensities,bins,errors
+        The ellipsoid of each peak has its axes along Q (longitudinal), perpendicular to Q in the horizontal plane
+        (transverse) and vertical. Pixels close to the peaks are found from the Q index of each data file, such that
+        only these pixels are treated. All peaks are integrated in a single pass over the counts of each data file.
 
-    @_tools.KwargChecker()
-    @_tools.overWritingFunctionDecorator(RLUAxes.createRLUAxes)
-    def createRLUAxes(*args,**kwargs): # pragma: no cover
-        raise RuntimeError('This code is not meant to be run but rather is to be overwritten by decorator. Something is wrong!! Should run {}'.format(RLUAxes.createRLUAxes))
+        Args:
+
+            - HKLs (list): List of reflections (H,K,L) to be integrated
+
+        Kwargs:
+
+            - radius (float or list): Semi-axes of the peak ellipsoid in 1/AA, either one value or longitudinal, transverse and vertical (default 0.05)
+
+            - backgroundRadii (list): Inner and outer size of background shell relative to the peak ellipsoid (default (1.5,2.0))
+
+            - UB (array): UB matrix used to find the peak positions (default None - UB of the sample of each data file)
+
+            - steps (int): number of simultaneously treated scan steps (default None - chosen from memory budget)
+
+            - processes (int): Number of processes treating data files in parallel (default 1)
+
+        Returns:
+
+            - table (structured array): One row per reflection with fields H, K, L, Q (length of Q in 1/AA),
+              intensity (background subtracted and normalized by monitor), error, background (per pixel),
+              peakPixels and backgroundPixels (number of pixels used)
+
+        """
+        HKLs = np.asarray(HKLs,dtype=float).reshape(-1,3)
+        radius = np.asarray(radius,dtype=float).flatten()
+        if not len(radius) in [1,3]:
+            raise AttributeError('Radius must be a single value or three semi-axes (longitudinal, transverse, vertical). Got {}'.format(radius))
+        radius = np.broadcast_to(radius,(3,)).copy()
+        backgroundRadii = np.asarray(backgroundRadii,dtype=float)
+        if np.any(radius<=0) or len(backgroundRadii) != 2 or backgroundRadii[0] < 1.0 or backgroundRadii[1] <= backgroundRadii[0]:
+            raise AttributeError('Peak radius must be positive and background radii (inner,outer) must satisfy 1 <= inner < outer. Got {} and {}'.format(radius,backgroundRadii))
+
+        for df in self:
+            if df.fileType.lower() != 'singlecrystal':
+                raise AttributeError('Peak integration is only possible for single crystal A3 scans. {} is of type {}'.format(df.fileName,df.fileType))
+
+        arguments = [(df,np.dot(df.sample.UB if UB is None else UB,HKLs.T).T,radius,backgroundRadii,steps) for df in self]
+        if processes > 1 and len(self) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_integratePeaksInFile,*zip(*arguments)))
+        else:
+            results = [_integratePeaksInFile(*args) for args in arguments]
+
+        # Sums are additive across data files
+        sums = np.sum(results,axis=0)
+        peakIntensity,peakVariance,peakPixels,backgroundIntensity,backgroundVariance,backgroundPixels = sums
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            background = np.divide(backgroundIntensity,backgroundPixels)
+            scale = np.divide(peakPixels,backgroundPixels)
+        noBackground = backgroundPixels == 0
+        background[noBackground] = np.nan
+        scale[noBackground] = 0.0
+
+        table = np.zeros(len(HKLs),dtype=[('H',float),('K',float),('L',float),('Q',float),('intensity',float),('error',float),
+                                          ('background',float),('peakPixels',int),('backgroundPixels',int)])
+        table['H'],table['K'],table['L'] = HKLs.T
+        table['Q'] = np.linalg.norm(np.dot(self[0].sample.UB if UB is None else UB,HKLs.T),axis=0)
+        table['intensity'] = peakIntensity-scale*backgroundIntensity
+        table['error'] = np.sqrt(peakVariance+scale**2*backgroundVariance)
+        table['background'] = background
+        table['peakPixels'] = peakPixels
+        table['backgroundPixels'] = backgroundPixels
+        return table
+
+    @_tools.KwargChecker(function='DMCpy.RLUAxes.createRLUAxes')
+    def createRLUAxes(*args,**kwargs):
+        """Create a reciprocal lattice plot for the DataSet. See RLUAxes.createRLUAxes"""
+        from DMCpy import RLUAxes
+        return RLUAxes.createRLUAxes(*args,**kwargs)
 
         
     def plotCut1D(self,P1,P2,rlu=True,stepSize=0.01,width=0.05,widthZ=0.05,raw=False,optimize=True,ax=None,steps=None,**kwargs):
@@ -478,133 +560,136 @@ class DataSet(object):
             - Pos,Int, Errors
             
         """
-        intensities = None
+        return self.cut1DMultiple([[P1,P2]],rlu=rlu,stepSize=stepSize,width=width,widthZ=widthZ,raw=raw,optimize=optimize,steps=steps)[0]
+
+    @Cache.cached(ignore=['steps'])
+    def cut1DMultiple(self,cuts,rlu=True,stepSize=0.01,width=0.05,widthZ=0.05,raw=False,optimize=True,steps=None):
+        """Perform several 1D cuts in a single pass over the data. Each chunk of A3 steps is read and
+        projected once and histogrammed into all cuts whose envelope it intersects.
+
+        Args:
+            - cuts (list): List of cuts given as [P1,P2] pairs in either (Qx,Qy,Qz) or (H,K,L)
+        Kwargs:
+            - rlu (bool): If True, P1 and P2 are in HKL, otherwise in QxQyQz (default True)
+            - stepSize (float or list): Size of bins along cut direction in units of [1/AA], either common or one per cut (default 0.01)
+            - width (float or list): Integration width orthogonal to cut in units of [1/AA], either common or one per cut (default 0.05)
+            - raw (bool): If True, do not normalize data (default False)
+            - optimize (bool): If True, only pixels within the bounding box of a cut are projected (default True)
+            - steps (int): Number of A3 steps treated simultaneously (default None - chosen from memory budget)
+        Returns:
+            - List of [Pos,Int,Errors] with one entry per cut
+
+        Example:
+
+        >>> cuts = [[[h,0,0],[h,0,2]] for h in np.linspace(0.5,1.5,21)]
+        >>> results = ds.cut1DMultiple(cuts,width=0.05,stepSize=0.01)
+        >>> for positionVector,I,err in results:
+        ...     plt.errorbar(positionVector[2],I,err)
+
+        """
+        cuts = [[np.asarray(P1,dtype=float),np.asarray(P2,dtype=float)] for P1,P2 in cuts]
+        if len(cuts) == 0:
+            raise AttributeError('No cuts provided.')
+
+        stepSizes = np.broadcast_to(np.asarray(stepSize,dtype=float),(len(cuts),))
+        widths = np.broadcast_to(np.asarray(width,dtype=float),(len(cuts),))
+
+        intensities = [None]*len(cuts)
+        normCounts = [None]*len(cuts)
+        monitors = [None]*len(cuts)
+        cutDefinitions = [None]*len(cuts)
+
         for df in self:
-            if rlu:
-                QStart = df.sample.calculateHKLToQxQyQz(*P1)
-                QStop  = df.sample.calculateHKLToQxQyQz(*P2)
-            else:
-                QStart = P1
-                QStop  = P2
-            
-            
-            directionVector = (QStop-QStart).reshape(3,1)
-            length = np.linalg.norm(directionVector)
-            if np.isclose(length,0.0):
-                raise AttributeError('The vector connecting the cut points has length 0. Received P1={}, P2={}'.format(','.join([str(x) for x in P1]),','.join([str(x) for x in P2])))
-            directionVector*=1.0/length
-            
-            stopAlong = np.dot(QStop-QStart,directionVector)[0]
-            sign = np.sign(stopAlong)
-            
-            bins = np.arange(-stepSize*0.5,np.abs(stopAlong)+stepSize*0.51,stepSize)
-            
-            intensity = []
-            pos = []
-            if steps is None:
-                steps = len(df)
-            for idx in _tools.arange(0,len(df),steps):
-                print(df.fileName,'from',idx[0],'to',idx[-1])
-                if not raw:
-                    data = df.intensitySliced(slice(idx[0],idx[1]))
+            # Cut geometry depends on the sample of the individual data file
+            for I,((P1,P2),stepSize,width) in enumerate(zip(cuts,stepSizes,widths)):
+                if rlu:
+                    QStart = df.sample.calculateHKLToQxQyQz(*P1)
+                    QStop  = df.sample.calculateHKLToQxQyQz(*P2)
                 else:
-                    data = df.countsSliced(slice(idx[0],idx[1]))
+                    QStart = P1
+                    QStop  = P2
+
+                directionVector = (QStop-QStart).reshape(3,1)
+                length = np.linalg.norm(directionVector)
+                if np.isclose(length,0.0):
+                    raise AttributeError('The vector connecting the cut points has length 0. Received P1={}, P2={}'.format(','.join([str(x) for x in P1]),','.join([str(x) for x in P2])))
+                directionVector*=1.0/length
+
+                stopAlong = np.dot(QStop-QStart,directionVector)[0]
+                sign = np.sign(stopAlong)
+
+                bins = np.arange(-stepSize*0.5,np.abs(stopAlong)+stepSize*0.51,stepSize)
+
+                # Axis aligned bounding box of the cylinder including the extra step at both ends
+                ends = np.array([QStart-stepSize*directionVector[:,0],QStop+stepSize*directionVector[:,0]])
+                boxMin = ends.min(axis=0)-0.5*width
+                boxMax = ends.max(axis=0)+0.5*width
+
+                cutDefinitions[I] = {'QStart':QStart,'directionVector':directionVector,'stopAlong':stopAlong,'sign':sign,
+                                     'bins':bins,'stepSize':stepSize,'width':width,'boxMin':boxMin,'boxMax':boxMax}
+
+            dfSteps = _tools.planSteps(df) if steps is None else steps
+            for idx in _tools.arange(0,len(df),dfSteps):
+                print(df.fileName,'from',idx[0],'to',idx[-1])
+                chunk = DataFile.lazyCounts(df,slice(idx[0],idx[1]))
+                position = df.q[idx[0]:idx[1]].reshape(3,-1)
+
                 if optimize:
-                
-                    optimizationStepInPlane = 0.05
-                    optimizationStepInPlane = np.min([optimizationStepInPlane,width*0.6])
-
-                    ## Define boundig box
-                    direction = QStop-QStart
-                    directionLength=np.linalg.norm(direction)
-                    direction*=1.0/directionLength
-                    orthogonal = np.cross(direction,np.array([0,0,1]))
-                    orthogonalVertical = np.cross(direction,orthogonal)
-
-
-                    # Factor between actual cut and width used for cutoff
-                    expansionFactor = 1.15
-                    effectiveWidth = expansionFactor*width
-                        
-                    startEdge = QStart.reshape(3,1)+np.arange(-effectiveWidth*0.5,effectiveWidth*0.51,optimizationStepInPlane).reshape(1,-1)*orthogonal.reshape(3,1)-stepSize*direction.reshape(3,1)
-                    endEdge = QStop.reshape(3,1)+np.arange(-effectiveWidth*0.5,effectiveWidth*0.51,optimizationStepInPlane).reshape(1,-1)*orthogonal.reshape(3,1)+stepSize*direction.reshape(3,1)
-                    rightEdge = QStart.reshape(3,1)+0.5*effectiveWidth*orthogonal.reshape(3,1)+np.arange(-stepSize,directionLength+stepSize,optimizationStepInPlane)*direction.reshape(3,1)
-                    leftEdge =  QStart.reshape(3,1)-0.5*effectiveWidth*orthogonal.reshape(3,1)+np.arange(-stepSize,directionLength+stepSize,optimizationStepInPlane)*direction.reshape(3,1)
-
-                    voff = (effectiveWidth*0.5*orthogonalVertical).reshape(3,1)
-
-                    checkPositions = np.concatenate([startEdge+voff,endEdge+voff,
-                                                    rightEdge+voff,leftEdge+voff,
-                                                    startEdge-voff,endEdge-voff,
-                                                    rightEdge-voff,leftEdge-voff],axis=1)
-                    # Calculate the corresponding A3, A4, and Z positions
-
-                    A3,A4,Z = np.array([TasUBlibDEG.converterToA3A4Z(*pos,df.Ki,df.Ki,A4Sign=-1,radius=df.radius) for pos in checkPositions.T]).T
-
-                    # remove nan-values
-                    A4NonNaN = np.logical_not(np.isnan(A4))
-                    A3 = A3[A4NonNaN]
-                    A4 = A4[A4NonNaN]
-                    Z = Z[A4NonNaN]
-                    
-
-                    A3Min,A3Max = [f(A3) for f in [np.nanmin,np.nanmax]]
-                    A4Min,A4Max = [f(A4) for f in [np.nanmin,np.nanmax]]
-                    ZMin,ZMax = [f(Z) for f in [np.nanmin,np.nanmax]]
-
-                    # Find and sort ascending the indices        
-                    twoThetaInside = np.logical_and(df.twoTheta[0]>A4Min,df.twoTheta[0]<A4Max)
-                    A3Inside = np.logical_and(df.A3[idx[0]:idx[1]]>A3Min,df.A3[idx[0]:idx[1]]<A3Max)
-                    ZInside = np.logical_and(df.verticalPosition>ZMin,df.verticalPosition<ZMax)
-
-
-                    mask = np.zeros_like(data,dtype=bool)
-                    mask[A3Inside,:,:]=True
-                    mask[:,:,twoThetaInside]=True
-                    mask[:,ZInside,:]=True
-
-                    data = data[mask]
-                    relativePosition = df.q[idx[0]:idx[1]][:,mask]-QStart.reshape(3,-1)
-
-                    
-                else:
-                    relativePosition = df.q[idx[0]:idx[1]].reshape(3,-1)-QStart.reshape(3,-1)
-                
-                along = np.einsum('ij,i...->...j',relativePosition,directionVector)
-                    
-                orthogonal = np.linalg.norm(relativePosition-along*directionVector,axis=0)
-                
-                orthogonal = np.linalg.norm(relativePosition-along*directionVector,axis=0)
-                test1 = (orthogonal<width*0.5).flatten()
-                test2 = (along[0]>-stepSize).flatten()
-                test3 = (along[0]<np.linalg.norm(stopAlong)+stepSize).flatten()
-                
-                insideQ = np.all([test1,test2,test3],axis=0)
-            
-                intensity = data.flatten()[insideQ]
-                pos = sign*along.flatten()[insideQ]
+                    chunkMin = position.min(axis=1)
+                    chunkMax = position.max(axis=1)
+
+                for I,cut in enumerate(cutDefinitions):
+                    QStart = cut['QStart'].reshape(3,1).astype(position.dtype)
+                    if optimize:
+                        if np.any(chunkMax<cut['boxMin']) or np.any(chunkMin>cut['boxMax']):
+                            inside = np.zeros(0,dtype=int)
+                        else:
+                            inside = np.flatnonzero(np.all(np.logical_and(position>=cut['boxMin'].reshape(3,1),position<=cut['boxMax'].reshape(3,1)),axis=0))
+                        relativePosition = position[:,inside]-QStart
+                    else:
+                        inside = np.arange(position.shape[1])
+                        relativePosition = position-QStart
 
-                    
-                weights = [intensity]
-                _intensities,_normCounts = _tools.histogramdd(pos.reshape(-1,1),bins=[bins],weights=weights,returnCounts=True)
-                _monitors = np.full_like(_intensities,df.monitor[0])
-                if intensities is None:
-                    intensities,normCounts,monitors = _intensities,_normCounts,_monitors
-                else:
-                    intensities+=_intensities
-                    normCounts+=_normCounts
-                    monitors += _monitors
-            
-        I = np.divide(intensities,monitors)
-        errors = np.divide(np.sqrt(intensities),monitors)
-        I[normCounts==0]=np.nan
-        I[errors==0]=np.nan
-        binCentres = 0.5*(bins[:-1]+bins[1:])
-        
-        positionVector = directionVector*binCentres+QStart.reshape(3,1)
-        if rlu:
-            positionVector = np.array([self[-1].sample.calculateQxQyQzToHKL(*bC) for bC in positionVector.T]).T
-        return positionVector,I,errors
+                    directionVector = cut['directionVector'].astype(position.dtype)
+                    along = np.einsum('ij,i...->...j',relativePosition,directionVector)
+                    orthogonal = np.linalg.norm(relativePosition-along*directionVector,axis=0)
+
+                    test1 = (orthogonal<cut['width']*0.5).flatten()
+                    test2 = (along[0]>-cut['stepSize']).flatten()
+                    test3 = (along[0]<np.linalg.norm(cut['stopAlong'])+cut['stepSize']).flatten()
+
+                    insideQ = np.all([test1,test2,test3],axis=0)
+
+                    # Background and normalization are only applied to the pixels inside the cut
+                    if raw:
+                        intensity = chunk.counts(inside[insideQ])
+                    else:
+                        intensity = chunk.intensity(inside[insideQ])
+                    pos = cut['sign']*along.flatten()[insideQ]
+
+                    weights = [intensity]
+                    _intensities,_normCounts = _tools.histogramdd(pos.reshape(-1,1),bins=[cut['bins']],weights=weights,returnCounts=True)
+                    _monitors = np.full_like(_intensities,df.monitor[0])
+                    if intensities[I] is None:
+                        intensities[I],normCounts[I],monitors[I] = _intensities,_normCounts,_monitors
+                    else:
+                        intensities[I]+=_intensities
+                        normCounts[I]+=_normCounts
+                        monitors[I] += _monitors
+
+        results = []
+        for cut,intensity,normCount,monitor in zip(cutDefinitions,intensities,normCounts,monitors):
+            I = np.divide(intensity,monitor)
+            errors = np.divide(np.sqrt(intensity),monitor)
+            I[normCount==0]=np.nan
+            I[errors==0]=np.nan
+            binCentres = 0.5*(cut['bins'][:-1]+cut['bins'][1:])
+
+            positionVector = cut['directionVector']*binCentres+cut['QStart'].reshape(3,1)
+            if rlu:
+                positionVector = np.array([self[-1].sample.calculateQxQyQzToHKL(*bC) for bC in positionVector.T]).T
+            results.append([positionVector,I,errors])
+        return results
 
 
     def saveSampleToDisk(self,fileName=None,dataFolder=None):
@@ -636,23 +721,24 @@ class DataSet(object):
         """
         sampleLoaded = _tools.loadSampleFromDesk(filePath)
         
-        for df in self:
+        with self.deferSampleNotifications():
+            for df in self:
 
-            df.sample.ROT = sampleLoaded.ROT
-            df.sample.P1  = sampleLoaded.P1 
-            df.sample.P2  = sampleLoaded.P2 
-            df.sample.P3  = sampleLoaded.P3 
+                df.sample.ROT = sampleLoaded.ROT
+                df.sample.P1  = sampleLoaded.P1 
+                df.sample.P2  = sampleLoaded.P2 
+                df.sample.P3  = sampleLoaded.P3 
 
-            df.sample.offsetA3 = sampleLoaded.offsetA3
-            df.sample.RotationToScatteringPlane = sampleLoaded.RotationToScatteringPlane
-            df.sample.foundPeakPositions = sampleLoaded.foundPeakPositions
+                df.sample.offsetA3 = sampleLoaded.offsetA3
+                df.sample.RotationToScatteringPlane = sampleLoaded.RotationToScatteringPlane
+                df.sample.foundPeakPositions = sampleLoaded.foundPeakPositions
 
-            df.sample.projectionVectors = sampleLoaded.projectionVectors
+                df.sample.projectionVectors = sampleLoaded.projectionVectors
             
-            df.sample.projectionB = sampleLoaded.projectionB
-            df.sample.UB = sampleLoaded.UB
+                df.sample.projectionB = sampleLoaded.projectionB
+                df.sample.UB = sampleLoaded.UB
             
-            df.sample.peakUsedForAlignment = sampleLoaded.peakUsedForAlignment
+                df.sample.peakUsedForAlignment = sampleLoaded.peakUsedForAlignment
         
         print('UB loaded')
 
@@ -844,23 +930,24 @@ class DataSet(object):
         # 10) 
         # sample rotation has now been found (converts between instrument 
         # qx,qy,qz to qx along planeVector1 and qy along planeVector2)
-        for df in self:
-            sample = df.sample
-            sample.ROT = rotation
-            sample.P1 = _tools.LengthOrder(planeVector1)
-            sample.P2 = _tools.LengthOrder(planeVector2)
-            sample.P3 = _tools.LengthOrder(scatteringNormal)
+        with self.deferSampleNotifications():
+            for df in self:
+                sample = df.sample
+                sample.ROT = rotation
+                sample.P1 = _tools.LengthOrder(planeVector1)
+                sample.P2 = _tools.LengthOrder(planeVector2)
+                sample.P3 = _tools.LengthOrder(scatteringNormal)
 
-            sample.offsetA3 = offsetA3
-            sample.RotationToScatteringPlane = RotationToScatteringPlane
-            sample.foundPeakPositions = foundPeakPositions
+                sample.offsetA3 = offsetA3
+                sample.RotationToScatteringPlane = RotationToScatteringPlane
+                sample.foundPeakPositions = foundPeakPositions
 
-            sample.projectionVectors = np.array([sample.P1,sample.P2,sample.P3]).T
+                sample.projectionVectors = np.array([sample.P1,sample.P2,sample.P3]).T
             
-            sample.projectionB = np.diag(np.linalg.norm(np.dot(sample.projectionVectors.T,sample.B),axis=1))
-            sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
+                sample.projectionB = np.diag(np.linalg.norm(np.dot(sample.projectionVectors.T,sample.B),axis=1))
+                sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
             
-            sample.peakUsedForAlignment = peakUsedForAlignment
+                sample.peakUsedForAlignment = peakUsedForAlignment
 
 
     
@@ -1030,23 +1117,24 @@ class DataSet(object):
         # 10) 
         # sample rotation has now been found (converts between instrument 
         # qx,qy,qz to qx along planeVector1 and qy along planeVector2)
-        for df in self:
-            sample = df.sample
-            sample.ROT = rotation
-            sample.P1 = _tools.LengthOrder(planeVector1)
-            sample.P2 = _tools.LengthOrder(planeVector2)
-            sample.P3 = _tools.LengthOrder(scatteringNormal)
+        with self.deferSampleNotifications():
+            for df in self:
+                sample = df.sample
+                sample.ROT = rotation
+                sample.P1 = _tools.LengthOrder(planeVector1)
+                sample.P2 = _tools.LengthOrder(planeVector2)
+                sample.P3 = _tools.LengthOrder(scatteringNormal)
 
-            sample.offsetA3 = offsetA3
-            sample.RotationToScatteringPlane = RotationToScatteringPlane
-            sample.foundPeakPositions = foundPeakPositions
+                sample.offsetA3 = offsetA3
+                sample.RotationToScatteringPlane = RotationToScatteringPlane
+                sample.foundPeakPositions = foundPeakPositions
 
-            sample.projectionVectors = np.array([sample.P1,sample.P2,sample.P3]).T
+                sample.projectionVectors = np.array([sample.P1,sample.P2,sample.P3]).T
             
-            sample.projectionB = np.diag(np.linalg.norm(np.dot(sample.projectionVectors.T,sample.B),axis=1))
-            sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
+                sample.projectionB = np.diag(np.linalg.norm(np.dot(sample.projectionVectors.T,sample.B),axis=1))
+                sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
             
-            sample.peakUsedForAlignment = peakUsedForAlignment 
+                sample.peakUsedForAlignment = peakUsedForAlignment 
 
 
     def alignToRef(self,coordinates,planeVector1,planeVector2,optimize=False,axisOffset=0.0):
@@ -1118,23 +1206,24 @@ class DataSet(object):
         # 8. sample rotation has now been found (converts between instrument  qx,qy,qz to qx along planeVector1 and qy along planeVector2)
 
         # 9. update sample
-        for df in self:
-            sample = df.sample
-            sample.ROT = rotation
-            sample.P1 = _tools.LengthOrder(planeVector1)
-            sample.P2 = _tools.LengthOrder(planeVector2)
-            sample.P3 = _tools.LengthOrder(scatteringNormal)
+        with self.deferSampleNotifications():
+            for df in self:
+                sample = df.sample
+                sample.ROT = rotation
+                sample.P1 = _tools.LengthOrder(planeVector1)
+                sample.P2 = _tools.LengthOrder(planeVector2)
+                sample.P3 = _tools.LengthOrder(scatteringNormal)
 
-            sample.offsetA3 = offsetA3
-            sample.RotationToScatteringPlane = RotationToScatteringPlane
-            sample.foundPeakPositions = coordinates
+                sample.offsetA3 = offsetA3
+                sample.RotationToScatteringPlane = RotationToScatteringPlane
+                sample.foundPeakPositions = coordinates
 
-            sample.projectionVectors = np.array([sample.P1,sample.P2,sample.P3]).T
+                sample.projectionVectors = np.array([sample.P1,sample.P2,sample.P3]).T
             
-            sample.projectionB = np.diag(np.linalg.norm(np.dot(sample.projectionVectors.T,sample.B),axis=1))
-            sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
+                sample.projectionB = np.diag(np.linalg.norm(np.dot(sample.projectionVectors.T,sample.B),axis=1))
+                sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
             
-            sample.peakUsedForAlignment = peakUsedForAlignment 
+                sample.peakUsedForAlignment = peakUsedForAlignment 
 
     def alignToRefs(self,q1,q2,HKL1,HKL2):
         """Generate UB matrix from two Q-points with corresponding HKL values
@@ -1186,15 +1275,16 @@ class DataSet(object):
         points = np.asarray([[0.0,0.0,0.0],pV1q,pV2q])
         rot,tr = _tools.calculateRotationMatrixAndOffset2(points)
         
-        for s in self.sample:
+        with self.deferSampleNotifications():
+            for s in self.sample:
             
-            s.UB = newUB
-            s.P1 = projectionVector1
-            s.P2 = projectionVector2
-            s.P3 = projectionVector3
-            s.ROT = rot
+                s.UB = newUB
+                s.P1 = projectionVector1
+                s.P2 = projectionVector2
+                s.P3 = projectionVector3
+                s.ROT = rot
         
-            s.projectionVectors = np.array([s.P1,s.P2,s.P3]).T
+                s.projectionVectors = np.array([s.P1,s.P2,s.P3]).T
 
 
     def peakSearch(self,threshold=30,dx=0.04,dy=0.04,dz=0.08,distanceThreshold=0.15):
@@ -1287,14 +1377,15 @@ class DataSet(object):
 
         rotation = np.dot(_tools.rotMatrix(np.array([0,0,1.0]),-offsetA3),RotationToScatteringPlane.T)
 
-        for df in self:
-            sample = df.sample
-            sample.ROT = rotation
-            sample.offsetA3 = offsetA3
-            sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
+        with self.deferSampleNotifications():
+            for df in self:
+                sample = df.sample
+                sample.ROT = rotation
+                sample.offsetA3 = offsetA3
+                sample.UB = np.dot(sample.ROT.T,np.dot(sample.projectionB,np.linalg.inv(sample.projectionVectors)))
 
 
-    def boxIntegration(self,peakDic,roi=True,saveFig=False,title=None,integrationList=None,closeFigures=False,plane=None):
+    def boxIntegration(self,peakDic,roi=True,saveFig=False,title=None,integrationList=None,closeFigures=False,plane=None,plot=True):
         """
 
         boxIntegration creates a region of interest on the detector (roi) and sum all intensity in the roi for a range of A3. 
@@ -1342,86 +1433,52 @@ class DataSet(object):
         title=None, Title for A3 figure
         integrationList=None, if you only want to integrate some peaks in your dictonary, give a list with str for the peak name
         closeFigures=False, for closing figures after a peak is integrated
+        plot=True, if False no figures are created, e.g. for batch integration without display
+
+        Only the detector region of each peak is read from the data files. Peaks are treated grouped by data file,
+        such that each file is opened once. All rocking curves are then fitted together using _tools.fitGaussians.
 
         returns peakDic with:
                 peakDic[peak]['summed_counts'] = np.sum(counts)
                 peakDic[peak]['peak_cut'] = [xdata,ydata]
                 peakDic[peak]['fit'] = [H,x0,sigma,FWHM,integrated]
+                peakDic[peak]['fit_errors'] = [dH,dx0,dsigma,dFWHM,dintegrated]
         
         """
+        if plot:
+            import matplotlib.pyplot as plt
 
         if integrationList is None:
             integrationList = []
             for peak in peakDic: 
                 integrationList.append(peak)
 
+        # Group peaks by data file
+        peaksInFile = {}
         for peak in peakDic:
-        
             if peak in integrationList:
-                        
-                df = self[peakDic[peak]['df']]   
-                
-                # vertical range in pixcel
-                startZ = peakDic[peak]['startZ']
-                stopZ = peakDic[peak]['stopZ']
-                
-                # # # peak position
-                tth = np.abs(peakDic[peak]['tth'])
-                tth_minus = peakDic[peak]['tth_minus']
-                tth_pluss = peakDic[peak]['tth_pluss']
-                
-                # # # twoTheta range
-                startThetaVal = -(tth - tth_minus)
-                stopThetaVal = -(tth +  tth_pluss)
-                
-                startTheta = np.argmin(np.abs(df.twoTheta[64]-startThetaVal))
-                stopTheta = np.argmin(np.abs(df.twoTheta[64]-stopThetaVal))
-                
-                # # # A3 range
-                A3_center = peakDic[peak]['A3_center']
-                A3_minus = peakDic[peak]['A3_minus']
-                A3_pluss = peakDic[peak]['A3_pluss']
-                
-                # Find index of A3
-                absolute_differences = np.abs(df.A3 - A3_center)
-                A3_center = np.argmin(absolute_differences)
-                
-                startA3 = A3_center - A3_minus
-                stopA3 = A3_center + A3_pluss
-                
-                a3StepDegrees=(max(df.A3)-min(df.A3))/len(df.A3)
-                A3Steps = abs(stopA3-startA3)
-                A3StepSign = np.sign(stopA3-startA3)
-                sttRange = (stopA3-startA3)*a3StepDegrees*2
-                
-                sttStepDegreesToIndex = np.diff(df.twoTheta[65])[0]
-                sttSteps = A3StepSign*sttRange/sttStepDegreesToIndex
-                sttOffset = np.linspace(-sttSteps*0.5,sttSteps*0.5,A3Steps).astype(int)
-                
-                countsAllTwoTheta = df.intensity[startA3:stopA3,startZ:stopZ,:].sum(axis=(1))
-                monitors = df.monitor[startA3:stopA3]
-                
-                counts = []
-                
-                for i,offset in enumerate(sttOffset):
-                    counts.append(countsAllTwoTheta[i,startTheta+offset:stopTheta+offset].sum())
-                
-                counts = np.asarray(counts) / monitors 
-                
-                xdata = df.A3[startA3:stopA3]
-                ydata = counts
-                
-                H, A, x0, sigma = gauss_fit(xdata, ydata)
-                FWHM = 2.35482 * sigma
-               
+                peaksInFile.setdefault(peakDic[peak]['df'],[]).append(peak)
+
+        cuts = {}
+        for dfIndex,peaks in peaksInFile.items():
+            df = self[dfIndex]
+            with (hdf.File(os.path.join(df.folder,df.fileName),mode='r') if df._counts is None else contextlib.nullcontext()) as f:
+                for peak in peaks:
+                    cuts[peak] = self._boxIntegrationCut(df,f,peak,peakDic,roi=roi,saveFig=saveFig,closeFigures=closeFigures,plot=plot)
+
+        # Fit all rocking curves simultaneously
+        peaks = list(cuts.keys())
+        fits = _tools.fitGaussians([cuts[peak][0] for peak in peaks],[cuts[peak][1] for peak in peaks])
+
+        for peak,fit in zip(peaks,fits):
+            xdata,ydata,monitors = cuts[peak]
+            H, A, x0, sigma, FWHM, integrated = [fit[name] for name in _tools.gaussFitFields]
+
+            if plot:
                 #Now calculate more points for the plot
                 step = 0.01
-                plotx = []
-                ploty = []
-                
-                for value in np.arange(min(xdata),max(xdata)+step,step):
-                    plotx.append(value)
-                    ploty.append(gauss(value, H, A, x0, sigma))
+                plotx = np.arange(min(xdata),max(xdata)+step,step)
+                ploty = gauss(plotx, H, A, x0, sigma)
                 
                 fig,ax = plt.subplots()
                 ax.plot(xdata, ydata, 'bo--', linewidth=1, markersize=6,label='data')
@@ -1437,61 +1494,146 @@ class DataSet(object):
                 
                 if saveFig is not False:
                         fig.savefig(saveFig+f'{peak}.png',format='png')    
-                
-                # integrated intensity of peak
-                integrated = A * np.sqrt(2*np.pi) * np.abs(sigma)    # this is wrong?
-                
-                print(f'\nFit of {peak} yields:')
-                print('The offset of the gaussian baseline is', np.round(H,5))
-                print('The center of the gaussian fit is', np.round(x0,3))
-                print('The sigma of the gaussian fit is', np.round(sigma,5))
-                print('The maximum intensity of the gaussian fit is', np.round(H + A,3))
-                print('The Amplitude of the gaussian fit is', np.round(A,3))
-                print('The FWHM of the gaussian fit is', np.round(FWHM,3))
-                print('The integrated intensity is',np.round(integrated,3))   # this is wrong?
-                ################################################
-                
-                # export integrated intensities
-                peakDic[peak]['summed_counts'] = np.sum(counts)
-                peakDic[peak]['peak_cut'] = [xdata,ydata]
-                peakDic[peak]['monitors'] = monitors
-                peakDic[peak]['fit'] = [H,x0,sigma,FWHM,integrated]
-                
-                if roi:
-                    # plot rois
-                    total = len(df.A3[startA3:stopA3])
-                    rows = int(np.floor(np.sqrt(total)))
-                    cols = int(np.ceil(np.sqrt(total)))
-                    
-                    fig,Ax = plt.subplots(nrows=rows,ncols=cols,figsize=(15,12))
-                    Ax = Ax.flatten()
-                    II = []
-                    
-                    vmin = peakDic[peak]['vmin']
-                    vmax = peakDic[peak]['vmax']
-                    
-                    for a3,A3Idx,offset,ax in zip(df.A3[startA3:stopA3],range(startA3,stopA3), sttOffset ,Ax):
-                        c = df.counts[A3Idx,startZ:stopZ,startTheta+offset:stopTheta+offset]/df.monitor[A3Idx].reshape(-1,1)
-                        offsetVal = sttStepDegreesToIndex*offset
-                        II.append(ax.imshow(c,origin='lower',extent=(startThetaVal+offsetVal,stopThetaVal+offsetVal,startZ,stopZ),vmin=vmin,vmax=vmax))
-                        ax.set_xlabel('Two Theta [deg.]')
-                        ax.set_ylabel('z [pixcel]')
-                        ax.set_title(f'A3: {str(a3)}')
-                        ax.axis('auto')
-                    
-                    fig.tight_layout()
-                    
-                    for i in II:
-                        i.set_clim(vmin,vmax)
-                    
-                    if saveFig is not False:
-                        fig.savefig(saveFig+f'{peak}_roi.png',format='png')   
-
-                if closeFigures is True:
-                    plt.close('all') 
+            
+            print(f'\nFit of {peak} yields:')
+            print('The offset of the gaussian baseline is', np.round(H,5))
+            print('The center of the gaussian fit is', np.round(x0,3))
+            print('The sigma of the gaussian fit is', np.round(sigma,5))
+            print('The maximum intensity of the gaussian fit is', np.round(H + A,3))
+            print('The Amplitude of the gaussian fit is', np.round(A,3))
+            print('The FWHM of the gaussian fit is', np.round(FWHM,3))
+            print('The integrated intensity is',np.round(integrated,3))
+            if not fit['converged']:
+                warnings.warn('Fit of {} did not converge'.format(peak))
+            ################################################
+            
+            # export integrated intensities
+            peakDic[peak]['summed_counts'] = np.sum(ydata)
+            peakDic[peak]['peak_cut'] = [xdata,ydata]
+            peakDic[peak]['monitors'] = monitors
+            peakDic[peak]['fit'] = [H,x0,sigma,FWHM,integrated]
+            peakDic[peak]['fit_errors'] = [fit['d'+name] for name in ['H','x0','sigma','FWHM','integrated']]
+
+            if closeFigures is True and plot:
+                plt.close('all') 
 
         return peakDic
 
+    def _boxIntegrationCut(self,df,hdfFile,peak,peakDic,roi,saveFig,closeFigures,plot):
+        """Rocking curve of a single peak of peakDic in df, see boxIntegration. hdfFile is the opened data file or None if counts are held in memory.
+
+        Returns:
+
+            - xdata (array): A3 positions
+
+            - ydata (array): Summed intensity in the box normalized by monitor
+
+            - monitors (array): Monitor of each A3 position
+
+        """
+        if plot:
+            import matplotlib.pyplot as plt
+
+        # vertical range in pixcel
+        startZ = peakDic[peak]['startZ']
+        stopZ = peakDic[peak]['stopZ']
+        
+        # # # peak position
+        tth = np.abs(peakDic[peak]['tth'])
+        tth_minus = peakDic[peak]['tth_minus']
+        tth_pluss = peakDic[peak]['tth_pluss']
+        
+        # # # twoTheta range
+        startThetaVal = -(tth - tth_minus)
+        stopThetaVal = -(tth +  tth_pluss)
+        
+        startTheta = np.argmin(np.abs(df.twoTheta[64]-startThetaVal))
+        stopTheta = np.argmin(np.abs(df.twoTheta[64]-stopThetaVal))
+        
+        # # # A3 range
+        A3_center = peakDic[peak]['A3_center']
+        A3_minus = peakDic[peak]['A3_minus']
+        A3_pluss = peakDic[peak]['A3_pluss']
+        
+        # Find index of A3
+        absolute_differences = np.abs(df.A3 - A3_center)
+        A3_center = np.argmin(absolute_differences)
+        
+        startA3 = A3_center - A3_minus
+        stopA3 = A3_center + A3_pluss
+        
+        a3StepDegrees=(max(df.A3)-min(df.A3))/len(df.A3)
+        A3Steps = abs(stopA3-startA3)
+        A3StepSign = np.sign(stopA3-startA3)
+        sttRange = (stopA3-startA3)*a3StepDegrees*2
+        
+        sttStepDegreesToIndex = np.diff(df.twoTheta[65])[0]
+        sttSteps = A3StepSign*sttRange/sttStepDegreesToIndex
+        sttOffset = np.linspace(-sttSteps*0.5,sttSteps*0.5,A3Steps).astype(int)
+
+        # Read only the region of the detector covered by the moving twoTheta window of the peak
+        frameStart,frameStop,_ = slice(startA3,stopA3).indices(len(df))
+        frameStop = max(frameStart,frameStop)
+        width = df.countShape[-1]
+        if len(sttOffset) > 0 and startTheta < stopTheta and startTheta+sttOffset.min() >= 0 and stopTheta+sttOffset.max() <= width:
+            thetaStart = startTheta+sttOffset.min()
+            thetaStop = stopTheta+sttOffset.max()
+        else: # Window wraps around or is empty, read full twoTheta range as indices are used as is
+            thetaStart = 0
+            thetaStop = width
+        region = DataFile.lazyCounts(df,(slice(frameStart,frameStop),slice(startZ,stopZ),slice(thetaStart,thetaStop)),hdfFile=hdfFile)
+        
+        countsAllTwoTheta = region.intensity().sum(axis=(1))
+        monitors = df.monitor[startA3:stopA3]
+        
+        counts = []
+        
+        for i,offset in enumerate(sttOffset):
+            counts.append(countsAllTwoTheta[i,startTheta+offset-thetaStart:stopTheta+offset-thetaStart].sum())
+        
+        counts = np.asarray(counts) / monitors 
+        
+        xdata = df.A3[startA3:stopA3]
+        ydata = counts
+        
+        if roi and plot:
+            # plot rois
+            total = len(df.A3[startA3:stopA3])
+            rows = int(np.floor(np.sqrt(total)))
+            cols = int(np.ceil(np.sqrt(total)))
+            
+            fig,Ax = plt.subplots(nrows=rows,ncols=cols,figsize=(15,12))
+            Ax = Ax.flatten()
+            II = []
+            
+            vmin = peakDic[peak]['vmin']
+            vmax = peakDic[peak]['vmax']
+
+            # Counts of the region already read
+            regionCounts = region.counts()
+            
+            for i,(a3,A3Idx,offset,ax) in enumerate(zip(df.A3[startA3:stopA3],range(startA3,stopA3), sttOffset ,Ax)):
+                c = regionCounts[i,:,startTheta+offset-thetaStart:stopTheta+offset-thetaStart]/df.monitor[A3Idx].reshape(-1,1)
+                offsetVal = sttStepDegreesToIndex*offset
+                II.append(ax.imshow(c,origin='lower',extent=(startThetaVal+offsetVal,stopThetaVal+offsetVal,startZ,stopZ),vmin=vmin,vmax=vmax))
+                ax.set_xlabel('Two Theta [deg.]')
+                ax.set_ylabel('z [pixcel]')
+                ax.set_title(f'A3: {str(a3)}')
+                ax.axis('auto')
+            
+            fig.tight_layout()
+            
+            for i in II:
+                i.set_clim(vmin,vmax)
+            
+            if saveFig is not False:
+                fig.savefig(saveFig+f'{peak}_roi.png',format='png')   
+
+        if closeFigures is True and plot:
+            plt.close('all') 
+
+        return xdata,ydata,monitors
+
     def subtractBkgRange(self,bkgStart,bkgEnd,saveToFile=False, saveToNewFile = False):
         """Function generate background as defined by a range of the first dataFile of the dataSet
 
@@ -1638,7 +1780,7 @@ class DataSet(object):
             
         Returns:
             
-            .dat file in PSI format with input name
+            - fileName (str): Path of the written .dat file in PSI format
             
         Note: Input is a data set.
             
@@ -1811,9 +1953,12 @@ class DataSet(object):
         if outFolder is None:
             outFolder = os.getcwd()
 
-        with open(os.path.join(outFolder,saveFile)+".dat",'w') as sf:
+        fileName = os.path.join(outFolder,saveFile)+".dat"
+        with open(fileName,'w') as sf:
             sf.write(fileString)
 
+        return fileName
+
     def export_xye_format(self,dTheta=0.125,twoThetaOffset=0,bins=None,hourNormalization=False,outFile=None,addTitle=None,outFolder=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
         """
         The function takes a data set and merge the files.
@@ -1850,7 +1995,7 @@ class DataSet(object):
             
         Returns:
             
-            .xye file in with a comment line with info and xye data
+            - fileName (str): Path of the written .xye file with a comment line with info and xye data
         
         Note: Input is a data set.
             
@@ -1970,14 +2115,33 @@ class DataSet(object):
         if outFolder is None:
             outFolder = os.getcwd()
 
-        with open(os.path.join(outFolder,saveFile)+".xye",'w') as sf:
+        fileName = os.path.join(outFolder,saveFile)+".xye"
+        with open(fileName,'w') as sf:
             sf.write(titleLine1+"\n")    
             sf.write(titleLine2+"\n") 
             sf.write(titleLine3+"\n") 
             np.savetxt(sf,saveData.T,delimiter='  ')
             sf.close()
+
+        return fileName
          
 
+    @contextlib.contextmanager
+    def deferGeometry(self):
+        """Context in which geometry changes of all data files do not recalculate Q. See DataFile.deferGeometry"""
+        with contextlib.ExitStack() as stack:
+            for df in self:
+                stack.enter_context(df.deferGeometry())
+            yield self
+
+    @contextlib.contextmanager
+    def deferSampleNotifications(self):
+        """Context in which changes to the samples of all data files notify their observers once, when leaving the context. See Sample.deferNotifications"""
+        with contextlib.ExitStack() as stack:
+            for sample in {id(sample):sample for sample in self.sample}.values():
+                stack.enter_context(sample.deferNotifications())
+            yield self
+
     def updateDataFiles(self,key,value):
         """Update a property across all data files
         
@@ -1991,16 +2155,18 @@ class DataSet(object):
             except TypeError:
                 length = 1
             
-            if length == len(self): # input has the same length as number of data files! Apply individually
-                if length == 1:
-                    value = [value]
-                for v,df in zip(value,self):
-                    setattr(df,key,v)
-            elif length == 1:
-                for df in self:
-                    setattr(df,key,value)
-            else:
-                raise AttributeError('Length of DataSet is {} but received {} values for {}'.format(len(self),length,key))
+            # Q of the data files is recalculated when next used
+            with self.deferGeometry():
+                if length == len(self): # input has the same length as number of data files! Apply individually
+                    if length == 1:
+                        value = [value]
+                    for v,df in zip(value,self):
+                        setattr(df,key,v)
+                elif length == 1:
+                    for df in self:
+                        setattr(df,key,value)
+                else:
+                    raise AttributeError('Length of DataSet is {} but received {} values for {}'.format(len(self),length,key))
                 
             self._getData() # update!
             
@@ -2030,12 +2196,57 @@ class DataSet(object):
             
             - rlu (bool): If true utilize sample UB otherwise perform no rotation (default False)
             
-            - steps (int): Number of a3 step computated at once when performing operation (default len(df))
+            - steps (int): Number of a3 step computated at once when performing operation (default None - chosen from memory budget)
 
             - sample (Sample): Use specified sample for RLU axis if RLU = True (default None = self.sample[0])
         
         If dQx and dQy is set an automatic binning size is performed, however an error will be thrown if neither dQx (dQy) and  xBins (yBins) are set.
 
+        """
+        returndata,bins,totalRotMat,translations = self.cutQPlaneStack(points=points,width=width,offsets=[0.0],dQx=dQx,dQy=dQy,xBins=xBins,yBins=yBins,rlu=rlu,steps=steps,sample=sample)
+        if not returndata is None:
+            returndata = [rd[0] for rd in returndata]
+        return returndata,bins,totalRotMat,translations[0]
+
+    @Cache.cached(ignore=['steps'])
+    def cutQPlaneStack(self,points, width, offsets, dQx = None, dQy = None, xBins =None, yBins =None, rlu=False, steps=None, sample = None):
+        """Perform a stack of parallel QPlane cuts in a single pass over the data. Points within +-0.5*width of each plane are collapsed onto it and binned into xBins and yBins
+        Args:
+            - points (list): List of three points within the reference plane. X is parallel to point 2 - point 1 (p1, p2, p3 = points)
+
+            - width (float): Total width of each QPlane in units of 1/AA
+
+            - offsets (list): Offsets of the planes along the plane normal relative to the reference plane in units of 1/AA, e.g. np.arange(-0.5,0.51,0.1)
+        
+        Kwargs:
+        
+            - dQx (float): Step size along x if xBins is not provided (default None)
+            
+            - dQy (float): Step size along y if yBins is not provided (default None)
+            
+            - xBins (list): Binning edges along x, overwrites dQx (default None)
+            
+            - yBins (list): Binning edges along y, overwrites dQy (default None)
+            
+            - rlu (bool): If true utilize sample UB otherwise perform no rotation (default False)
+            
+            - steps (int): Number of a3 step computated at once when performing operation (default None - chosen from memory budget)
+
+            - sample (Sample): Use specified sample for RLU axis if RLU = True (default None = self.sample[0])
+
+        Returns:
+
+            - dataList (list): List of [Intensity, Monitor, Normalization, Normcount] each with shape (len(offsets),len(xBins)-1,len(yBins)-1)
+
+            - bins (list): Bin edges of the planes in format [Qx,Qy]
+
+            - totalRotMat (array): Rotation matrix into the plane coordinate system
+
+            - translations (array): Position of each plane along the plane normal
+        
+        If dQx and dQy is set an automatic binning size is performed, however an error will be thrown if neither dQx (dQy) and  xBins (yBins) are set. 
+        Overlapping planes, i.e. offsets closer than width, are allowed and pixels are then added to all planes they are within.
+
         """
         if np.all([x is None for x in [dQx,dQy,xBins,yBins]]):
             raise AttributeError('No bins or step sizes provided')
@@ -2050,18 +2261,16 @@ class DataSet(object):
             if dQy is None:
                 raise AttributeError('Neither dQx or xBins are set!')
 
-       
-        if yBins is None and xBins is None:
-            bins = None # Automatic binning
-            autoBins = True
-        else: # One of the bins is set
-            autoBins = False
-            if yBins is None:
-                yBins = np.arange(-5,5,dQy)
-            elif xBins is None:
-                xBins = np.arange(-5,5,dQx)
-
+        offsets = np.asarray(offsets,dtype=float).flatten()
+        if len(offsets) == 0:
+            raise AttributeError('No plane offsets provided')
 
+        # Planes are found in sorted order and mapped back to the order of offsets
+        order = np.argsort(offsets)
+        sortedOffsets = offsets[order]
+        offsetDifference = np.diff(sortedOffsets)
+        overlapping = np.any(np.logical_and(offsetDifference<width,np.logical_not(np.isclose(offsetDifference,width))))
+       
         if not points is None:
             if rlu:
                 newPoints = [np.dot(sample.UB,point) for point in points]
@@ -2072,97 +2281,126 @@ class DataSet(object):
         else:
             totalRotMat = np.eye(3)
             translation = np.asarray([0.0])
+
+        if yBins is None and xBins is None: # Automatic binning from the in-plane extent of all planes
+            extent = self._cutQPlaneExtent(totalRotMat,translation,offsets,width,steps=steps)
+            if extent is None:
+                xBins = yBins = np.array([0.0,1.0])
+            else:
+                (xMin,xMax),(yMin,yMax) = extent
+                xBins = np.arange(xMin-0.51*dQx,xMax+0.51*dQx,dQx)
+                yBins = np.arange(yMin-0.51*dQy,yMax+0.51*dQy,dQy)
+        else: # One of the bins is set
+            if yBins is None:
+                yBins = np.arange(-5,5,dQy)
+            elif xBins is None:
+                xBins = np.arange(-5,5,dQx)
+
+        translations = translation+offsets
+        planeBins = np.arange(len(offsets)+1)-0.5
         
         returndata = None
         for df in self:
             
-            if steps is None:
-                steps = len(df)
-            
-            stepsTaken = 0
+            dfSteps = _tools.planSteps(df) if steps is None else steps
             
-            totalRotMatDF = totalRotMat
+            totalRotMatDF = totalRotMat.astype(df.dtype)
             
-            for idx in _tools.arange(0,len(df),steps):
+            for idx in _tools.arange(0,len(df),dfSteps):
                 
                 q = np.einsum('ij,jk->ik',totalRotMatDF,df.q[idx[0]:idx[-1]].reshape(3,-1),optimize='greedy')
-                mask = df.mask[idx[0]:idx[-1]]
+                z = q[2]-translation
+                notMasked = np.zeros(len(z),dtype=bool)
+                notMasked[df.mask.notMasked(slice(idx[0],idx[1]))] = True
                 
-                # Check that the points are in the plane and take only the local x and y coordinates
-                inside = np.logical_and(np.abs(q[2]-translation)<width*0.5,np.logical_not(mask.flatten()))
+                # Find the plane(s) each pixel belongs to and take only the local x and y coordinates
+                if overlapping:
+                    inside = []
+                    plane = []
+                    for I,offset in zip(order,sortedOffsets):
+                        insidePlane = np.flatnonzero(np.logical_and(np.abs(z-offset)<width*0.5,notMasked))
+                        inside.append(insidePlane)
+                        plane.append(np.full(len(insidePlane),I))
+                    inside = np.concatenate(inside)
+                    plane = np.concatenate(plane)
+                else:
+                    planeIndex = np.searchsorted(sortedOffsets-width*0.5,z,side='right')-1
+                    candidate = planeIndex>=0
+                    candidate[candidate] = np.abs(z[candidate]-sortedOffsets[planeIndex[candidate]])<width*0.5
+                    inside = np.flatnonzero(np.logical_and(candidate,notMasked))
+                    plane = order[planeIndex[inside]]
+
                 q = q[:2,inside]
                 print(df.fileName,'from',idx[0],'to',idx[-1])
                 if q.shape[1] == 0:
                     print('Empty slices. Continuing...')
                     continue
-                if autoBins:
-                    
-                    xMin,xMax = q[0].min(), q[0].max()
-                    yMin,yMax = q[1].min(), q[1].max()
-                    if bins is None: # initial calculation of bins
-                        xBins = np.arange(xMin-0.51*dQx,xMax+0.51*dQx,dQx)
-                        yBins = np.arange(yMin-0.51*dQy,yMax+0.51*dQy,dQy)
-                        bins = (xBins,yBins)
-                    else:
-                        
-                        if xMin < xBins[0] or xMax > xBins[-1]:
-                            lowExtensionX = np.max([int(np.ceil((bins[0][0]-xMin)/dQx)),0])
-                            highExtensionX = np.max([int(np.ceil((xMax-bins[0][-1])/dQx+0.1)),0])
 
-                            xBins = np.arange(bins[0][0]-lowExtensionX*dQx,bins[0][-1]+highExtensionX*dQx+0.4*dQx,dQx)
-                            bins = (xBins,bins[1])
-                        else:
-                            lowExtensionX = highExtensionX = 0
-                        if yMin < yBins[0] or yMax > yBins[-1]:
-                            lowExtensionY = np.max([int(np.ceil((bins[1][0]-yMin)/dQy)),0])
-                            highExtensionY = np.max([int(np.ceil((yMax-bins[1][-1])/dQy+0.1)),0])
+                chunk = DataFile.lazyCounts(df,slice(idx[0],idx[1]))
+                shape = chunk.rawCounts.shape
 
-                            yBins = np.arange(bins[1][0]-lowExtensionY*dQy,bins[1][-1]+highExtensionY*dQy+0.4*dQy,dQy)
-                            bins = (bins[0],yBins)
-                        else:
-                            lowExtensionY = highExtensionY = 0    
-                            
-                            # if any extension is nonzero, rescale
-                        if np.any(np.asarray([lowExtensionX,lowExtensionY,highExtensionX,highExtensionY])!=0):
-                            dat = []
-                            for mat in returndata:
-
-                                tempMat = np.zeros((len(bins[0])-1,len(bins[1])-1),dtype=mat.dtype)
-                                tempMat[lowExtensionX:lowExtensionX+mat.shape[0],lowExtensionY:lowExtensionY+mat.shape[1]] = mat
-                                mat = tempMat
-                                dat.append(mat)
-                            returndata = dat          
+                # Monitor and normalization are only expanded for the pixels inside the planes
+                mon = DataFile.lazyWeights(df.monitor[idx[0]:idx[1]].reshape(-1,1,1),shape)[inside]
+                Norm = DataFile.lazyWeights(df.normalization,shape)[inside]
                 
-                dat = df.intensitySliced(slice(idx[0],idx[1]))
-                    
-                mon = df.monitor[idx[0]:idx[1]]
-                mon=np.repeat(np.repeat(mon[:,np.newaxis],dat.shape[1],axis=1)[:,:,np.newaxis],dat.shape[2],axis=-1)
-                
-                stepsTaken+=steps
-
-                I = df.counts[idx[0]:idx[1]]
-                Norm = df.normalization#[idx[0]:idx[1]]
-                Norm = np.repeat(Norm[np.newaxis],len(I),axis=0).flatten()[inside]
-                
-                I = I.flatten()[inside]
-                dat = dat.flatten()[inside]
-                mon = mon.flatten()[inside]
+                I = chunk.counts(inside)
                 weights = [I,mon,Norm]
                 
-                intensity,monitorCount,Normalization,NormCount = _tools.histogramdd(q.T,bins=(xBins,yBins),weights=weights,returnCounts=True)
+                intensity,monitorCount,Normalization,NormCount = _tools.histogramdd(np.array([plane.astype(q.dtype),*q]).T,bins=(planeBins,xBins,yBins),weights=weights,returnCounts=True)
 
                 if returndata is None:
                     returndata = [intensity,monitorCount,Normalization,NormCount]
                 else:
-                    returndata = [rd+x for rd,x in zip(returndata,[intensity,monitorCount,Normalization,NormCount])]
+                    for rd,x in zip(returndata,[intensity,monitorCount,Normalization,NormCount]):
+                        rd+=x
 
         Qx =np.outer(xBins,np.ones_like(yBins))
         Qy =np.outer(np.ones_like(xBins),yBins)
         bins = [Qx,Qy]
 
-        return returndata,bins,totalRotMat,translation
+        return returndata,bins,totalRotMat,translations
+
+    def _cutQPlaneExtent(self,totalRotMat,translation,offsets,width,steps=None,stride=8):
+        """Find an upper bound of the in-plane extent of all pixels within the planes of a QPlane cut.
+
+        Only every stride'th pixel along z and 2theta (and the detector edges) is rotated. The planes are widened,
+        and the extent expanded, by the largest distance between neighbouring sub-sampled pixels, so the
+        returned extent contains all pixels within the planes.
+
+        Returns:
+
+            - extent (list): [[xMin,xMax],[yMin,yMax]] or None if no pixels are within the planes
 
-    def plotQPlane(self,points, width, sample=None, dQx = None, dQy = None, xBins =None, yBins =None, rlu=False, steps=None,log=False,ax=None,rmcFile=False,**kwargs):
+        """
+        offsets = np.asarray(offsets,dtype=float)
+        xMin = yMin = np.inf
+        xMax = yMax = -np.inf
+        for df in self:
+            zIdx = np.unique(np.concatenate([np.arange(0,df.q.q_temp.shape[1],stride),[df.q.q_temp.shape[1]-1]]))
+            tIdx = np.unique(np.concatenate([np.arange(0,df.q.q_temp.shape[2],stride),[df.q.q_temp.shape[2]-1]]))
+            qSub = df.q.q_temp[:,zIdx][:,:,tIdx]
+            
+            # Distance between neighbouring sub-sampled pixels is independent of A3
+            margin = np.max(np.linalg.norm(np.diff(qSub,axis=1),axis=0),initial=0.0)+np.max(np.linalg.norm(np.diff(qSub,axis=2),axis=0),initial=0.0)
+            qSubLazy = DataFile.lazyQ(df.q.rotationMatrix,qSub)
+
+            dfSteps = _tools.planSteps(df) if steps is None else steps
+            for idx in _tools.arange(0,len(df),dfSteps):
+                q = np.einsum('ij,jk->ik',totalRotMat,qSubLazy[idx[0]:idx[-1]].reshape(3,-1))
+                z = q[2]-translation
+                inside = np.any(np.abs(z[np.newaxis]-offsets.reshape(-1,1))<width*0.5+margin,axis=0)
+                if not np.any(inside):
+                    continue
+                xMin = np.min([xMin,q[0,inside].min()-margin])
+                xMax = np.max([xMax,q[0,inside].max()+margin])
+                yMin = np.min([yMin,q[1,inside].min()-margin])
+                yMax = np.max([yMax,q[1,inside].max()+margin])
+
+        if not np.isfinite(xMin):
+            return None
+        return [[xMin,xMax],[yMin,yMax]]
+
+    def plotQPlane(self,points, width, sample=None, dQx = None, dQy = None, xBins =None, yBins =None, rlu=False, steps=None,log=False,ax=None,rmcFile=False,multiResolution=False,**kwargs):
         """Wrapper for plotting tool to show binned intensities in the Q plane between provided Qz values.
 
         Args:
@@ -2176,7 +2414,7 @@ class DataSet(object):
             - xBins (list): Binning edges along x, overwrites dQx (default None)
             - yBins (list): Binning edges along y, overwrites dQy (default None)
             - rlu (bool): If true utilize sample UB otherwise perform no rotation (default False)
-            - steps (int): Number of a3 step computated at once when performing operation (default len(df))
+            - steps (int): Number of a3 step computated at once when performing operation (default None - chosen from memory budget)
             - sample (Sample): Use specified sample for RLU axis if RLU = True (default None = self.sample[0])
             - log (bool): Plot intensities as the logarithm (default False).
             - ax (matplotlib axes): Axes in which the data is plotted (default None). If None, the function creates a new axes object.
@@ -2185,6 +2423,7 @@ class DataSet(object):
             - vmax (float): Upper limit for colorbar (default max(Intensity)).
             - colorbar (bool): If True, a colorbar is created in figure (default False)
             - zorder (int): If provided decides the z ordering of plot (default 10)
+            - multiResolution (bool): If True, coarser binnings summed from the plane are shown when zoomed out such that no more than one bin is shown per screen pixel (default False)
             - other: Other key word arguments are passed to the pcolormesh plotting algorithm.
             
         Returns:
@@ -2198,6 +2437,8 @@ class DataSet(object):
             The axes object has a new method denoted 'to_csv' taking one parameter, fileName, which is where the csv is saved.
 
         """
+        import matplotlib.pyplot as plt
+        import pandas as pd
         
         if 'zorder' in kwargs:
             zorder = kwargs['zorder']
@@ -2309,7 +2550,40 @@ class DataSet(object):
             ymin = np.min([np.min(qy) for qy in ax.Qy])
             ymax = np.max([np.max(qy) for qy in ax.Qy])
             ax.set_ylim(ymin,ymax)#np.min(Qy),np.max(Qy))
-    
+
+        if multiResolution: # Coarser levels are summed exactly from the histogram sums of the plane
+            plane = BinnedVolume.BinnedVolume(ax.intensity,ax.monitorCount,ax.NormCount,[bins[0][:,0],bins[1][0]],normalization=ax.Normalization)
+            levels = plane.pyramid()
+            shown = {'pmesh':pmeshs[0]}
+
+            def setLevel(level,ax=ax,levels=levels,shown=shown):
+                volume = levels[level]
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    Int = np.divide(volume.intensity*volume.counts,volume.monitor*volume.normalization)
+                if log:
+                    Int = np.log10(1e-20+Int)
+                old = shown['pmesh']
+                xlim,ylim = ax.get_xlim(),ax.get_ylim()
+                pmesh = ax.pcolormesh(*volume.bins,Int,zorder=zorder,cmap=old.get_cmap(),**kwargs)
+                pmesh.set_clim(*old.get_clim())
+                for I,p in enumerate(ax.pmeshs):
+                    if p is old:
+                        ax.pmeshs[I] = pmesh
+                if hasattr(ax,'colorbar') and ax.colorbar.mappable is old:
+                    ax.colorbar.update_normal(pmesh)
+                old.remove()
+                shown['pmesh'] = pmesh
+                ax.set_xlim(xlim)
+                ax.set_ylim(ylim)
+                ax.get_figure().canvas.draw_idle()
+
+            selector = _tools.resolutionSelector(ax,plane.edges,len(levels),setLevel)
+            if 'resolutionSelectors' in ax.__dict__:
+                ax.resolutionSelectors.append(selector)
+            else:
+                ax.resolutionSelectors = [selector]
+            selector.update()
         
         def to_csv(fileName,ax,rmcFile,rmcFileName):
             Qx,Qy = ax.bins
@@ -2368,9 +2642,101 @@ class DataSet(object):
 
             - p3 (list): New tertiary projection, in HKL. If None, orthogonal to p1 and p2 (default None)
         """
-        for sample in self.sample:
-            sample.setProjectionVectors(p1=p1,p2=p2,p3=p3)
+        with self.deferSampleNotifications():
+            for sample in self.sample:
+                sample.setProjectionVectors(p1=p1,p2=p2,p3=p3)
+
+
 
+def _integratePeaksInFile(df,Q,radius,backgroundRadii,steps=None):
+    """Sum normalized intensity of pixels in df within the peak ellipsoids and background shells around Q, see DataSet.integratePeaks.
+
+    Returns:
+
+        - sums (array): Summed intensity, variance and number of pixels of peaks and of backgrounds, shape (6,len(Q))
+
+    """
+    sums = np.zeros((6,len(Q)))
+    pixels = np.prod(df.countShape[1:])
+    rotMat = df.rotMat # shape 3,3,steps with q = rotMat[:,:,i] q_temp
+    qPixel = df.q_temp.reshape(3,-1)
+
+    # Ellipsoid axes: longitudinal, transverse and vertical
+    QLength = np.linalg.norm(Q,axis=1)
+    longitudinal = np.array(Q,dtype=float)
+    longitudinal[QLength<1e-8] = [1.0,0.0,0.0] # Direct beam
+    longitudinal/=np.linalg.norm(longitudinal,axis=1)[:,np.newaxis]
+    vertical = np.array([0.0,0.0,1.0])-longitudinal[:,2:3]*longitudinal
+    verticalLength = np.linalg.norm(vertical,axis=1)
+    vertical[verticalLength<1e-8] = [1.0,0.0,0.0] # Q along z
+    vertical/=np.linalg.norm(vertical,axis=1)[:,np.newaxis]
+    transverse = np.cross(vertical,longitudinal)
+    axes = np.array([longitudinal,transverse,vertical]).transpose(1,0,2)/radius.reshape(1,3,1) # peak,axis,xyz
+
+    # Peak positions in the frame of q_temp for all scan steps, shape peaks,steps,3
+    centres = np.einsum('kji,pk->pij',rotMat,Q)
+    searchRadius = np.max(radius)*backgroundRadii[1]
+
+    # Only peak and scan step combinations with pixels close by are searched
+    distance,_ = df.qIndex.query(centres.reshape(-1,3),k=1,distance_upper_bound=searchRadius)
+    candidates = np.flatnonzero(np.isfinite(distance))
+
+    flatIndex = []
+    peakIndex = []
+    isPeak = []
+    for candidate,pixelList in zip(candidates,df.qIndex.query_ball_point(centres.reshape(-1,3)[candidates],searchRadius)):
+        if len(pixelList) == 0:
+            continue
+        peak,step = divmod(candidate,rotMat.shape[-1])
+        pixelList = np.asarray(pixelList,dtype=int)
+        # Scaled distance of pixels to peak in the sample frame
+        delta = np.dot(rotMat[:,:,step],qPixel[:,pixelList])-Q[peak].reshape(3,1)
+        scaled = np.linalg.norm(np.dot(axes[peak],delta),axis=0)
+        inPeak = scaled <= 1.0
+        inBackground = np.logical_and(scaled >= backgroundRadii[0],scaled <= backgroundRadii[1])
+        use = np.logical_or(inPeak,inBackground)
+        flatIndex.append(step*pixels+pixelList[use])
+        peakIndex.append(np.full(np.sum(use),peak))
+        isPeak.append(inPeak[use])
+
+    if len(flatIndex) == 0:
+        return sums
+
+    flatIndex = np.concatenate(flatIndex)
+    peakIndex = np.concatenate(peakIndex)
+    isPeak = np.concatenate(isPeak)
+
+    # Remove masked pixels
+    mask = df.mask.valuesAt(flatIndex) if hasattr(df.mask,'valuesAt') else np.asarray(df.mask).reshape(-1)[flatIndex]
+    keep = np.logical_not(mask)
+    order = np.argsort(flatIndex[keep],kind='stable')
+    flatIndex = flatIndex[keep][order]
+    peakIndex = peakIndex[keep][order]
+    isPeak = isPeak[keep][order]
+
+    # Stream through the data file reading each chunk of scan steps containing pixels once
+    dfSteps = _tools.planSteps(df) if steps is None else steps
+    for idx in _tools.arange(0,len(df),dfSteps):
+        start,stop = np.searchsorted(flatIndex,[idx[0]*pixels,idx[1]*pixels])
+        if start == stop:
+            continue
+        print(df.fileName,'from',idx[0],'to',idx[-1])
+        chunk = DataFile.lazyCounts(df,slice(idx[0],idx[1]))
+        local = flatIndex[start:stop]-idx[0]*pixels
+        monitor = df.monitor[idx[0]+local//pixels]
+        normalization = DataFile.lazyWeights(df.normalization,chunk.rawCounts.shape)[local]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            intensity = chunk.intensity(local)/monitor
+            variance = np.abs(chunk.counts(local))/(normalization*monitor)**2
+        valid = np.isfinite(intensity) # Pixels without efficiency
+
+        peaks = peakIndex[start:stop]
+        for offset,selection in [(0,isPeak[start:stop]&valid),(3,np.logical_not(isPeak[start:stop])&valid)]:
+            sums[offset] += np.bincount(peaks[selection],weights=intensity[selection],minlength=len(Q))
+            sums[offset+1] += np.bincount(peaks[selection],weights=variance[selection],minlength=len(Q))
+            sums[offset+2] += np.bincount(peaks[selection],minlength=len(Q))
+    return sums
             
 def add(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
 
@@ -3312,9 +3678,9 @@ def export_help():
     print(" ")
     print(" ")
 
-from matplotlib.ticker import FuncFormatter
-
 def generate1DAxis(q1,q2,rlu=True,outputFunction=print):
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter
     fig,ax = plt.subplots()
     ax = plt.gca()
     q1 = np.asarray(q1,dtype=float)
@@ -2,6 +2,7 @@
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
 import numpy as np
+from DMCpy import _tools
 
 
 class InteractiveViewer(object):
@@ -10,11 +11,11 @@ class InteractiveViewer(object):
                  scanValueFormat=None,scanValueUnit=None,colorbar=False,outputFunction=print,
                  mainTitle='Single Step',vmin=None,vmax=None, positive2Theta=True,
                  dataLabel = 'Intensity',axis_1_label='Sum over z',axis_2_label='Sum over 2Theta',
-                 xlabel='2Theta [deg]',ylabel='z [cm]',cmap='viridis'):
+                 xlabel='2Theta [deg]',ylabel='z [cm]',cmap='viridis',fastRendering=False):
         """
 
         args:
-            - data (array): 3D array with data data
+            - data (array): 3D array with data of shape (scan steps,z,2theta), or frame source with len, data[index] and summedPanels, e.g. DataFile.lazyFrames
             
             - twoTheta (array): 2D array holding the 2theta values
             
@@ -52,11 +53,13 @@ class InteractiveViewer(object):
 
             - cmap (str): Name of color map (default viridis)
 
+            - fastRendering (bool): If True, steps are shown with imshow and rapid changes of step are coalesced into a single blitted redraw (default False)
+
         """
         
         # Initialize index to -1 to ensure plotting of first data
         self.index = -1
-        self.data = data.transpose(0,2,1) # Transpose for quicker data plotting
+        self.data = data # Frames are only accessed when plotted
         
         # If scan values are not provided, create [0,1,2,3,...]
         if not scanValues is None:
@@ -70,6 +73,7 @@ class InteractiveViewer(object):
             
         self.cmap = cmap
         self.colorbar = colorbar
+        self.fastRendering = fastRendering
         self.mainTitle = mainTitle
         
         self.xlabel = xlabel
@@ -139,6 +143,10 @@ class InteractiveViewer(object):
             self.indexSlider = Slider(self.ax_slider, label=scanLabel, valmin=0, valmax=self.scanSteps-1, valinit=-1,valfmt=self.valfmt)
         
         self.indexSlider.on_changed(lambda val: self.sliders_on_changed(val))
+
+        if self.fastRendering: # Slider and single step are redrawn by blitting
+            self.renderer = _tools.blitRenderer(self.fig,[self.ax_slider])
+            self.indexSlider.drawon = False
         
         
         # add labels
@@ -150,13 +158,17 @@ class InteractiveViewer(object):
         self.ax_thetaIntegrated.set_xlabel(self.ylabel)
         
         # Sum over two theta and alpha(out of plane)
-        self.IThetaIntegrated = self.data.sum(axis=1)
-        self.IAlphaIntegrated = self.data.sum(axis=2)
+        if hasattr(self.data,'summedPanels'): # Summed while streaming through the frames
+            self.IAlphaIntegrated,self.IThetaIntegrated,limits = self.data.summedPanels()
+        else:
+            self.IThetaIntegrated = self.data.sum(axis=2)
+            self.IAlphaIntegrated = self.data.sum(axis=1)
+            limits = [np.nanmin(self.data),np.nanmax(self.data)]
         
         if vmin is None:
-            vmin = np.nanmin(self.data)
+            vmin = limits[0]
         if vmax is None:
-            vmax = np.nanmax(self.data)
+            vmax = limits[1]
             
         self.initialLimits = [vmin,vmax]
         
@@ -243,10 +255,22 @@ class InteractiveViewer(object):
         #extent = np.array([[f(dat) for f in [np.nanmin,np.nanmax]] for dat in [ax.twoTheta[index],ax.pixelPosition[index]]]).flatten()
         
         if hasattr(self.ax_singleStep,'_pcolormesh'):
-            self.ax_singleStep._pcolormesh.set_array(self.data[index].T)
-            self.ax_singleStep.redraw_in_frame()
+            if self.fastRendering:
+                self.renderer.request(lambda: self.ax_singleStep._pcolormesh.set_array(self.data[index]))
+            else:
+                self.ax_singleStep._pcolormesh.set_array(self.data[index])
+                self.ax_singleStep.redraw_in_frame()
         else:
-            self.ax_singleStep._pcolormesh = self.ax_singleStep.pcolormesh(self.twoThetaExtended,self.pixelPositionExtended,self.data[index].T,vmin=vmin,vmax=vmax,cmap=self.cmap)
+            if self.fastRendering and _tools.isRegularGrid(*np.meshgrid(self.twoThetaExtended,self.pixelPositionExtended,indexing='ij')):
+                extent = [self.twoThetaExtended[0],self.twoThetaExtended[-1],self.pixelPositionExtended[0],self.pixelPositionExtended[-1]]
+                self.ax_singleStep._pcolormesh = self.ax_singleStep.imshow(self.data[index],extent=extent,origin='lower',aspect='auto',interpolation='nearest',vmin=vmin,vmax=vmax,cmap=self.cmap)
+                # Keep increasing axes as for pcolormesh
+                self.ax_singleStep.set_xlim(np.sort(extent[:2]))
+                self.ax_singleStep.set_ylim(np.sort(extent[2:]))
+            else:
+                self.ax_singleStep._pcolormesh = self.ax_singleStep.pcolormesh(self.twoThetaExtended,self.pixelPositionExtended,self.data[index],vmin=vmin,vmax=vmax,cmap=self.cmap)
+            if self.fastRendering:
+                self.renderer.add(self.ax_singleStep._pcolormesh)
             plt.draw()
     
         
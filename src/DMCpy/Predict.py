@@ -1,9 +1,9 @@
 # SPDX-License-Identifier: MPL-2.0
-import tkinter as tk
 from DMCpy import DataSet, TasUBlibDEG, DataFile, Sample
 import numpy as np
 
 def predictiveTool():
+    import tkinter as tk
 
     # Define the function that generates the plot
     def plot_sample(a, b, c, alpha, beta, gamma,  h1, k1, l1, h2, k2, l2, wavelength, A4Start=0, A4Stop=None):
@@ -4,7 +4,13 @@ import numpy as np
 from DMCpy import _tools
 import h5py as hdf
 from DMCpy import TasUBlibDEG
+import contextlib
+import itertools
 import warnings
+import weakref
+
+# Versions of sample orientations are drawn from one counter and are thus unique across all samples of a session
+_versions = itertools.count(1)
 
 def cosd(x):
     return np.cos(np.deg2rad(x))
@@ -175,9 +181,167 @@ class Sample(object):
         else:
             raise AttributeError('Negative,null or above 180 degrees given for lattice parameter gamma')
 
+    @property
+    def UB(self):
+        return self._UB
+
+    @UB.getter
+    def UB(self):
+        return self._UB
+
+    @UB.setter
+    def UB(self,UB):
+        self._UB = UB
+        self.orientationChanged()
+
+    @property
+    def ROT(self):
+        return self._ROT
+
+    @ROT.getter
+    def ROT(self):
+        return self._ROT
+
+    @ROT.setter
+    def ROT(self,ROT):
+        self._ROT = ROT
+        self.orientationChanged()
+
+    @property
+    def projectionVectors(self):
+        return self._projectionVectors
+
+    @projectionVectors.getter
+    def projectionVectors(self):
+        return self._projectionVectors
+
+    @projectionVectors.setter
+    def projectionVectors(self,projectionVectors):
+        self._projectionVectors = projectionVectors
+        self.orientationChanged()
+
     @property
     def UBInv(self):
-        return np.linalg.inv(self.UB)
+        return self.transformation('UBInv')
+
+    @property
+    def version(self):
+        """Version of the orientation, changed whenever UB, ROT or projectionVectors are set"""
+        return self.__dict__.get('_version',0)
+
+    def addObserver(self,callback):
+        """Call callback(sample) whenever UB, ROT or projectionVectors change.
+
+        Only a weak reference to callback is kept, such that observers, e.g. data files or viewers, are not kept alive by the sample.
+
+        Args:
+
+            - callback (function): Function or bound method called with the sample as argument
+
+        """
+        if hasattr(callback,'__self__'):
+            reference = weakref.WeakMethod(callback)
+        else:
+            reference = weakref.ref(callback)
+        self.__dict__.setdefault('_observers',[]).append(reference)
+
+    def removeObserver(self,callback):
+        """Stop calling callback on changes of the orientation"""
+        self._observers = [reference for reference in self.__dict__.get('_observers',[]) if not reference() in [None,callback]]
+
+    @contextlib.contextmanager
+    def deferNotifications(self):
+        """Context in which changes of UB, ROT and projectionVectors notify the observers only once, when leaving the context.
+
+        Example:
+
+        >>> with sample.deferNotifications():
+        >>>     sample.ROT = rotation
+        >>>     sample.UB = UB
+
+        """
+        self._notificationsDeferred = self.__dict__.get('_notificationsDeferred',0)+1
+        try:
+            yield self
+        finally:
+            self._notificationsDeferred -= 1
+            if self._notificationsDeferred == 0 and self.__dict__.get('_notificationPending',False):
+                self.notifyObservers()
+
+    def orientationChanged(self):
+        """Clear cached transformations, increase version and notify observers after a change of UB, ROT or projectionVectors"""
+        self.clearTransformations()
+        self._version = next(_versions)
+        if self.__dict__.get('_notificationsDeferred',0) > 0:
+            self._notificationPending = True
+        else:
+            self.notifyObservers()
+
+    def notifyObservers(self):
+        self._notificationPending = False
+        alive = []
+        for reference in self.__dict__.get('_observers',[]):
+            callback = reference()
+            if callback is None:
+                continue
+            alive.append(reference)
+            callback(self)
+        self._observers = alive
+
+    def clearTransformations(self):
+        """Remove cached transformation matrices. Called when UB, ROT or projectionVectors are set, see orientationChanged.
+
+        Note that the matrices are to be replaced rather than modified in place for the cache to be cleared.
+        """
+        self._transformations = {}
+
+    def transformation(self,name):
+        """Return cached transformation matrix, calculated from UB, ROT and projectionVectors on first use.
+
+        Args:
+
+            - name (str): 'UBInv', 'projectionInv', 'tr2D', 'tr3D' (projection to Qx',Qy'(,Qz')), 'invTr2D', 'invTr3D' (Qx',Qy'(,Qz') to projection)
+              or 'hkl2D', 'hkl3D' (Qx',Qy'(,Qz') to HKL)
+
+        """
+        transformations = self.__dict__.setdefault('_transformations',{})
+        if not name in transformations:
+            if name == 'UBInv':
+                matrix = np.linalg.inv(self.UB)
+            elif name == 'projectionInv':
+                matrix = np.linalg.inv(self.projectionVectors)
+            elif name == 'tr2D':
+                projections = np.delete(self.projectionVectors,2,axis=1)
+                pm = np.delete(np.eye(3),2,axis=0)
+                matrix = np.dot(pm,np.dot(self.ROT,np.dot(self.UB,projections)))
+            elif name == 'tr3D':
+                matrix = np.dot(self.ROT,np.dot(self.UB,self.projectionVectors))
+            elif name in ['invTr2D','invTr3D']:
+                matrix = np.linalg.inv(self.transformation(name.replace('invTr','tr')))
+            elif name == 'hkl2D':
+                matrix = np.dot(np.delete(self.projectionVectors,2,axis=1),self.transformation('invTr2D'))
+            elif name == 'hkl3D':
+                matrix = np.dot(self.projectionVectors,self.transformation('invTr3D'))
+            else:
+                raise AttributeError('Transformation "{}" not understood.'.format(name))
+            transformations[name] = matrix
+        return transformations[name]
+
+    def __getstate__(self):
+        # Observers and deferral are bound to this object and not copied
+        state = dict(self.__dict__)
+        for name in ['_observers','_notificationsDeferred','_notificationPending']:
+            state.pop(name,None)
+        return state
+
+    def __setstate__(self,state):
+        # Samples pickled before UB, ROT and projectionVectors were properties hold them directly
+        for name in ['UB','ROT','projectionVectors']:
+            if name in state:
+                state['_'+name] = state.pop(name)
+        state.pop('_transformations',None)
+        state['_version'] = next(_versions) # Versions are only unique within a session
+        self.__dict__.update(state)
 
 
     def updateCell(self):
@@ -203,9 +367,6 @@ class Sample(object):
         self.P3 = _tools.LengthOrder(np.cross(HKL1,HKL2))
         self.P2 = _tools.LengthOrder(np.cross(self.P3,HKL1))
 
-        self.projectionVectors = np.array([self.P1,self.P2,self.P3]).T
-
-        
         axisVectors = np.eye(3)
         ## Assume that Q1/HKL1 is along x-axis
 
@@ -223,63 +384,35 @@ class Sample(object):
         Rot2*=1.0/np.linalg.norm(Rot2)
         ROT2 = _tools.rotMatrix(Rot2,Alpha2)
 
-        self.ROT = np.dot(ROT2,ROT1)
+        with self.deferNotifications():
+            self.projectionVectors = np.array([self.P1,self.P2,self.P3]).T
+            self.ROT = np.dot(ROT2,ROT1)
 
-        
-        self.projectionB = np.diag(np.linalg.norm(np.dot(self.projectionVectors.T,self.B),axis=1))
+            self.projectionB = np.diag(np.linalg.norm(np.dot(self.projectionVectors.T,self.B),axis=1))
 
-        # Rotates into the scattering plane
-        self.UB = np.dot(self.ROT.T,np.dot(self.projectionB,np.linalg.inv(self.projectionVectors)))#np.linalg.inv(np.dot(Binverse,self.ROT))
+            # Rotates into the scattering plane
+            self.UB = np.dot(self.ROT.T,np.dot(self.projectionB,np.linalg.inv(self.projectionVectors)))#np.linalg.inv(np.dot(Binverse,self.ROT))
 
         
     def tr(self,proj0,proj1,proj2=None):
         """Convert from projX, projY coordinate to Qx',QY' coordinate."""
         if proj2 is None:
-            p0, p1 = np.asarray(proj0), np.asarray(proj1)
-            P = np.array([p0,p1])
-
-            projections = np.delete(self.projectionVectors,2,axis=1)
-            
-            pm = np.delete(np.eye(3),2,axis=0)
-            
-            convert = np.dot(pm,np.dot(self.ROT,np.dot(self.UB,projections)))
+            P = np.array([np.asarray(proj0),np.asarray(proj1)])
+            convert = self.transformation('tr2D')
         else:
-
-            p0, p1, p2 = np.asarray(proj0), np.asarray(proj1), np.asarray(proj2)
-            P = np.array([p0,p1,p2])
-
-            # permutation order of the projection vectors
-            order = np.array([0,1,2])
-
-            projections = self.projectionVectors[:,order]#
-            
-            convert = np.dot(self.ROT,np.dot(self.UB,projections))
+            P = np.array([np.asarray(proj0),np.asarray(proj1),np.asarray(proj2)])
+            convert = self.transformation('tr3D')
         return np.einsum('ij,j...->i...',convert,P)
 
 
     def inv_tr(self,qx,qy, qz = None):
         """Convert from projX, projY coordinate to Qx',QY' coordinate."""
         if qz is None:
-
-            p0, p1 = np.asarray(qx), np.asarray(qy)
-            P = np.array([p0,p1])
-            projections = np.delete(self.projectionVectors,2,axis=1)
-            
-            pm = np.delete(np.eye(3),2,axis=0)
-
-            convert = np.linalg.inv(np.dot(pm,np.dot(self.ROT,np.dot(self.UB,projections))))
+            P = np.array([np.asarray(qx),np.asarray(qy)])
+            convert = self.transformation('invTr2D')
         else:
-            p0, p1, p2 = np.asarray(qx), np.asarray(qy), np.asarray(qz)
-            P = np.array([p0,p1,p2])
-
-            # permutation order of the projection vectors
-            order = np.array([0,1,2])
-
-            projections = self.projectionVectors[:,order]
-            
-            convert = np.linalg.inv(np.dot(self.ROT,np.dot(self.UB,projections)))
-        
-        
+            P = np.array([np.asarray(qx),np.asarray(qy),np.asarray(qz)])
+            convert = self.transformation('invTr3D')
         return np.einsum('ij,j...->i...',convert,P)
 
 
@@ -290,17 +423,10 @@ class Sample(object):
 
     def format_coord(self,x,y,z=None):
         """Format coordinates from Qx'Qy' in rotated frame into HKL."""
-        order = np.array([0,1,2])
         if z is None:
-            proj0,proj1 = self.inv_tr(x,y)
-            projections = np.delete(self.projectionVectors,2,axis=1)
-            rlu = proj0*projections[:,0]+proj1*projections[:,1]
+            rlu = np.dot(self.transformation('hkl2D'),[x,y])
         else:
-            proj0,proj1,proj2=self.inv_tr(*np.asarray([x,y,z])[order])
-            
-            
-            projections = self.projectionVectors
-            rlu = proj0*projections[:,0]+proj1*projections[:,1]+proj2*projections[:,2]
+            rlu = np.dot(self.transformation('hkl3D'),[x,y,z])
         return "h = {0:.3f}, k = {1:.3f}, l = {2:.3f}".format(rlu[0],rlu[1],rlu[2])
 
     
@@ -318,7 +444,7 @@ class Sample(object):
         """convert from projections to HKL."""
         #QxQyQz = np.dot(self.ROT,self.calculateHKLToQxQyQz(H,K,L))
         #projection = self.inv_tr(*QxQyQz)
-        projection = np.dot(np.linalg.inv(self.projectionVectors),np.array([H,K,L]))
+        projection = np.einsum('ij,j...->i...',self.transformation('projectionInv'),np.array([H,K,L]))
         return projection
     
     def setProjectionVectors(self,p1,p2,p3=None):
@@ -339,11 +465,12 @@ class Sample(object):
         if p3 is None:
             p3 = _tools.LengthOrder(np.dot(np.linalg.inv(self.B),np.cross(np.dot(self.B,p1),np.dot(self.B,p2))))
         
-        self.P1=np.array(p1)
-        self.P2=np.array(p2)
-        self.P3=np.array(p3)
-        self.projectionVectors = np.array([self.P1,self.P2,self.P3]).T
-
-        points = [np.dot(self.UB,v) for v in np.asarray([[0.0,0,0.0],p1,p2])]
-        rot,tr = _tools.calculateRotationMatrixAndOffset2(points)
-        self.ROT = rot
\ No newline at end of file
+        with self.deferNotifications():
+            self.P1=np.array(p1)
+            self.P2=np.array(p2)
+            self.P3=np.array(p3)
+            self.projectionVectors = np.array([self.P1,self.P2,self.P3]).T
+
+            points = [np.dot(self.UB,v) for v in np.asarray([[0.0,0,0.0],p1,p2])]
+            rot,tr = _tools.calculateRotationMatrixAndOffset2(points)
+            self.ROT = rot
\ No newline at end of file
@@ -1,13 +1,16 @@
 # SPDX-License-Identifier: MPL-2.0
+import contextlib
 import warnings
 import sys
 import matplotlib.gridspec
+import matplotlib.image
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
 import matplotlib
 pltversion = float('.'.join(matplotlib.__version__.split('.')[:2]))
 from DMCpy import  _tools
+from DMCpy import BinnedVolume
 
 import functools
 
@@ -17,13 +20,13 @@ pythonSubVersion = sys.version_info[1]
 class Viewer3D(object):  
     @_tools.KwargChecker(include=[_tools.MPLKwargs])
     def __init__(self,Data,bins,axis=2, ax=None,log=False, grid = False, adjustable=True, outputFunction=print, 
-                 cmap='viridis', **kwargs):#pragma: no cover
+                 cmap='viridis', fastRendering=False, multiResolution=False, **kwargs):#pragma: no cover
         """3 dimensional viewing object generating interactive Matplotlib figure. 
         Keeps track of all the different plotting functions and variables in order to allow the user to change between different slicing modes and to scroll through the data in an interactive way.
 
         Args:
 
-            - Data (3D array): Intensity array in three dimensions. Assumed to have Qx, Qy, and E along the first, second, and third directions respectively.
+            - Data (3D array or BinnedVolume): Intensity array in three dimensions. Assumed to have Qx, Qy, and E along the first, second, and third directions respectively.
 
             - bins (List of 1D arrays): Coordinates of the three directions as returned by the BinData3D functionality of DataSet.
 
@@ -41,13 +44,26 @@ class Viewer3D(object):
 
             - cmap (str): Name of colormap used for plotting (default viridas)
 
+            - fastRendering (bool): If True, planes on regular grids are shown with imshow and rapid changes of plane are coalesced into a single blitted redraw (default False)
+
+            - multiResolution (bool): If True and Data is a BinnedVolume, a pyramid of coarser binnings is summed from the volume and the level matching the screen resolution is shown when zooming (default False)
+
 
         For an example, see the `quick plotting tutorial <../Tutorials/Quick/QuickView3D.html>`_ under scripting tutorials.
 
         """
 
-        
-        if len(Data)==4: # If data is provided as I, norm, mon, normcount
+        self.volume = None
+        if isinstance(Data,BinnedVolume.BinnedVolume):
+            if multiResolution: # Coarser levels are summed exactly from the histogram sums
+                self.volume = Data
+                self.pyramids = {}
+            self.Data = Data.data
+            if bins is None:
+                bins = Data.bins
+            Data = self.Data
+            self.allData = False
+        elif len(Data)==4: # If data is provided as I, norm, mon, normcount
             with warnings.catch_warnings() as w:
                 self.Data = np.divide(Data[0]*Data[3],Data[1]*Data[2])
             
@@ -60,9 +76,12 @@ class Viewer3D(object):
         else:
             self.Data = Data
             self.allData = False
+        self.log = log
         if log:
             self.Data = np.log10(self.Data+1e-20)
         self.bins = bins
+        self.level = 0
+        self.selector = None
         self.dataLimits = [np.nanmin(Data),np.nanmax(Data)]
 
         gs = matplotlib.gridspec.GridSpec(1, 2, width_ratios=[4, 1]) 
@@ -136,6 +155,7 @@ class Viewer3D(object):
         self.value = 0
         self.cmap = cmap # Update to accommodate deprecation warning
         self.value = 0
+        self.fastRendering = fastRendering
         
 
         viewAxis = axis
@@ -154,6 +174,12 @@ class Viewer3D(object):
         self.Energy_slider.valtext.set_visible(False)
         
         self.Energy_slider.on_changed(lambda val: sliders_on_changed(self,val))
+
+        if self.fastRendering: # Slider and plane are redrawn by blitting
+            self.renderer = _tools.blitRenderer(self.figure,[self.Energy_slider_ax])
+            self.Energy_slider.drawon = False
+        else:
+            self.renderer = None
             
         if not self.rlu:
             self.units = 3*[' 1/AA']
@@ -162,11 +188,13 @@ class Viewer3D(object):
             
         textposition = [self.Energy_slider_ax.get_position().p1[0]+0.005,self.Energy_slider_ax.get_position().p0[1]+0.005]
         self.text = self.figure.text(textposition[0], textposition[1],s=self.stringValue())
+        if self.fastRendering:
+            self.renderer.add(self.text)
         self.shading = 'flat'
         #self.imcbaxes = self.figure.add_axes([0.0, 0.2, 0.2, 0.7])
         #self.im = self.ax.imshow(self.masked_array[:,:,self.value].T,cmap=self.cmap,extent=[self.X[0],self.X[-1],self.Y[0],self.Y[-1]],origin='lower')
         
-        self.im = self.ax.pcolormesh(self.X[:,:,0].T,self.Y[:,:,0].T,self.masked_array[:,:,self.value].T,zorder=10,shading=self.shading,cmap=cmap)
+        self.createImage()
         
         self._caxis = self.im.get_clim()
         self.figpos = [0.125,0.25,0.63,0.63]#self.ax.get_position()
@@ -209,6 +237,12 @@ class Viewer3D(object):
 
             addColorbarSliders(self,c_min=self.caxis[0],c_max=self.caxis[1],c_minval=self.caxis[0],\
                 c_maxval=self.caxis[1],ax_cmin=ax_cmin,ax_cmax=ax_cmax,log=False)
+
+        if not self.volume is None:
+            self.selector = _tools.resolutionSelector(self.ax,[self.volume.edges[a] for a in self.axes[:2]],len(self.pyramid()),self.setLevel)
+            for a in self._axes:
+                self.selector.connect(a)
+            self.selector.update()
        
     @property 
     def caxis(self):
@@ -288,23 +322,77 @@ class Viewer3D(object):
 
         if hasattr(self,'Z'):#'_step'):
             self.ax._step=self.calculateValue()
+        if self.level != 0: # Changing axis starts from the full resolution
+            self.level = 0
+            self.Data = self.levelData(self.volume)
+            self.bins = self.volume.bins
+
+        self.axis = axis
+        self.axes = axes
+        self.updatePlanes()
+        self._axesChanged = True
+        self.label = label
+        self.upperLim = self.Data.shape[axis]-1
+        self.lowerLim = 0
+
+        if not self.selector is None:
+            self.selector.ax = self.ax
+            self.selector.connect(self.ax)
+            self.selector.edges = [self.volume.edges[a] for a in axes[:2]]
+            self.selector.levels = len(self.pyramid())
+            self.selector.level = 0
+
+    def updatePlanes(self):
+        """Arrange data and bin edges of the current level with the view axis last"""
+        axes = self.axes
         X=self.bins[axes[0]].transpose(axes)
         Y=self.bins[axes[1]].transpose(axes)
         Z=self.bins[axes[2]].transpose(axes)
         
         masked_array = np.ma.array (self.Data, mask=np.isnan(self.Data)).transpose(axes)
         self.emptyData = masked_array[:,:,0].T.flatten().copy()
-        self._axesChanged = True
-        upperLim = self.Data.shape[axis]-1
-        self.label = label
         self.X = X
         self.Y = Y
         self.Z = Z
         self.masked_array = masked_array
-        self.axes = axes
-        self.upperLim = upperLim
-        self.lowerLim = 0
-        self.axis = axis
+
+    def levelData(self,volume):
+        """Intensity of volume as plotted"""
+        data = volume.data
+        if self.log:
+            data = np.log10(data+1e-20)
+        return data
+
+    def pyramid(self,axis=None):
+        """Multi-resolution pyramid of the volume with bins combined within the planes perpendicular to axis (default current axis)"""
+        if axis is None:
+            axis = self.axis
+        if not axis in self.pyramids:
+            self.pyramids[axis] = self.volume.pyramid(axes=[a for a in range(3) if a != axis])
+        return self.pyramids[axis]
+
+    def setLevel(self,level):
+        """Show level of the multi-resolution pyramid, i.e. bins within the plane combined in blocks of 2**level, keeping the current zoom"""
+        levels = self.pyramid()
+        level = int(np.clip(level,0,len(levels)-1))
+        if level == self.level:
+            return
+        xlim,ylim = self.ax.get_xlim(),self.ax.get_ylim()
+        self.level = level
+        self.Data = self.levelData(levels[level])
+        self.bins = levels[level].bins
+        self.updatePlanes()
+
+        if self.fastRendering:
+            self.renderer.remove(self.im)
+        self.im.remove()
+        self.createImage()
+        self.im.set_clim(self.caxis)
+        self.colorbar.update_normal(self.im)
+        self.plot()
+        self.ax.set_xlim(xlim)
+        self.ax.set_ylim(ylim)
+        self.figure.canvas.draw_idle()
 
     def calculateValue(self):
         try:
@@ -329,6 +417,19 @@ class Viewer3D(object):
         self.Energy_slider.set_val(value)
         
     
+    def createImage(self):
+        """Create image of the current plane. With fast rendering, regular grids are shown using imshow and the image is blitted."""
+        data = self.masked_array[:,:,self.value].T
+        # Changes of limits while the image is created do not change the pyramid level
+        with contextlib.nullcontext() if self.selector is None else self.selector.suspended():
+            if self.fastRendering and _tools.isRegularGrid(self.X[:,:,0],self.Y[:,:,0]):
+                extent = [self.X[0,0,0],self.X[-1,0,0],self.Y[0,0,0],self.Y[0,-1,0]]
+                self.im = self.ax.imshow(data,extent=extent,origin='lower',aspect=self.ax.get_aspect(),interpolation='nearest',zorder=10,cmap=self.cmap)
+            else:
+                self.im = self.ax.pcolormesh(self.X[:,:,0].T,self.Y[:,:,0].T,data,zorder=10,shading=self.shading,cmap=self.cmap)
+        if self.fastRendering:
+            self.renderer.add(self.im)
+
     def plot(self):
         self.text.set_text(self.stringValue())
         try:
@@ -336,6 +437,8 @@ class Viewer3D(object):
             #self.im.set_array(self.emptyData)
         except TypeError:
             pass
+        if self.fastRendering: # The new plane is shown directly
+            self._axesChanged = False
         if self._axesChanged:
             if pltversion>3.69:
                 tempData = np.ma.array(self.im.get_array())
@@ -344,6 +447,8 @@ class Viewer3D(object):
             tempData.mask = np.ones_like(tempData,dtype=bool)
             self.im.set_array(tempData.T)
             self._axesChanged = False
+        elif isinstance(self.im,matplotlib.image.AxesImage):
+            self.im.set_array(self.masked_array[:,:,int(self.value)].T)
         else:
             self.im.set_array(self.masked_array[:,:,int(self.value)].T.flatten())
         self.im.set_clim(self.caxis)
@@ -355,6 +460,14 @@ class Viewer3D(object):
             self.ax.grid(self.grid,zorder=self.gridZOrder)
         else:
             self.ax.grid(self.grid)
+
+    def redraw(self):
+        """Plot the current plane, coalescing rapid changes into one blitted redraw when rendering fast"""
+        if self.fastRendering:
+            self.renderer.request(self.plot)
+        else:
+            self.plot()
+
     def set_title(self,title):
         self.ax.set_title(title)
 
@@ -364,7 +477,7 @@ class Viewer3D(object):
             if self.axis!=0:
                 reloadslider(self,0)
 
-                self.im = self.ax.pcolormesh(self.X[:,:,0].T,self.Y[:,:,0].T,self.masked_array[:,:,self.value].T,zorder=10,shading=self.shading,cmap=self.cmap)
+                self.createImage()
                 self.im.set_clim(self.caxis)
                 self.Energy_slider.set_val(0)
                 self.plot()
@@ -373,7 +486,7 @@ class Viewer3D(object):
         if axis in [1]:
             if self.axis!=1:
                 reloadslider(self,1)
-                self.im = self.ax.pcolormesh(self.X[:,:,0].T,self.Y[:,:,0].T,self.masked_array[:,:,self.value].T,zorder=10,shading=self.shading,cmap=self.cmap)
+                self.createImage()
                 self.im.set_clim(self.caxis)
                 self.Energy_slider.set_val(0)
                 self.plot()
@@ -383,7 +496,7 @@ class Viewer3D(object):
             if self.axis!=2:
                 reloadslider(self,2)
 
-                self.im = self.ax.pcolormesh(self.X[:,:,0].T,self.Y[:,:,0].T,self.masked_array[:,:,self.value].T,zorder=10,shading=self.shading,cmap=self.cmap)
+                self.createImage()
                 self.im.set_clim(self.caxis)
                 self.Energy_slider.set_val(0)
                 self.plot()
@@ -470,6 +583,9 @@ def reloadslider(self,axis): # pragma: no cover
     self.Energy_slider.valtext.set_visible(False)
     self.Energy_slider.on_changed(lambda val: sliders_on_changed(self,val))
     self.value=0
+    if self.fastRendering:
+        self.Energy_slider.drawon = False
+        self.renderer.remove(self.im)
     self.im.remove()
     
         
@@ -501,11 +617,11 @@ def sliders_on_changed(self,val): # pragma: no cover
         if value!=val:
             self.value = val
             self.Energy_slider.set_val(value)
-            self.plot()
+            self.redraw()
         else:
             self.value = val
             #self.Energy_slider.set_val(value)
-            self.plot()
+            self.redraw()
     if hasattr(self.ax,'_step'):
         val = self.calculateValue()
         self.ax._step=val
@@ -14,25 +14,48 @@ __author__ = 'Jakob Lass, Sam Moody, Øystein S. Fjellvåg'
 #calibrationFile =  os.path.join(installFolder,'DMCpy','calibrationDict.dat')
 
 installFolder = os.path.dirname(__file__)
-calibrationFile = os.path.join(installFolder, './src/DMCpy/calibrationDict.dat')
-
-try:
-    with open(calibrationFile, 'rb') as f:
-        calibrationDict = pickle.load(f)
-        
-except FileNotFoundError:
-    def find(name, path):
-        result = []
-        for root, dirs, files in os.walk(path):
-            if name in files:
-                result.append(os.path.join(root, name))
-        return result
-
-    foundFiles = find('calibrationDict.dat', os.path.abspath(os.path.join(installFolder, '..', '..')))
-    
-    if not foundFiles:
-        raise FileNotFoundError("calibrationDict.dat not found in expected locations.")
-    
-    foundFile = foundFiles[0]
-    with open(foundFile, 'rb') as f:
-        calibrationDict = pickle.load(f)
\ No newline at end of file
+calibrationFile = os.path.join(installFolder, 'calibrationDict.dat')
+
+
+def loadCalibrationDict():
+    """Load the detector calibration tables shipped with DMCpy.
+
+    The memory-mapped calibration store of the installation is used when present. Otherwise calibrationDict.dat is
+    converted into a store in Calibration.userStoreFolder on first use, falling back to the pickled dictionary if the
+    folder is not writable.
+    """
+    from DMCpy import Calibration
+    store = Calibration.CalibrationStore()
+    if len(store.keys()) > 0:
+        return store
+
+    if not os.path.exists(calibrationFile):
+        def find(name, path):
+            result = []
+            for root, dirs, files in os.walk(path):
+                if name in files:
+                    result.append(os.path.join(root, name))
+            return result
+
+        foundFiles = find('calibrationDict.dat', os.path.abspath(os.path.join(installFolder, '..', '..')))
+
+        if not foundFiles:
+            raise FileNotFoundError("calibrationDict.dat not found in expected locations.")
+        fileName = foundFiles[0]
+    else:
+        fileName = calibrationFile
+
+    try:
+        return Calibration.convertedStore(fileName)
+    except OSError:
+        with open(fileName, 'rb') as f:
+            return pickle.load(f)
+
+
+def __getattr__(name):
+    # The calibration tables are only loaded when first used, keeping 'import DMCpy' fast
+    if name == 'calibrationDict':
+        global calibrationDict
+        calibrationDict = loadCalibrationDict()
+        return calibrationDict
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__,name))
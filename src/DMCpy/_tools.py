@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: MPL-2.0
+import contextlib
 import functools
 import sys
+import threading
 sys.path.append('.')
 import numpy as np
 from difflib import SequenceMatcher
@@ -11,7 +13,8 @@ import pickle
 import h5py as hdf
 import datetime, shutil
 from DMCpy.FileStructure import shallowRead, HDFTranslationAlternatives, HDFTranslation, HDFCounts
-from scipy.optimize import curve_fit
+import importlib
+import warnings
 import DMCpy
 
 
@@ -42,15 +45,25 @@ def KwargChecker(function=None,include=None):
         return newFunc
     return KwargCheckerNone
 
+def resolveFunction(function):
+    """Return function, importing it first if given by its full name, e.g. 'matplotlib.pyplot.errorbar'.
+    This allows decorators to refer to functions of modules that are only imported when used."""
+    if isinstance(function,str):
+        moduleName,name = function.rsplit('.',1)
+        return getattr(importlib.import_module(moduleName),name)
+    return function
+
 def extractArgsList(func,newFunc,function,include):
     N = func.__code__.co_argcount # Number of arguments with which the function is called
     argList = list(newFunc._original.__code__.co_varnames[:N]) # List of arguments
     if not function is None:
         if isinstance(function,(list,np.ndarray)): # allow function kwarg to be list or ndarray
             for f in function:
+                f = resolveFunction(f)
                 for arg in f.__code__.co_varnames[:f.__code__.co_argcount]: # extract all arguments from function
                     argList.append(str(arg))
         else: # if single function
+            function = resolveFunction(function)
             for arg in function.__code__.co_varnames[:function.__code__.co_argcount]:
                 argList.append(str(arg))
     if not include is None:
@@ -736,15 +749,291 @@ def without_keys(dictionary, keys): # Remove key word argument from kwargs
     return {x: dictionary[x] for x in dictionary if x not in keys}
 
 
+# Progress callbacks registered per thread, see reportProgress
+_progress = threading.local()
+
+
+@contextlib.contextmanager
+def reportProgress(callback):
+    """Report progress of the reductions performed in the current thread.
+
+    Args:
+
+        - callback (function): Called as callback(done,total) before each chunk of scan steps is treated. Exceptions raised by the callback, e.g. to cancel a reduction running in a background thread, stop the reduction
+
+    """
+    previous = getattr(_progress,'callback',None)
+    _progress.callback = callback
+    try:
+        yield
+    finally:
+        _progress.callback = previous
+
+
 def arange(start,stop,step):
+        callback = getattr(_progress,'callback',None)
         stepsTaken = 0
         while start+step*(stepsTaken+1)<stop:
+            if not callback is None:
+                callback(step*stepsTaken,stop-start)
             yield (start+step*stepsTaken,start+step*(stepsTaken+1))
             stepsTaken+=1
             
+        if not callback is None:
+            callback(step*stepsTaken,stop-start)
         yield(start+step*stepsTaken,stop)
 
 
+# Memory in bytes available for a single chunk of scan steps in the reductions
+memoryBudget = 512*1024**2
+
+
+def countChunkLayout(df):
+    """Return the number of scan steps in each HDF chunk of the counts of df (None if not chunked or held in memory)"""
+    if not hasattr(df,'_countChunks'):
+        df._countChunks = None
+        if getattr(df,'_counts',None) is None and hasattr(df,'folder'):
+            try:
+                with hdf.File(os.path.join(df.folder,df.fileName),mode='r') as f:
+                    chunks = f.get(HDFCounts).chunks
+                if not chunks is None and len(chunks) == 3:
+                    df._countChunks = chunks[0]
+            except (OSError,AttributeError):
+                pass
+    return df._countChunks
+
+
+def planSteps(df,memoryBudget=None,dtype=None,shape=None):
+    """Find the number of scan steps treated simultaneously such that a chunk fits within the memory budget.
+
+    The footprint of a single step is the Q vector, the rotated and masked positions, counts, intensity,
+    monitor and mask of all pixels. When the counts are stored chunked in the HDF file, the number of steps
+    is aligned to the chunk layout to avoid decompressing chunks repeatedly.
+
+    Args:
+
+        - df (DataFile): Data file to be treated
+
+    Kwargs:
+
+        - memoryBudget (int): Memory in bytes available for a chunk (default _tools.memoryBudget)
+
+        - dtype (dtype): Data type used in the calculations (default df.dtype)
+
+        - shape (tuple): Shape of the counts with scan steps along the first axis (default df.countShape)
+
+    Returns:
+
+        - steps (int): Number of scan steps per chunk
+
+    """
+    if memoryBudget is None:
+        memoryBudget = DMCpy._tools.memoryBudget
+    if dtype is None:
+        dtype = getattr(df,'dtype',np.float64)
+    if shape is None:
+        shape = df.countShape
+
+    itemSize = np.dtype(dtype).itemsize
+    pixels = np.prod(shape[1:])
+    # q, rotated positions and masked positions (3 each), counts, intensity and monitor, and mask plus its inverse
+    bytesPerStep = pixels*(12*itemSize+2)
+
+    steps = int(np.clip(memoryBudget//bytesPerStep,1,shape[0]))
+
+    chunkSteps = countChunkLayout(df)
+    if not chunkSteps is None and steps < shape[0]:
+        if steps >= chunkSteps:
+            steps = (steps//chunkSteps)*chunkSteps
+        else:
+            steps = np.max([d for d in range(1,steps+1) if chunkSteps % d == 0])
+    return int(steps)
+
+
+def isRegularGrid(X,Y):
+    """Check if the 2D bin edges X and Y form an axis-aligned grid with equal bin sizes, such that the data can be shown with imshow.
+
+    Args:
+
+        - X (array): Bin edges along first direction, shape (nx+1,ny+1)
+
+        - Y (array): Bin edges along second direction, shape (nx+1,ny+1)
+
+    """
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    if X.ndim != 2 or X.shape != Y.shape or np.any(np.array(X.shape)<2):
+        return False
+    if not (np.allclose(X,X[:,:1]) and np.allclose(Y,Y[:1,:])):
+        return False
+    steps = [np.diff(X[:,0]),np.diff(Y[0,:])]
+    return bool(np.all([np.allclose(step,step[0]) and step[0] != 0 for step in steps]))
+
+
+# Redraws selected artists of an interactive figure by blitting them on top of a cached background and
+# coalesces rapid updates, e.g. from sliders or scrolling, into a single redraw. The artists are marked as
+# animated and are drawn after each full draw of the figure; figure.savefig is wrapped to include them.
+# Without a GUI event loop, or when the canvas does not support blitting, updates are applied directly. Usage:
+# renderer = blitRenderer(figure,[image,text],interval=30)
+# renderer.request(update): calls update() and redraws the artists within interval ms. Requests arriving
+# before then replace the pending one, such that only the latest is drawn.
+class blitRenderer(object):
+    def __init__(self,figure,artists=(),interval=30):
+        import matplotlib
+        self.figure = figure
+        self.canvas = figure.canvas
+        self.interval = interval
+        self.artists = []
+        self.background = None
+        self.pending = None
+        self.timer = None
+        self.saving = False
+        backend = matplotlib.get_backend().lower()
+        self.interactive = not (backend in ['agg','pdf','ps','svg','pgf','cairo','template'] or 'inline' in backend)
+        for artist in artists:
+            self.add(artist)
+        self.drawId = self.canvas.mpl_connect('draw_event',self.onDraw)
+
+        self._savefig = figure.savefig
+        @functools.wraps(figure.savefig)
+        def savefig(*args,**kwargs):
+            self.saving = True
+            for artist in self.artists:
+                artist.set_animated(False)
+            try:
+                return self._savefig(*args,**kwargs)
+            finally:
+                self.saving = False
+                for artist in self.artists:
+                    artist.set_animated(True)
+        figure.savefig = savefig
+
+    def add(self,artist):
+        artist.set_animated(True)
+        self.artists.append(artist)
+
+    def remove(self,artist):
+        if artist in self.artists:
+            self.artists.remove(artist)
+            artist.set_animated(False)
+
+    def onDraw(self,event):
+        # Full draw of the figure without the animated artists, which are drawn on top
+        if self.saving: # Artists are part of the saved figure
+            return
+        if self.canvas.supports_blit:
+            self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.drawArtists()
+
+    def drawArtists(self):
+        for artist in self.artists:
+            if not artist.figure is None and artist.get_visible():
+                self.figure.draw_artist(artist)
+
+    def request(self,update):
+        self.pending = update
+        if not self.interactive or self.interval <= 0:
+            self.flush()
+            return
+        if self.timer is None:
+            self.timer = self.canvas.new_timer(interval=self.interval)
+            self.timer.single_shot = True
+            self.timer.add_callback(self.flush)
+            self.timer.start()
+
+    def flush(self):
+        """Apply the pending update and redraw the artists"""
+        self.timer = None
+        update,self.pending = self.pending,None
+        if update is None:
+            return
+        update()
+        if self.background is None or not self.canvas.supports_blit:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.drawArtists()
+        self.canvas.blit(self.figure.bbox)
+
+
+def pyramidLevel(edges,limits,pixels,levels):
+    """Find the finest level of a multi-resolution pyramid with at most one bin per screen pixel.
+
+    Args:
+
+        - edges (list): Bin edges of level 0 along the x and y direction of the plot
+
+        - limits (list): Visible range along x and y, i.e. [ax.get_xlim(),ax.get_ylim()]
+
+        - pixels (list): Size of the axes in screen pixels along x and y
+
+        - levels (int): Number of levels in the pyramid, level n having 2**n times coarser bins
+
+    Returns:
+
+        - level (int): Level matching the screen resolution
+
+    """
+    ratio = 0.0
+    for e,lim,px in zip(edges,limits,pixels):
+        e = np.asarray(e)
+        lower,upper = np.min(lim),np.max(lim)
+        visible = np.sum(np.logical_and(e[1:]>lower,e[:-1]<upper))
+        ratio = np.max([ratio,visible/np.max([px,1.0])])
+    if ratio <= 1.0:
+        return 0
+    return int(np.min([np.ceil(np.log2(ratio)),levels-1]))
+
+
+# Selects the level of a multi-resolution pyramid matching the screen resolution of an axes and calls
+# setLevel(level) whenever zooming, panning or resizing the figure changes it. Usage:
+# selector = resolutionSelector(ax,edges,levels,setLevel)
+# selector.ax, selector.edges and selector.levels can be changed when the plotted data changes, followed by selector.update()
+class resolutionSelector(object):
+    def __init__(self,ax,edges,levels,setLevel):
+        self.ax = ax
+        self.edges = edges
+        self.levels = levels
+        self.setLevel = setLevel
+        self.level = 0
+        self.updating = False
+        self.connected = []
+        self.connect(ax)
+        self.resizeId = ax.get_figure().canvas.mpl_connect('resize_event',lambda event: self.update())
+
+    def connect(self,ax):
+        """Follow changes of the limits of ax"""
+        if ax in self.connected:
+            return
+        ax.callbacks.connect('xlim_changed',self.limitsChanged)
+        ax.callbacks.connect('ylim_changed',self.limitsChanged)
+        self.connected.append(ax)
+
+    def limitsChanged(self,ax):
+        if ax is self.ax:
+            self.update()
+
+    def update(self):
+        if self.updating: # Limits are changed while finding or changing level
+            return
+        with self.suspended():
+            self.ax.apply_aspect() # Size of axes with fixed aspect depends on the limits
+            extent = self.ax.get_window_extent()
+            level = pyramidLevel(self.edges,[self.ax.get_xlim(),self.ax.get_ylim()],[extent.width,extent.height],self.levels)
+            if level != self.level:
+                self.setLevel(level)
+                self.level = level
+
+    @contextlib.contextmanager
+    def suspended(self):
+        """Ignore changes of limits, e.g. while the plotted data is replaced"""
+        updating,self.updating = self.updating,True
+        try:
+            yield
+        finally:
+            self.updating = updating
+
+
 def calculateRotationMatrixAndOffset(points):
     
     v1, v2, v3 = points
@@ -1082,6 +1371,8 @@ def histogramdd(sample, bins, weights, returnCounts = False):
     edges = D*[None]
     for i in range(D):
         edges[i] = np.asarray(bins[i])
+        if np.issubdtype(sample.dtype,np.floating) and sample.dtype.itemsize < edges[i].dtype.itemsize: # Find bin index in precision of sample
+            edges[i] = edges[i].astype(sample.dtype)
         nbin[i] = len(edges[i])+1
     
 
@@ -1115,8 +1406,8 @@ def histogramdd(sample, bins, weights, returnCounts = False):
         # Shape into a proper matrix
         hist = hist.reshape(nbin)
 
-        # This preserves the (bad) behavior observed in gh-7845, for now.
-        hist = hist.astype(w.dtype)#, casting='safe')
+        # Sums of floating point weights are kept in float64 independently of the precision of the weights
+        hist = hist.astype(np.float64 if np.issubdtype(w.dtype,np.floating) else w.dtype)
 
         # Remove outliers (indices 0 and -1 for each dimension).
         core = D*(slice(1, -1),)
@@ -1156,7 +1447,226 @@ def gauss(x, H, A, x0, sigma):
     return H + A * np.exp(-(x - x0) ** 2 / (2 * sigma ** 2))
 
 def gauss_fit(x, y):
+    from scipy.optimize import curve_fit
     mean = sum(x * y) / sum(y)
     sigma = np.sqrt(sum(y * (x - mean) ** 2) / sum(y))
     popt, pcov = curve_fit(gauss, x, y, p0=[min(y), max(y), mean, sigma])
-    return popt
\ No newline at end of file
+    return popt
+
+def gaussJacobian(x, H, A, x0, sigma):
+    """Analytical derivatives of gauss with respect to H, A, x0 and sigma, stacked along the last axis"""
+    diff = x - x0
+    e = np.exp(-diff ** 2 / (2 * sigma ** 2))
+    return np.stack([np.ones_like(e), e, A * e * diff / sigma ** 2, A * e * diff ** 2 / sigma ** 3], axis=-1)
+
+
+# Fields of the table returned by fitGaussians
+gaussFitFields = ['H','A','x0','sigma','FWHM','integrated']
+
+def fitGaussians(x, y, yErr=None, p0=None, maxIterations=1000, tolerance=1.49e-8, gradientTolerance=1e-8):
+    """Fit many curves simultaneously with a Gaussian on a constant background, H + A*exp(-(x-x0)^2/(2 sigma^2)).
+
+    All curves are fitted together by a vectorized Levenberg-Marquardt least squares using the analytical Jacobian.
+    The fit is started from the moments of each curve as in gauss_fit, from the maximum and from the moments above
+    the median of each curve and from p0 if provided, keeping the best result. Curves not converged are refitted with scipy's curve_fit.
+    Curves of different lengths are padded and NaN values are ignored.
+
+    Args:
+
+        - x (list): Positions of each curve, list of 1D arrays
+
+        - y (list): Values of each curve, list of 1D arrays
+
+    Kwargs:
+
+        - yErr (list): Uncertainties of y used as weights. If None, parameter errors are scaled by the residuals (default None)
+
+        - p0 (array): Additional starting parameters H, A, x0, sigma of shape (N,4) (default None)
+
+        - maxIterations (int): Maximal number of iterations (default 1000)
+
+        - tolerance (float): Relative change in the sum of squared residuals or in the parameters at which a fit has converged (default 1.49e-8 as in curve_fit)
+
+        - gradientTolerance (float): Largest cosine between the residuals and the columns of the Jacobian at which a fit has converged (default 1e-8)
+
+    Returns:
+
+        - table (structured array): One row per curve with fields H, A, x0, sigma, FWHM and integrated, their errors
+          (prefixed 'd', e.g. dx0), chi2 (reduced) and converged
+
+    """
+    N = len(y)
+    fields = [(name,float) for name in gaussFitFields]+[('d'+name,float) for name in gaussFitFields]+[('chi2',float),('converged',bool)]
+    if N == 0: # Nothing to fit
+        return np.zeros(0,dtype=fields)
+    M = np.max([len(yy) for yy in y])
+    X = np.zeros((N,M))
+    Y = np.zeros((N,M))
+    W = np.zeros((N,M)) # Square root of weights, 0 for padding
+    for i,(xx,yy) in enumerate(zip(x,y)):
+        X[i,:len(xx)] = xx
+        Y[i,:len(yy)] = yy
+        W[i,:len(yy)] = 1.0 if yErr is None else 1.0/np.asarray(yErr[i],dtype=float)
+    W[np.logical_not(np.isfinite(Y*W))] = 0.0
+    Y[W==0] = 0.0
+    points = np.sum(W>0,axis=1)
+
+    # Starting parameters from the moments of each curve as in gauss_fit, from its maximum above the median and
+    # from its moments above the median
+    valid = W>0
+    minimum = np.min(np.where(valid,Y,np.inf),axis=1)
+    maximum = np.max(np.where(valid,Y,-np.inf),axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        mean = np.sum(X*Y,axis=1)/np.sum(Y,axis=1)
+        sigma = np.sqrt(np.sum(Y*(X-mean[:,np.newaxis])**2,axis=1)/np.sum(Y,axis=1))
+        median = np.nanmedian(np.where(valid,Y,np.nan),axis=1)
+    spacing = (np.max(np.where(valid,X,-np.inf),axis=1)-np.min(np.where(valid,X,np.inf),axis=1))/np.maximum(points-1,1)
+    # Width from the number of points above half maximum, at least one point for sharp peaks
+    aboveHalf = np.sum(valid & (Y > 0.5*(median+maximum)[:,np.newaxis]),axis=1)
+    halfWidthSigma = np.maximum(aboveHalf,1)*spacing/(2.0*np.sqrt(2.0*np.log(2.0)))
+    # Fall back to position of maximum and width of the scan for curves without a meaningful first moment
+    peakPosition = X[np.arange(N),np.argmax(np.where(valid,Y,-np.inf),axis=1)]
+    width = 0.25*spacing*np.maximum(points-1,1)
+    mean = np.where(np.isfinite(mean),mean,peakPosition)
+    sigma = np.where(np.isfinite(sigma) & (sigma>0),sigma,width)
+    halfWidthSigma = np.where(halfWidthSigma>0,halfWidthSigma,width)
+    # Moments above the median, robust against a large background
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        signal = np.where(valid,np.clip(Y-median[:,np.newaxis],0.0,None),0.0)
+        signalMean = np.sum(X*signal,axis=1)/np.sum(signal,axis=1)
+        signalSigma = np.sqrt(np.sum(signal*(X-signalMean[:,np.newaxis])**2,axis=1)/np.sum(signal,axis=1))
+    signalMean = np.where(np.isfinite(signalMean),signalMean,peakPosition)
+    signalSigma = np.where(np.isfinite(signalSigma) & (signalSigma>0),signalSigma,width)
+    starts = [np.array([minimum,maximum,mean,sigma]).T,
+              np.array([median,maximum-median,peakPosition,halfWidthSigma]).T,
+              np.array([median,maximum-median,signalMean,signalSigma]).T]
+    if not p0 is None:
+        starts.insert(0,p0)
+
+    def evaluate(p,rows=slice(None)):
+        H, A, x0, sigma = [v[:,np.newaxis] for v in p.T]
+        w = W[rows]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            residual = w*(Y[rows]-gauss(X[rows],H,A,x0,sigma))
+            jacobian = w[:,:,np.newaxis]*gaussJacobian(X[rows],H,A,x0,sigma)
+        residual[w==0] = 0.0
+        jacobian[w==0] = 0.0
+        return residual, jacobian, np.sum(residual**2,axis=1)
+
+    def levenbergMarquardt(p):
+        residual, jacobian, cost = evaluate(p)
+        damping = np.full(N,1e-3)
+        increase = np.full(N,2.0)
+        scale = np.zeros((N,4)) # Largest squared column norms of the Jacobian seen, scaling the damping as in MINPACK
+        converged = np.zeros(N,dtype=bool)
+        active = np.flatnonzero(np.all(np.isfinite(p),axis=1) & np.isfinite(cost))
+
+        for _ in range(maxIterations):
+            if len(active) == 0:
+                break
+            JTJ = np.einsum('nmi,nmj->nij',jacobian[active],jacobian[active])
+            JTr = np.einsum('nmi,nm->ni',jacobian[active],residual[active])
+            diagonal = np.einsum('nii->ni',JTJ)
+            scale[active] = np.maximum(scale[active],diagonal)
+
+            # Converged when the residuals are orthogonal to all columns of the Jacobian, i.e. the gradient vanishes
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                cosine = np.max(np.abs(JTr)/np.sqrt(diagonal*cost[active,np.newaxis]),axis=1)
+            orthogonal = (cosine <= gradientTolerance) | (cost[active] == 0)
+
+            system = JTJ+(damping[active,np.newaxis]*scale[active]+1e-300)[:,:,np.newaxis]*np.eye(4)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                step = np.einsum('nij,nj->ni',np.linalg.pinv(system),JTr)
+
+            pNew = p[active]+step
+            residualNew, jacobianNew, costNew = evaluate(pNew,active)
+
+            better = np.isfinite(costNew) & (costNew <= cost[active]) & np.all(np.isfinite(jacobianNew),axis=(1,2))
+            improvement = cost[active]-costNew
+            # Gain ratio between actual and predicted reduction of the squared residuals sets the damping (Nielsen)
+            predicted = np.einsum('ni,ni->n',step,damping[active,np.newaxis]*scale[active]*step+JTr)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                gain = np.where(predicted>0,improvement/predicted,0.0)
+            smallStep = np.all(np.abs(step) <= tolerance*(np.abs(p[active])+tolerance),axis=1)
+            # Small steps and improvements only signal convergence for steps close to Gauss-Newton, not when heavily damped
+            done = orthogonal | (better & (damping[active] <= 1.0) & ((improvement <= tolerance*cost[active]) | smallStep))
+            improved = active[better]
+            p[improved] = pNew[better]
+            residual[improved] = residualNew[better]
+            jacobian[improved] = jacobianNew[better]
+            cost[improved] = costNew[better]
+            damping[active] *= np.where(better,np.maximum(1/3,1-(2*np.clip(gain,0,1)-1)**3),increase[active])
+            increase[active] = np.where(better,2.0,2*increase[active])
+
+            converged[active[done]] = True
+            # Curves without further improvement possible within numerical precision are stopped unconverged
+            active = active[np.logical_not(done | (damping[active] > 1e16))]
+        return p, cost, converged
+
+    p, cost, converged = levenbergMarquardt(np.array(starts[0],dtype=float).reshape(N,4))
+    for start in starts[1:]:
+        pOther, costOther, convergedOther = levenbergMarquardt(np.array(start,dtype=float).reshape(N,4))
+        use = np.isfinite(costOther) & ((costOther < cost) | np.logical_not(np.isfinite(cost)))
+        p[use] = pOther[use]
+        cost[use] = costOther[use]
+        converged[use] = convergedOther[use]
+
+    # Refit curves not converged, e.g. very sharp peaks, with curve_fit
+    if not np.all(converged):
+        from scipy.optimize import curve_fit
+        for i in np.flatnonzero(np.logical_not(converged) & (points>=4)):
+            use = W[i]>0
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    popt,_ = curve_fit(gauss,X[i,use],Y[i,use],p0=p[i] if np.all(np.isfinite(p[i])) else starts[-1][i],
+                                       sigma=1.0/W[i,use],maxfev=100*maxIterations)
+            except (RuntimeError,ValueError):
+                continue
+            costFit = np.sum((W[i,use]*(Y[i,use]-gauss(X[i,use],*popt)))**2)
+            if np.isfinite(costFit) and not costFit > cost[i]:
+                p[i] = popt
+                converged[i] = True
+
+    residual, jacobian, cost = evaluate(p)
+
+    # Covariance from the singular values of the Jacobian as in curve_fit, such that poorly determined parameters get large errors
+    finite = np.all(np.isfinite(jacobian),axis=(1,2))
+    covariance = np.full((N,4,4),np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        _,singular,VT = np.linalg.svd(jacobian[finite],full_matrices=False)
+        threshold = np.finfo(float).eps*M*singular[:,:1]
+        inverseSquared = np.where(singular>threshold,1.0/singular**2,0.0)
+        covariance[finite] = np.einsum('nki,nk,nkj->nij',VT,inverseSquared,VT)
+        dof = np.maximum(points-4,1)
+        reducedChi2 = cost/dof
+        if yErr is None:
+            covariance *= reducedChi2[:,np.newaxis,np.newaxis]
+
+        H, A, x0, sigma = p.T
+        sigma = np.abs(sigma)
+        # Derived quantities and their gradients with respect to H, A, x0, sigma
+        FWHM = 2.0*np.sqrt(2.0*np.log(2.0))*sigma
+        integrated = A*np.sqrt(2*np.pi)*sigma
+        sign = np.sign(p[:,3])
+        gradients = {'FWHM':np.array([0*H,0*H,0*H,2.0*np.sqrt(2.0*np.log(2.0))*sign]).T,
+                     'integrated':np.array([0*H,np.sqrt(2*np.pi)*sigma,0*H,A*np.sqrt(2*np.pi)*sign]).T}
+        errors = np.sqrt(np.einsum('nii->ni',covariance))
+
+    table = np.zeros(N,dtype=fields)
+    for name,value,error in zip(gaussFitFields[:4],[H,A,x0,sigma],errors.T):
+        table[name] = value
+        table['d'+name] = error
+    for name,value in [('FWHM',FWHM),('integrated',integrated)]:
+        table[name] = value
+        table['d'+name] = np.sqrt(np.einsum('ni,nij,nj->n',gradients[name],covariance,gradients[name]))
+    table['chi2'] = reducedChi2
+    table['converged'] = converged
+    return table
@@ -0,0 +1,135 @@
+from DMCpy import BinnedVolume
+import numpy as np
+
+
+def makeVolume(shape=(6,4,5)):
+    edges = [np.linspace(0,1,n+1) for n in shape]
+    rng = np.random.default_rng(0)
+    intensity = rng.poisson(10,size=shape).astype(float)
+    monitor = np.full(shape,2.0)
+    counts = np.ones(shape,dtype=int)
+    counts[0,0,0] = 0
+    intensity[0,0,0] = 0.0
+    monitor[0,0,0] = 0.0
+    return BinnedVolume.BinnedVolume(intensity=intensity,monitor=monitor,counts=counts,edges=edges)
+
+
+def test_BinnedVolume_init():
+    volume = makeVolume()
+    assert(volume.ndim == 3)
+    assert(volume.shape == (6,4,5))
+    assert(np.all([b.shape == (7,5,6) for b in volume.bins]))
+    assert(np.isnan(volume.data[0,0,0]))
+    assert(np.allclose(volume.data[1:],volume.intensity[1:]/2.0))
+    assert(np.allclose(volume.errors[1:],np.sqrt(volume.intensity[1:])/2.0))
+
+    try:
+        BinnedVolume.BinnedVolume(intensity=np.zeros((2,2)),monitor=np.zeros((2,2)),counts=np.zeros((2,2)),edges=[np.arange(4),np.arange(3)])
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_BinnedVolume_project_slice():
+    volume = makeVolume()
+
+    projection = volume.project(axis=2)
+    assert(projection.shape == (6,4))
+    assert(np.isclose(projection.intensity.sum(),volume.intensity.sum()))
+    assert(np.allclose(projection.counts,volume.counts.sum(axis=2)))
+
+    partial = volume.project(axis=0,start=0.2,stop=0.6)
+    centres = volume.centres[0]
+    inside = np.logical_and(centres>=0.2,centres<=0.6)
+    assert(np.allclose(partial.intensity,volume.intensity[inside].sum(axis=0)))
+
+    layer = volume.slice(axis=1,value=0.3)
+    assert(layer.shape == (6,5))
+    assert(np.allclose(layer.intensity,volume.intensity[:,1]))
+
+    try:
+        volume.slice(axis=1,value=2.0)
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_BinnedVolume_rebin():
+    volume = makeVolume()
+    coarse = volume.rebin([2,2,2])
+    assert(coarse.shape == (3,2,2))
+    assert(np.allclose(coarse.edges[2],[0.0,0.4,0.8]))
+    assert(np.isclose(coarse.intensity.sum(),volume.intensity[:,:,:4].sum()))
+    assert(np.isclose(coarse.monitor[0,0,0],volume.monitor[:2,:2,:2].sum()))
+
+    padded = volume.rebin([4,1,3],pad=True)
+    assert(padded.shape == (2,4,2))
+    assert(np.allclose(padded.edges[0],[0.0,4/6,8/6]))
+    assert(np.isclose(padded.intensity.sum(),volume.intensity.sum()))
+    assert(np.isclose(padded.counts[1,0,1],volume.counts[4:,0,3:].sum()))
+
+
+def test_BinnedVolume_pyramid():
+    volume = makeVolume()
+    levels = volume.pyramid(axes=[0,1],minimumBins=2)
+    assert(levels[0] is volume)
+    assert([level.shape for level in levels] == [(6,4,5),(3,2,5),(2,1,5)])
+    for level in levels[1:]:
+        assert(np.allclose(level.edges[2],volume.edges[2]))
+        for name in ['intensity','monitor','counts','variance']:
+            assert(np.isclose(getattr(level,name).sum(),getattr(volume,name).sum()))
+    # Each level equals binning with 2**level times larger bins
+    assert(np.allclose(levels[2].intensity[0],volume.intensity[:4].sum(axis=(0,1))))
+    assert(np.allclose(levels[2].edges[0],[0.0,4/6,8/6]))
+
+    assert(len(volume.pyramid()) == 1)
+    assert(volume.pyramid(minimumBins=1)[-1].shape == (1,1,1))
+
+
+def test_BinnedVolume_conservation():
+    volume = makeVolume(shape=(7,5,9)) # Odd shapes leave incomplete blocks at the upper edges
+    names = ['intensity','monitor','counts']
+    for factors in [2,3,[4,2,5],[7,5,9],[8,6,10]]:
+        padded = volume.rebin(factors,pad=True)
+        for name in names:
+            assert(np.isclose(getattr(padded,name).sum(),getattr(volume,name).sum()))
+        # Last bin holds the incomplete block
+        f = np.broadcast_to(factors,(3,))
+        assert(np.isclose(padded.counts[-1,-1,-1],volume.counts[(padded.shape[0]-1)*f[0]:,(padded.shape[1]-1)*f[1]:,(padded.shape[2]-1)*f[2]:].sum()))
+
+    levels = volume.pyramid(minimumBins=1)
+    assert([level.shape for level in levels] == [(7,5,9),(4,3,5),(2,2,3),(1,1,2),(1,1,1)])
+    for I,level in enumerate(levels):
+        for name in names:
+            assert(np.isclose(getattr(level,name).sum(),getattr(volume,name).sum()))
+        assert(np.allclose(level.intensity,volume.rebin(2**I,pad=True).intensity)) # Level I is binned with 2**I times larger bins
+
+
+def test_BinnedVolume_cut1D():
+    volume = makeVolume()
+    pos,I,err = volume.cut1D([0.05,0.125,0.1],[0.95,0.125,0.1],stepSize=1/6,width=0.1)
+    assert(pos.shape == (3,len(I)))
+    assert(np.allclose(I[1:6],volume.data[1:6,0,0]))
+    assert(np.isnan(I[0]))
+
+
+def test_BinnedVolume_arithmetic():
+    volume = makeVolume()
+
+    added = volume+volume
+    assert(np.allclose(added.intensity,2*volume.intensity))
+    assert(np.allclose(added.data[1:],volume.data[1:]))
+
+    subtracted = volume-volume
+    assert(np.allclose(subtracted.data[1:],0.0))
+    assert(np.allclose(subtracted.variance,2*volume.variance))
+
+    scaled = 2.0*volume
+    assert(np.allclose(scaled.data[1:],2*volume.data[1:]))
+    assert(np.allclose((scaled/2.0).intensity,volume.intensity))
+
+    try:
+        volume+volume.rebin(2)
+        assert False
+    except AttributeError:
+        assert True
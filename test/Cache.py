@@ -0,0 +1,135 @@
+from DMCpy import Cache
+import numpy as np
+import os, tempfile
+
+
+class Reducer(object):
+    def __init__(self):
+        self.calls = 0
+
+    @Cache.cached(ignore=['steps'])
+    def reduce(self,x,scale=1.0,steps=10):
+        self.calls+=1
+        return np.arange(x)*scale
+
+
+# Minimal stand-in for a DataFile, recognized by its countShape
+class Detector(object):
+    def __init__(self):
+        self.countShape = (1,2,3)
+        self.folder = ''
+        self.fileName = 'missing.hdf'
+        self.radius = 0.8
+        self.verticalPosition = np.linspace(-0.1,0.1,2)
+        self.pixelPosition = np.zeros((3,2,3))
+        self.alpha = np.zeros((2,3))
+        self.q_temp = np.ones((3,2,3))
+
+
+@Cache.cached(ignore=['calls'])
+def reduceDetector(df,calls):
+    calls.append(1)
+    return df.q_temp.sum()
+
+
+@Cache.cached(ignore=['calls'])
+def reduceNothing(df,calls):
+    calls.append(1)
+    return None
+
+
+def test_Cache_hit_and_miss():
+    oldSettings = dict(Cache.settings)
+    with tempfile.TemporaryDirectory() as directory:
+        Cache.enable(directory=directory)
+        try:
+            r = Reducer()
+            first = r.reduce(10,scale=2.0)
+            second = r.reduce(10,2.0,steps=3) # Same call, positional and ignored argument
+            assert(r.calls == 1)
+            assert(np.allclose(first,second))
+
+            r.reduce(10,scale=3.0)
+            assert(r.calls == 2)
+
+            Cache.clear()
+            r.reduce(10,scale=2.0)
+            assert(r.calls == 3)
+        finally:
+            Cache.settings.update(oldSettings)
+
+        r = Reducer()
+        r.reduce(10,scale=2.0)
+        r.reduce(10,scale=2.0)
+        assert(r.calls == 2)
+
+
+def test_Cache_eviction():
+    oldSettings = dict(Cache.settings)
+    with tempfile.TemporaryDirectory() as directory:
+        Cache.enable(directory=directory,maxSize=1e9)
+        try:
+            r = Reducer()
+            for x in range(5):
+                r.reduce(10000+x)
+            sizes = [size for _,size,_ in Cache._cacheFiles()]
+            assert(len(sizes) == 5)
+
+            Cache.evict(maxSize=np.sum(sizes)*0.5)
+            assert(len(Cache._cacheFiles()) == 2)
+        finally:
+            Cache.settings.update(oldSettings)
+
+
+def test_Cache_memory():
+    oldSettings = dict(Cache.settings)
+    with tempfile.TemporaryDirectory() as directory:
+        Cache.enable(directory=directory,memory=True,maxSize=1e9)
+        try:
+            r = Reducer()
+            first = r.reduce(10,scale=2.0)
+            first[0] = 100 # Stored results are not changed through returned ones
+            second = r.reduce(10,scale=2.0)
+            assert(r.calls == 1)
+            assert(second[0] == 0)
+            assert(len(Cache._cacheFiles()) == 0) # Nothing written to disk
+
+            Cache.settings['maxSize'] = 2*second.nbytes # Least recently used results are evicted
+            for x in range(3):
+                r.reduce(10,scale=3.0+x)
+            assert(len(Cache._memory) == 2)
+
+            # Files on disk are kept when only clearing memory
+            stored = os.path.join(directory,'stored.pkl')
+            open(stored,'wb').close()
+            Cache.clear(memoryOnly=True)
+            assert(len(Cache._memory) == 0)
+            assert(os.path.exists(stored))
+
+            # None is cached like any other result
+            calls = []
+            df = Detector()
+            reduceNothing(df,calls)
+            assert(reduceNothing(df,calls) is None)
+            assert(len(calls) == 1)
+        finally:
+            Cache.clear(memoryOnly=True)
+            Cache.settings.update(oldSettings)
+
+
+def test_Cache_detectorGeometry():
+    oldSettings = dict(Cache.settings)
+    with tempfile.TemporaryDirectory() as directory:
+        Cache.enable(directory=directory)
+        try:
+            df = Detector()
+            calls = []
+            reduceDetector(df,calls)
+            reduceDetector(df,calls)
+            assert(len(calls) == 1)
+            for attribute in ['radius','verticalPosition','pixelPosition','alpha','q_temp']: # Changed geometry is recalculated
+                setattr(df,attribute,getattr(df,attribute)*1.1+0.1)
+                reduceDetector(df,calls)
+            assert(len(calls) == 6)
+        finally:
+            Cache.settings.update(oldSettings)
@@ -0,0 +1,68 @@
+from DMCpy import Calibration
+import numpy as np
+import os, pickle, tempfile
+
+
+def test_CalibrationStore():
+    calibrationDict = {2021:{'limits':np.array([0,500]),'names':['a.dat','b.dat'],'a.dat':np.ones((128,1152)),'b.dat':np.full((128,1152),2.0)},
+                       2022:{'limits':np.array([0]),'names':['c.dat'],'c.dat':np.full((128,1152),3.0)}}
+    with tempfile.TemporaryDirectory() as directory:
+        Calibration.CalibrationStore.fromCalibrationDict(calibrationDict,directory=directory)
+
+        store = Calibration.CalibrationStore(directory=directory)
+        assert(store.keys() == [2021,2022])
+        assert(2021 in store and not 2023 in store)
+        assert(len(store._years) == 0) # Nothing read yet
+
+        yearCalib = store[2021]
+        assert(np.all(yearCalib['limits'] == [0,500]))
+        assert(yearCalib['names'] == ['a.dat','b.dat'])
+        assert(len(store._years) == 1)
+
+        calibration = yearCalib['b.dat']
+        assert(isinstance(calibration,np.memmap))
+        assert(not calibration.flags.writeable)
+        assert(np.all(calibration == 2.0))
+        assert(store[2021]['b.dat'] is calibration) # Shared between users
+
+        # New calibrations are added without rewriting the others
+        store.add(2021,'d.dat',np.full((128,1152),4.0),limit=250)
+        assert(store[2021]['names'] == ['a.dat','d.dat','b.dat'])
+        assert(np.all(store[2021]['d.dat'] == 4.0))
+
+
+def test_convertedStore(capsys):
+    calibrationDict = {2021:{'limits':np.array([0]),'names':['a.dat'],'a.dat':np.ones((128,1152))}}
+    with tempfile.TemporaryDirectory() as directory:
+        calibrationFile = os.path.join(directory,'calibrationDict.dat')
+        with open(calibrationFile,'wb') as f:
+            pickle.dump(calibrationDict,f)
+
+        folder = os.path.join(directory,'calibration')
+        store = Calibration.convertedStore(calibrationFile,directory=folder)
+        assert(store.keys() == [2021])
+        assert('Converting' in capsys.readouterr().out) # Conversion is reported
+        assert(np.all(store[2021]['a.dat'] == 1.0))
+
+        # Converted only once
+        indexFile = os.path.join(folder,'2021',Calibration.indexFileName)
+        os.utime(indexFile,ns=(0,0))
+        Calibration.convertedStore(calibrationFile,directory=folder)
+        assert(os.stat(indexFile).st_mtime_ns == 0)
+        assert(capsys.readouterr().out == '')
+
+        # Converted again when calibrationDict.dat changes
+        calibrationDict[2022] = {'limits':np.array([0]),'names':['b.dat'],'b.dat':np.full((128,1152),2.0)}
+        with open(calibrationFile,'wb') as f:
+            pickle.dump(calibrationDict,f)
+        store = Calibration.convertedStore(calibrationFile,directory=folder)
+        assert(store.keys() == [2021,2022])
+        assert(np.all(store[2022]['b.dat'] == 2.0))
+        assert(len([name for name in os.listdir(directory) if name.startswith('.calibration')]) == 0) # Temporary folders removed
+
+
+def test_userStoreFolder():
+    from DMCpy import Cache
+    # The converted store is not removed when the result cache is cleared
+    cacheFolder = os.path.join(os.path.abspath(Cache.settings['directory']),'')
+    assert(not os.path.abspath(Calibration.userStoreFolder).startswith(cacheFolder))
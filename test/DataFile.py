@@ -1,8 +1,51 @@
 from DMCpy import DataFile,_tools
 import os.path
+import tempfile
+import h5py as hdf
 import numpy as np
 import matplotlib.pyplot as plt
 
+
+def writeTestFile(fileName,steps=None,seed=0):
+    """Write small DMC data file with random counts, with (steps,128,1152) counts if steps is given"""
+    rng = np.random.default_rng(seed)
+    shape = (128,1152) if steps is None else (steps,128,1152)
+    scanSteps = 1 if steps is None else steps
+    with hdf.File(fileName,'w') as f:
+        entry = f.create_group('entry')
+        for name,value in [('start_time','2021-01-02 10:00:00'),('end_time','2021-01-02 11:00:00'),('title','test'),('proposal_id','1')]:
+            entry.create_dataset(name,data=[np.bytes_(value)])
+        for group in ['user','proposal_user']:
+            g = entry.create_group(group)
+            g.create_dataset('name',data=[np.bytes_('test')])
+            g.create_dataset('email',data=[np.bytes_('test')])
+        entry.create_group('data')
+
+        instrument = entry.create_group('DMC')
+        instrument.attrs['NX_class'] = np.bytes_('NXinstrument')
+        detector = instrument.create_group('detector')
+        detector.create_dataset('data',data=rng.poisson(5,size=shape).astype(np.int32),chunks=None if steps is None else (1,128,1152))
+        detector.create_dataset('detector_position',data=np.full(scanSteps,-20.0))
+        detector.create_dataset('summed_counts',data=np.zeros((128,1152)))
+        monochromator = instrument.create_group('monochromator')
+        for name in ['curvature','curvature_vertical','goniometer_lower','goniometer_upper','rotation_angle','takeoff_angle','translation_lower','translation_upper']:
+            monochromator.create_dataset(name,data=np.array([1.0]))
+        monochromator.create_dataset('wavelength',data=np.array([2.45]))
+
+        sample = entry.create_group('sample')
+        sample.create_dataset('name',data=[np.bytes_('test')])
+        sample.create_dataset('unit_cell',data=np.array([5.0,5.0,5.0,90,90,90]))
+        sample.create_dataset('rotation_angle',data=np.linspace(0,90,scanSteps))
+        sample.create_dataset('se_r',data=np.zeros(scanSteps))
+        sample.create_dataset('temperature',data=np.full(scanSteps,2.0))
+
+        monitor = entry.create_group('monitor')
+        monitor.create_dataset('monitor',data=np.full(scanSteps,1000.0))
+        monitor.create_dataset('time',data=np.full(scanSteps,60.0))
+        monitor.create_dataset('mode',data=[np.bytes_('monitor')])
+        monitor.create_dataset('preset',data=np.array([1000.0]))
+        monitor.create_dataset('proton_charge',data=np.full(scanSteps,1.0))
+
 def test_init():
     df = DataFile.DataFile()
 
@@ -213,3 +256,214 @@ def test_shallow_read():
         assert(d['sampleName'] == sampleNames[I])
         
 
+
+
+def test_lazyCounts():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    df = DataFile.loadDataFile(fileList[0])
+
+    chunk = DataFile.lazyCounts(df,slice(2,5))
+    assert(np.issubdtype(chunk.rawCounts.dtype,np.integer)) # Counts kept in stored dtype
+    assert(np.all(chunk.counts() == df.countsSliced(slice(2,5))))
+
+    index = np.array([0,17,2*128*1152+5])
+    assert(np.all(chunk.counts(index) == df.countsSliced(slice(2,5)).flatten()[index]))
+    assert(np.allclose(chunk.intensity(index),df.intensitySliced(slice(2,5)).flatten()[index],equal_nan=True))
+
+    # Background is only subtracted for the requested pixels
+    df.hasBackground = True
+    df._background = np.full(df.countShape,2,dtype=chunk.rawCounts.dtype)
+    chunk = DataFile.lazyCounts(df,slice(2,5))
+    assert(np.all(chunk.counts(index) == chunk.rawCounts.flatten()[index]-2))
+
+
+def test_lazyCounts_region():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    df = DataFile.loadDataFile(fileList[0])
+
+    region = (slice(2,5),slice(40,60),slice(300,420))
+    chunk = DataFile.lazyCounts(df,region)
+    assert(chunk.rawCounts.shape == (3,20,120)) # Only the region is read
+    assert(np.all(chunk.counts() == df.countsSliced(slice(2,5))[:,40:60,300:420]))
+    assert(np.allclose(chunk.intensity(),df.intensitySliced(slice(2,5))[:,40:60,300:420],equal_nan=True))
+
+    index = np.array([0,17,2*20*120+5])
+    assert(np.allclose(chunk.intensity(index),chunk.intensity().flatten()[index],equal_nan=True))
+
+
+def test_lazyWeights():
+    shape = (4,3,5)
+    monitor = np.arange(1,5,dtype=float)
+    normalization = np.random.rand(3,5)
+
+    index = np.array([0,7,15,33,59])
+    mon = DataFile.lazyWeights(monitor.reshape(-1,1,1),shape)
+    norm = DataFile.lazyWeights(normalization,shape)
+
+    assert(np.allclose(mon[index],np.broadcast_to(monitor.reshape(-1,1,1),shape).flatten()[index]))
+    assert(np.allclose(norm[index],np.broadcast_to(normalization,shape).flatten()[index]))
+
+    try:
+        DataFile.lazyWeights(np.ones(3),shape)
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_compactMask():
+    shape = (5,4,6)
+    pixelMask = np.zeros(shape[1:],dtype=bool)
+    pixelMask[1,2] = True
+    mask = DataFile.compactMask(shape,pixelMask=pixelMask)
+    full = np.zeros(shape,dtype=bool)
+    full[:,1,2] = True
+    assert(np.all(mask == full))
+
+    # Per-frame, per-pixel and single point assignments
+    mask[2] = True
+    full[2] = True
+    mask[:,-1,:] = True
+    full[:,-1,:] = True
+    mask[0,0,:3] = True
+    full[0,0,:3] = True
+    assert(np.all(mask == full))
+    assert(mask.frameMask[2] and np.all(mask.pixelMask[-1]))
+    assert(len(mask.exceptionIndex) == 3)
+
+    mask[3,1,2] = False
+    full[3,1,2] = False
+    assert(np.all(np.asarray(mask) == full))
+
+    # Chunks
+    assert(np.all(mask[1:4] == full[1:4]))
+    assert(np.all(mask.notMasked(slice(1,4)) == np.flatnonzero(np.logical_not(full[1:4]))))
+    assert(np.all(mask.valuesAt(np.arange(full.size)) == full.flatten()))
+
+    # Combination with other masks and arrays
+    other = np.zeros(shape,dtype=bool)
+    other[4,0,0] = True
+    mask += other
+    assert(np.all(mask == np.logical_or(full,other)))
+
+    combined = DataFile.compactMask(shape,frameMask=[1,0,0,0,0]) + mask
+    full = np.logical_or(full,other)
+    full[0] = True
+    assert(np.all(combined == full))
+    assert(np.all(DataFile.compactMask.fromArray(full) == full))
+
+
+def test_cachedAngles():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    df = DataFile.loadDataFile(fileList[0])
+
+    correctedTwoTheta = df.correctedTwoTheta
+    phi = df.phi
+    assert(correctedTwoTheta.shape == df.countShape)
+    assert(phi.shape == df.countShape)
+    assert(df.correctedTwoTheta is correctedTwoTheta) # Cached
+    assert(not correctedTwoTheta.flags.writeable) # Broadcast view
+
+    q = df.q[None]
+    assert(np.allclose(phi,np.rad2deg(np.arctan2(q[2],np.linalg.norm(q[:2],axis=0)))))
+
+    df.wavelength = df.wavelength*1.1 # Invalidates cache
+    assert(not df.correctedTwoTheta is correctedTwoTheta)
+    assert(np.allclose(df.correctedTwoTheta,2.0*np.rad2deg(np.arcsin(df.wavelength*np.linalg.norm(q,axis=0)/1.1/(4*np.pi)))))
+
+
+def test_deferGeometry():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    df = DataFile.loadDataFile(fileList[0])
+    reference = DataFile.loadDataFile(fileList[0])
+
+    reference.wavelength = 2.0
+    reference.twoThetaOffset = 0.5
+    reference.sampleOffsetZ = 0.01
+
+    Q = df.Q
+    with df.deferGeometry():
+        df.wavelength = 2.0
+        df.twoThetaOffset = 0.5
+        df.sampleOffsetZ = 0.01
+        assert(df._geometryDirty)
+    assert(df._geometryDirty) # Only recalculated on first use
+
+    assert(not df.Q is Q)
+    assert(not df._geometryDirty)
+    assert(np.allclose(df.Q,reference.Q))
+    assert(np.allclose(df.q[None],reference.q[None]))
+    assert(np.allclose(df.phi,reference.phi))
+
+
+def test_forcePowder():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    df = DataFile.loadDataFile(fileList[0])
+    pdf = DataFile.loadDataFile(fileList[0],forcePowder=True)
+
+    assert(pdf.fileType == 'Powder')
+    assert(pdf.countShape == (1,128,1152))
+    assert(np.allclose(pdf.monitor,np.sum(df.monitor)))
+    assert(np.all(pdf.counts[0] == df.counts.sum(axis=0)))
+
+    # Summing in small chunks gives the same result
+    pdf._counts = None
+    assert(np.all(pdf.sumScanSteps(memoryBudget=1) == df.counts.sum(axis=0)))
+
+
+def test_forcePowder_scan():
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory,'dmc2021n000001.hdf')
+        writeTestFile(fileName,steps=5)
+        with hdf.File(fileName,mode='r') as f:
+            counts = np.array(f.get(DataFile.HDFCounts))
+
+        pdf = DataFile.loadDataFile(fileName,forcePowder=True)
+        assert(pdf.fileType == 'Powder')
+        assert(pdf.countShape == (1,128,1152))
+        assert(np.all(pdf.counts[0] == counts.sum(axis=0)))
+        assert(np.allclose(pdf.monitor,5000.0))
+
+        # Files of a single frame are still read without scan step axis
+        fileName = os.path.join(directory,'dmc2021n000002.hdf')
+        writeTestFile(fileName)
+        with hdf.File(fileName,mode='r') as f:
+            counts = np.array(f.get(DataFile.HDFCounts))
+        df = DataFile.loadDataFile(fileName)
+        assert(np.all(DataFile.lazyCounts(df,slice(None)).counts() == counts[np.newaxis]))
+
+
+def test_sumScanSteps():
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory,'dmc2021n000001.hdf')
+        writeTestFile(fileName,steps=7)
+        with hdf.File(fileName,mode='r') as f:
+            counts = np.array(f.get(DataFile.HDFCounts))
+
+        oldBudget = _tools.memoryBudget
+        try:
+            for budget in [1,3*128*1152*(12*8+2),512*1024**2]: # One, three and all scan steps per chunk
+                _tools.memoryBudget = budget
+                pdf = DataFile.loadDataFile(fileName,forcePowder=True)
+                assert(pdf.counts.shape == (1,128,1152))
+                assert(np.all(pdf.counts[0] == np.sum(counts,axis=0)))
+        finally:
+            _tools.memoryBudget = oldBudget
+
+
+def test_lazyFrames():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    df = DataFile.loadDataFile(fileList[0])
+    intensity = df.intensity
+
+    frames = DataFile.lazyFrames(df,cacheSize=4,prefetch=2)
+    assert(len(frames) == len(intensity))
+    assert(np.allclose(frames[5],intensity[5],equal_nan=True))
+    assert(sorted(frames.frames) == [5,6,7]) # Following frames are read together
+    assert(np.allclose(frames[3],intensity[3],equal_nan=True))
+    assert(len(frames.frames) == 4 and 2 in frames.frames) # Preceding frames when stepping backwards
+    assert(np.allclose(frames[-1],intensity[-1],equal_nan=True))
+
+    zSummed,twoThetaSummed,limits = frames.summedPanels(steps=3)
+    assert(np.allclose(zSummed,intensity.sum(axis=1),equal_nan=True))
+    assert(np.allclose(twoThetaSummed,intensity.sum(axis=2),equal_nan=True))
+    assert(np.allclose(limits,[np.nanmin(intensity),np.nanmax(intensity)]))
@@ -1,7 +1,7 @@
 from xml.dom.minidom import Attr
 
 from DMCpy import DataSet
-from DMCpy import DataFile
+from DMCpy import DataFile, _tools
 import os.path
 import numpy as np
 import matplotlib
@@ -302,3 +302,155 @@ def test_updateDataFileParameters():
     newValues = np.random.rand(len(ds))
     ds.updateDataFiles('twoThetaPosition',newValues)
     assert(np.all([np.isclose(nV,df.twoThetaPosition) for nV,df in zip(newValues,ds)]))
+
+
+def test_cut1DMultiple():
+    dataFiles = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    unitCell = np.array([ 7.218, 7.218, 18.183, 90.0, 90.0, 120.0])
+    ds = DataSet.DataSet(dataFiles,unitCell=unitCell)
+
+    cuts = [[[h,h,-0.5],[h,h,0.5]] for h in [1.0,1.333]]
+
+    results = ds.cut1DMultiple(cuts,rlu=True,width=0.1,stepSize=0.01,steps=20)
+    assert(len(results) == len(cuts))
+
+    # Batched cuts are identical to the individual cuts
+    for (P1,P2),(pos,I,err) in zip(cuts,results):
+        pos2,I2,err2 = ds.cut1D(P1,P2,rlu=True,width=0.1,stepSize=0.01,steps=20)
+        assert(np.all(np.isclose(pos,pos2)))
+        assert(np.all(np.isclose(I,I2,equal_nan=True)))
+        assert(np.all(np.isclose(err,err2,equal_nan=True)))
+
+    try:
+        ds.cut1DMultiple([[[1,1,0],[1,1,0]]]) # Zero length cut
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_cutQPlaneStack():
+    dataFiles = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    unitCell = np.array([ 7.218, 7.218, 18.183, 90.0, 90.0, 120.0])
+    ds = DataSet.DataSet(dataFiles,unitCell=unitCell)
+
+    points = np.array([[0.0,0.0,0.0],[1.0,0.0,0.0],[0.0,1.0,0.0]])
+    xBins = np.arange(-3,3,0.05)
+    yBins = np.arange(-3,3,0.05)
+    offsets = [-0.1,0.0,0.1]
+    width = 0.1
+
+    returndata,bins,rotMat,translations = ds.cutQPlaneStack(points,width,offsets,xBins=xBins,yBins=yBins,steps=20)
+    assert(np.all([rd.shape == (len(offsets),len(xBins)-1,len(yBins)-1) for rd in returndata]))
+
+    # Every plane of the stack equals the single plane cut
+    for I,offset in enumerate(offsets):
+        single,_,_,translation = ds.cutQPlane(points+np.array([0.0,0.0,offset]),width,xBins=xBins,yBins=yBins,steps=20)
+        assert(np.isclose(translation,translations[I]))
+        assert(np.all([np.all(np.isclose(s,rd[I])) for s,rd in zip(single,returndata)]))
+
+
+def test_cutQPlane_autoBins():
+    dataFiles = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    unitCell = np.array([ 7.218, 7.218, 18.183, 90.0, 90.0, 120.0])
+    ds = DataSet.DataSet(dataFiles,unitCell=unitCell)
+
+    points = np.array([[0.0,0.0,0.0],[1.0,0.0,0.0],[0.0,1.0,0.0]])
+    
+    # Automatically sized grid contains all data found using a large fixed grid
+    autoData,autoBins,*_ = ds.cutQPlane(points,0.1,dQx=0.05,dQy=0.05,steps=5)
+    fixedData,fixedBins,*_ = ds.cutQPlane(points,0.1,xBins=np.arange(-10,10,0.05),yBins=np.arange(-10,10,0.05),steps=5)
+
+    for auto,fixed in zip(autoData,fixedData):
+        assert(np.isclose(np.sum(auto),np.sum(fixed)))
+    
+    assert(np.all(np.isclose(np.diff(autoBins[0][:,0]),0.05)))
+    assert(np.all(np.isclose(np.diff(autoBins[1][0]),0.05)))
+
+
+def test_binVolume():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    unitCell = [7.218,7.218,18.183,90,90,120]
+    ds = DataSet.DataSet(fileList,unitCell=unitCell)
+
+    volume = ds.binVolume(0.1,0.1,0.1,rlu=False,steps=20)
+    intensities,bins,errors = ds.binData3D(0.1,0.1,0.1,rlu=False,steps=20)
+
+    assert(np.allclose(volume.data,intensities,equal_nan=True))
+    assert(np.allclose(volume.errors,errors,equal_nan=True))
+    assert(np.all([np.allclose(b1,b2) for b1,b2 in zip(volume.bins,bins)]))
+
+    projection = volume.project(axis=2)
+    assert(np.isclose(projection.intensity.sum(),volume.intensity.sum()))
+
+    # Normalization is summed alongside the intensity
+    normalization = [np.broadcast_to(df.normalization,df.countShape)[np.logical_not(np.asarray(df.mask))].sum() for df in ds]
+    assert(volume.normalization.shape == volume.shape)
+    assert(np.isclose(volume.normalization.sum(),np.sum(normalization)))
+
+
+def test_float32_precision():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    unitCell = [7.218,7.218,18.183,90,90,120]
+    ds64 = DataSet.DataSet(fileList,unitCell=unitCell)
+    ds32 = DataSet.DataSet(fileList,unitCell=unitCell,dtype=np.float32)
+
+    assert(ds32[0].q[0:2].dtype == np.float32)
+    assert(ds32[0].intensitySliced(slice(0,2)).dtype == np.float32)
+
+    volume64 = ds64.binVolume(0.04,0.04,0.04,rlu=False)
+    volume32 = ds32.binVolume(0.04,0.04,0.04,rlu=False)
+
+    assert(volume32.intensity.dtype == np.float64) # Sums are kept in float64
+    assert(np.isclose(volume32.intensity.sum(),volume64.intensity.sum(),rtol=1e-5))
+    assert(np.abs(volume32.intensity-volume64.intensity).sum()<1e-3*volume64.intensity.sum())
+
+    points = np.array([[0.0,0.0,0.0],[1.0,0.0,0.0],[0.0,1.0,0.0]])
+    data64,*_ = ds64.cutQPlane(points,0.1,dQx=0.03,dQy=0.03)
+    data32,*_ = ds32.cutQPlane(points,0.1,dQx=0.03,dQy=0.03)
+    assert(np.isclose(data32[0].sum(),data64[0].sum(),rtol=1e-3))
+
+    ds32.dtype = np.float64
+    assert(ds32[0].q[0:2].dtype == np.float64)
+
+
+def test_sumDetector_singleCrystal():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    ds = DataSet.DataSet(fileList)
+
+    twoTheta,I,err,monitor = ds.sumDetector()
+    assert(len(twoTheta) == len(I))
+    assert(np.all(monitor>0))
+
+    twoTheta,I,err,monitor = ds.sumDetector(correctedTwoTheta=False,applyCalibration=False)
+    assert(len(twoTheta) == len(err))
+
+
+def test_integratePeaks():
+    fileList = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    unitCell = [7.218,7.218,18.183,90,90,120]
+    ds = DataSet.DataSet(fileList,unitCell=unitCell)
+
+    HKLs = [[1,0,0],[0,0,3],[1,1,0]]
+    table = ds.integratePeaks(HKLs,radius=[0.08,0.05,0.1],steps=20)
+    assert(len(table) == len(HKLs))
+    assert(np.allclose(table['H'],[1,0,1]))
+    assert(np.allclose(table['Q'],np.linalg.norm(np.dot(ds[0].sample.UB,np.array(HKLs).T),axis=0)))
+
+    # Brute force summation over all pixels of the first file
+    df = ds[0]
+    Q = np.dot(df.sample.UB,[0,0,3])
+    q = df.q[None].reshape(3,-1)
+    dist = np.linalg.norm(q-Q.reshape(3,1),axis=0)
+    inside = np.logical_and(dist<0.05,np.logical_not(np.asarray(df.mask).flatten()))
+    single = DataSet.DataSet([df]).integratePeaks([[0,0,3]],radius=0.05,backgroundRadii=(1.5,2.0))
+    assert(single['peakPixels'][0] == np.sum(inside))
+
+    parallel = ds.integratePeaks(HKLs,radius=[0.08,0.05,0.1],processes=2)
+    assert(np.allclose(parallel['intensity'],table['intensity']))
+    assert(np.all(parallel['peakPixels']==table['peakPixels']))
+
+    try:
+        ds.integratePeaks(HKLs,radius=[0.1,0.1])
+        assert False
+    except AttributeError:
+        assert True
@@ -0,0 +1,101 @@
+from DMCpy import Sample
+import numpy as np
+import pickle
+
+
+def makeSample():
+    sample = Sample.Sample(a=5.0,b=6.0,c=7.0,gamma=100.0,projectionVector1=[1,0,0],projectionVector2=[0,1,0])
+    sample.setProjectionVectors([1,0,0],[0,1,1])
+    return sample
+
+
+def test_transformation_cache():
+    sample = makeSample()
+    x,y = np.linspace(-1,1,5),np.linspace(0,2,5)
+
+    assert(np.allclose(sample.UBInv,np.linalg.inv(sample.UB)))
+    assert(np.allclose(sample.tr(*sample.inv_tr(x,y)),[x,y]))
+    assert(np.allclose(sample.tr(*sample.inv_tr(x,y,x)),[x,y,x]))
+
+    proj0,proj1 = sample.inv_tr(0.3,0.7)
+    rlu = proj0*sample.projectionVectors[:,0]+proj1*sample.projectionVectors[:,1]
+    assert(sample.format_coord(0.3,0.7) == "h = {0:.3f}, k = {1:.3f}, l = {2:.3f}".format(*rlu))
+
+    # Setting UB, ROT or projection vectors clears the cached matrices
+    UBInv = sample.UBInv
+    sample.UB = 2*sample.UB
+    assert(np.allclose(sample.UBInv,0.5*UBInv))
+
+    before = sample.format_coord(0.3,0.7)
+    sample.setProjectionVectors([1,1,0],[0,0,1])
+    assert(sample.format_coord(0.3,0.7) != before)
+
+    ROT = sample.ROT
+    sample.ROT = np.eye(3)
+    assert(np.allclose(sample.tr(1,0),np.dot(sample.UB,[1,1,0])[:2]))
+    sample.ROT = ROT
+
+    try:
+        sample.transformation('wrong')
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_pickle():
+    sample = makeSample()
+    sample.format_coord(0.1,0.2)
+    loaded = pickle.loads(pickle.dumps(sample))
+    assert(np.allclose(loaded.UBInv,sample.UBInv))
+    assert(loaded.format_coord(0.1,0.2) == sample.format_coord(0.1,0.2))
+
+    # Samples pickled with UB, ROT and projection vectors as plain attributes
+    state = dict(sample.__dict__)
+    for name in ['UB','ROT','projectionVectors']:
+        state[name] = state.pop('_'+name)
+    old = Sample.Sample.__new__(Sample.Sample)
+    old.__setstate__(state)
+    assert(np.allclose(old.UB,sample.UB))
+    assert(old.format_coord(0.1,0.2) == sample.format_coord(0.1,0.2))
+
+
+def test_observers():
+    sample = makeSample()
+    calls = []
+
+    class observer(object):
+        def changed(self,s):
+            calls.append(s.version)
+
+    obs = observer()
+    sample.addObserver(obs.changed)
+    version = sample.version
+
+    sample.UB = 2*sample.UB
+    assert(len(calls) == 1 and calls[-1] == sample.version and sample.version != version)
+
+    # Setting projection vectors changes both projectionVectors and ROT, but notifies once
+    sample.setProjectionVectors([1,1,0],[0,0,1])
+    assert(len(calls) == 2)
+
+    with sample.deferNotifications():
+        sample.ROT = np.eye(3)
+        sample.UB = 0.5*sample.UB
+        assert(len(calls) == 2)
+    assert(len(calls) == 3)
+
+    # Copies get their own version and no observers
+    copied = pickle.loads(pickle.dumps(sample))
+    assert(copied.version != sample.version)
+    copied.UB = 2*copied.UB
+    assert(len(calls) == 3)
+
+    sample.removeObserver(obs.changed)
+    sample.UB = 2*sample.UB
+    assert(len(calls) == 3)
+
+    # Observers are only weakly referenced
+    sample.addObserver(obs.changed)
+    del obs
+    sample.UB = 2*sample.UB
+    assert(len(calls) == 3)
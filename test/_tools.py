@@ -33,4 +33,146 @@ def test_roundPower():
 
     assert(_tools.roundPower(10.09) == -1)
 
-    assert(_tools.roundPower(1.09) == 0)
\ No newline at end of file
+    assert(_tools.roundPower(1.09) == 0)
+
+def test_planSteps():
+    class FakeDataFile(object):
+        countShape = (100,128,1152)
+        _countChunks = None
+        def __len__(self):
+            return self.countShape[0]
+
+    df = FakeDataFile()
+    bytesPerStep = 128*1152*(12*8+2)
+
+    assert(_tools.planSteps(df,memoryBudget=10*bytesPerStep) == 10)
+    assert(_tools.planSteps(df,memoryBudget=0) == 1) # At least one step
+    assert(_tools.planSteps(df,memoryBudget=1e12) == 100) # At most the full file
+    assert(_tools.planSteps(df,memoryBudget=10*bytesPerStep,dtype=np.float32) > 10)
+
+    df._countChunks = 4 # Align to chunk layout
+    assert(_tools.planSteps(df,memoryBudget=10*bytesPerStep) == 8)
+    df._countChunks = 16
+    assert(_tools.planSteps(df,memoryBudget=10*bytesPerStep) == 8)
+
+    df._countChunks = None # Shape of the counts in the file instead of df.countShape
+    assert(_tools.planSteps(df,memoryBudget=10*bytesPerStep,shape=(7,128,1152)) == 7)
+
+
+def test_fitGaussians():
+    from scipy.optimize import curve_fit
+    rng = np.random.default_rng(42)
+    parameters = np.array([[1.0,20.0,4.0,0.8],[0.5,5.0,6.0,1.2],[2.0,50.0,5.0,0.6]])
+    x = [np.linspace(0,10,n) for n in [15,21,11]] # Curves of different lengths
+    y = [_tools.gauss(xx,*p)+rng.normal(0,0.3,len(xx)) for xx,p in zip(x,parameters)]
+
+    table = _tools.fitGaussians(x,y)
+    assert(len(table) == 3)
+    assert(np.all(table['converged']))
+
+    for fit,xx,yy in zip(table,x,y):
+        mean = np.sum(xx*yy)/np.sum(yy)
+        sigma = np.sqrt(np.sum(yy*(xx-mean)**2)/np.sum(yy))
+        popt,pcov = curve_fit(_tools.gauss,xx,yy,p0=[np.min(yy),np.max(yy),mean,sigma])
+        popt[3] = np.abs(popt[3])
+        assert(np.allclose([fit[name] for name in ['H','A','x0','sigma']],popt,rtol=1e-4))
+        assert(np.allclose([fit['d'+name] for name in ['H','A','x0','sigma']],np.sqrt(np.diag(pcov)),rtol=1e-3))
+        assert(np.isclose(fit['integrated'],fit['A']*np.sqrt(2*np.pi)*fit['sigma']))
+
+    # NaN values are ignored
+    y[0][3] = np.nan
+    table2 = _tools.fitGaussians(x,y)
+    assert(np.all(np.isfinite(table2['x0'])))
+
+    # No curves gives an empty table
+    empty = _tools.fitGaussians([],[])
+    assert(len(empty) == 0)
+    assert(empty.dtype == table.dtype)
+
+
+def test_fitGaussians_difficult():
+    from scipy.optimize import curve_fit
+    rng = np.random.default_rng(7)
+    points = rng.integers(11,31,size=40)
+    x = [np.linspace(40,60,n) for n in points]
+    sigma = rng.uniform(0.4,1.0,40)*20/(points-1) # Sharp peaks, only a few points wide
+    parameters = np.array([rng.uniform(0,20,40),rng.uniform(50,500,40),rng.uniform(45,55,40),sigma]).T
+    parameters[::4,:2] += [200.0,100.0] # Large background gives poor starting values from the moments
+    y = [_tools.gauss(xx,*p)+rng.normal(0,np.sqrt(_tools.gauss(xx,*p))) for xx,p in zip(x,parameters)]
+
+    starts = np.array([[0.0,1.0,50.0,5.0]]*40) # Poor starting values
+    for table in [_tools.fitGaussians(x,y),_tools.fitGaussians(x,y,p0=starts)]:
+        assert(np.all(table['converged']))
+        for fit,xx,yy,p in zip(table,x,y,parameters):
+            popt,_ = curve_fit(_tools.gauss,xx,yy,p0=p,maxfev=10000) # Started at the true parameters
+            chi2 = np.sum((yy-_tools.gauss(xx,*popt))**2)/(len(xx)-4)
+            assert(fit['chi2'] <= chi2*(1+1e-6))
+            if np.isclose(fit['chi2'],chi2,rtol=1e-6): # Same minimum, agreeing well within the uncertainties
+                values = np.array([fit[name] for name in ['A','x0','sigma']])
+                errors = np.array([fit['d'+name] for name in ['A','x0','sigma']])
+                assert(np.all(np.abs(values-[popt[1],popt[2],np.abs(popt[3])]) <= 0.1*errors+1e-3*np.abs(values)))
+
+
+def test_isRegularGrid():
+    X,Y = np.meshgrid(np.linspace(0,1,6),np.linspace(-1,1,4),indexing='ij')
+    assert(_tools.isRegularGrid(X,Y))
+    assert(not _tools.isRegularGrid(X**2,Y)) # Unequal bins
+    assert(not _tools.isRegularGrid(X+0.1*Y,Y)) # Not axis aligned
+
+
+def test_blitRenderer():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig,ax = plt.subplots()
+    image = ax.imshow(np.zeros((4,5)))
+    renderer = _tools.blitRenderer(fig,[image])
+    assert(image.get_animated())
+    fig.canvas.draw()
+    assert(not renderer.background is None)
+
+    values = []
+    renderer.request(lambda: values.append(1)) # Applied directly without GUI event loop
+    assert(values == [1])
+
+    # Requests arriving before the redraw replace the pending one
+    renderer.interactive = True
+    renderer.request(lambda: values.append(2))
+    renderer.request(lambda: image.set_array(np.ones((4,5))))
+    renderer.flush()
+    assert(values == [1] and np.all(image.get_array() == 1))
+
+    fig.savefig(os.devnull,format='png')
+    assert(image.get_animated() and not renderer.saving)
+    plt.close(fig)
+
+
+def test_pyramidLevel():
+    edges = [np.linspace(0,1,801),np.linspace(0,1,101)]
+    assert(_tools.pyramidLevel(edges,[(0,1),(0,1)],[800,400],5) == 0)
+    assert(_tools.pyramidLevel(edges,[(0,1),(0,1)],[200,400],5) == 2)
+    assert(_tools.pyramidLevel(edges,[(0,0.25),(1,0)],[200,400],5) == 0) # Zoomed in
+    assert(_tools.pyramidLevel(edges,[(-10,10),(0,1)],[10,400],5) == 4) # Limited by number of levels
+
+
+def test_reportProgress():
+    reported = []
+    with _tools.reportProgress(lambda done,total: reported.append((done,total))):
+        chunks = list(_tools.arange(0,10,4))
+    assert(chunks == [(0,4),(4,8),(8,10)])
+    assert(reported == [(0,10),(4,10),(8,10)])
+
+    list(_tools.arange(0,10,4)) # No reporting outside of context
+    assert(len(reported) == 3)
+
+    def cancel(done,total):
+        if done>0:
+            raise KeyboardInterrupt
+    with _tools.reportProgress(cancel):
+        try:
+            for idx in _tools.arange(0,10,4):
+                pass
+        except KeyboardInterrupt:
+            pass
+    assert(idx == (0,4))
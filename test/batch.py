@@ -0,0 +1,85 @@
+from DMCpy.CommandLineScripts import batch
+from DMCpy import _tools, Cache
+import json, os, tempfile
+import numpy as np
+import pytest
+
+
+def test_readJobFile():
+    jobs = [{'load':{'files':'12105','folder':os.path.join('data','SC'),'year':2022},
+             'steps':[{'binData3D':{'dqx':0.1,'dqy':0.1,'dqz':0.1}}]}]
+    with tempfile.TemporaryDirectory() as directory:
+        jsonFile = os.path.join(directory,'jobs.json')
+        with open(jsonFile,'w') as f:
+            json.dump(jobs,f)
+        description = batch.readJobFile(jsonFile)
+        assert(description['jobs'][0]['name'] == 'job0')
+        assert(description['jobs'][0]['steps'][0]['binData3D']['dqx'] == 0.1)
+
+        jobs[0]['steps'] = [{'notAStep':{}}]
+        with open(jsonFile,'w') as f:
+            json.dump(jobs,f)
+        try:
+            batch.readJobFile(jsonFile)
+            assert False
+        except AttributeError:
+            assert True
+
+
+def test_readJobFile_yaml():
+    pytest.importorskip('yaml')
+    with tempfile.TemporaryDirectory() as directory:
+        yamlFile = os.path.join(directory,'jobs.yaml')
+        with open(yamlFile,'w') as f:
+            f.write("processes: 2\njobs:\n  - name: first\n    load: {files: '12105'}\n    steps:\n      - cut1D: {P1: [0,0,0], P2: [1,0,0]}\n")
+        description = batch.readJobFile(yamlFile)
+        assert(description['processes'] == 2)
+        assert(description['jobs'][0]['steps'][0]['cut1D']['P2'] == [1,0,0])
+
+
+def test_runJob_cacheSettings():
+    oldSettings = dict(Cache.settings)
+    with tempfile.TemporaryDirectory() as directory:
+        job = {'name':'missing','load':{'files':[os.path.join(directory,'missing.hdf')]}}
+        summary = batch.runJob(job,output=directory,quiet=True,cache=os.path.join(directory,'cache'))
+        assert(summary['status'] == 'failed')
+    assert(Cache.settings == oldSettings) # Cache of the job is not left enabled
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join('data','SC')),reason='Requires the data files in data/SC')
+def test_runJobs():
+    files = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    description = {'jobs':[{'name':'SC',
+                            'load':{'files':files,'unitCell':[7.218,7.218,18.183,90,90,120]},
+                            'UB':{'projectionVectors':[[1,0,0],[0,1,0]]},
+                            'steps':[{'binData3D':{'dqx':0.1,'dqy':0.1,'dqz':0.1,'rlu':False}},
+                                     {'cut1D':{'P1':[0,0,0],'P2':[1,0,0],'stepSize':0.05}}]},
+                           {'name':'missing','load':{'files':[os.path.join('data','missing.hdf')]}}]}
+    with tempfile.TemporaryDirectory() as directory:
+        summary = batch.runJobs(description,output=directory,quiet=True)
+        assert(summary['status'] == 'failed')
+        SC,missing = summary['jobs']
+        assert(SC['status'] == 'done')
+        assert([step['step'] for step in SC['steps']] == ['load','UB','binData3D','cut1D'])
+        assert(np.all([step['seconds']>=0 for step in SC['steps']]))
+        volume = np.load(SC['steps'][2]['outputs'][0])
+        assert(volume['data'].shape == (len(volume['xEdges'])-1,len(volume['yEdges'])-1,len(volume['zEdges'])-1))
+        assert(os.path.exists(SC['steps'][3]['outputs'][0]))
+
+        assert(missing['status'] == 'failed' and 'error' in missing['steps'][0])
+        with open(os.path.join(directory,'summary.json')) as f:
+            assert(json.load(f)['jobs'][0]['name'] == 'SC')
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join('data','SC')),reason='Requires the data files in data/SC')
+def test_stepPowder_rerun():
+    files = _tools.fileListGenerator('12105',os.path.join('data','SC'),year=2022)
+    description = {'jobs':[{'name':'powder','load':{'files':files},
+                            'steps':[{'powder':{'format':['xye','PSI']}}]}]}
+    with tempfile.TemporaryDirectory() as directory:
+        outputs = []
+        for _ in range(2): # Files already written by the first run are still reported
+            summary = batch.runJobs(description,output=directory,quiet=True)
+            outputs.append(summary['jobs'][0]['steps'][-1]['outputs'])
+        assert(len(outputs[0]) == 2 and outputs[0] == outputs[1])
+        assert(np.all([os.path.exists(f) for f in outputs[0]]))
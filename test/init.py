@@ -1,6 +1,26 @@
 import DMCpy
+import subprocess
+import sys
 
 
 def test_initialization():
     assert(DMCpy.__version__=='1.0.3')
-    assert(DMCpy.__author__=='Jakob Lass, Sam Moody, Øystein S. Fjellvåg')
\ No newline at end of file
+    assert(DMCpy.__author__=='Jakob Lass, Sam Moody, Øystein S. Fjellvåg')
+
+
+def test_importTime():
+    # Import the reduction modules in a fresh interpreter as done by batch workers
+    code = ';'.join(['import sys, time',
+                     'start = time.perf_counter()',
+                     'import DMCpy',
+                     'from DMCpy import DataSet, DataFile',
+                     'stop = time.perf_counter()',
+                     'loaded = [m for m in ["matplotlib","pandas","scipy","tkinter"] if m in sys.modules]',
+                     'print(stop-start, ",".join(loaded), "calibrationDict" in vars(DMCpy))'])
+    output = subprocess.run([sys.executable,'-c',code],capture_output=True,text=True,check=True).stdout.split()
+    importTime = float(output[0])
+    print('Import of DMCpy.DataSet took {:.3f} s'.format(importTime))
+
+    # Plotting, GUI and fitting modules as well as the calibration tables are only loaded when used
+    assert(len(output) == 2)
+    assert(output[-1] == 'False')